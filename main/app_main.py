@@ -1,15 +1,37 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import uvicorn
 
-from utils import config as cfg
-from utils import logger as log
+from main.utils import config as cfg
+from main.utils import logger as log
+from main.routers import notes, notions, reminders, themes, users, workspace
+from main.utils.DbApi.connection import db_lifespan
+from main.utils.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from main.utils.responses import OrjsonResponse
 
 
 app = FastAPI(
-    title="notion_bot_api"
+    title="notion_bot_api",
+    lifespan=db_lifespan(),
+    default_response_class=OrjsonResponse
 )
+app.add_middleware(MetricsMiddleware)
+app.include_router(users.router)
+app.include_router(workspace.router)
+app.include_router(notions.router)
+app.include_router(notes.router)
+app.include_router(themes.router)
+app.include_router(reminders.router)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Prometheus metrics of HTTP routes, DbApi calls and Mongo pool"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 
 if __name__ == '__main__':
     app_logger_config = log.get_logger_config(cfg.LOGGER_CONFIG_PATH)
-    app_logger = log.init_app_logger()
-    uvicorn.run(app, host="127.0.0.1", port=8000, log_config=app_logger_config)
+    app_logger = log.init_app_logger(app_logger_config)
+    # Logging is already configured with queue handlers, uvicorn must not reconfigure it
+    uvicorn.run(app, host="127.0.0.1", port=8000, log_config=None)
@@ -0,0 +1,259 @@
+"""Benchmark suite for the data layer and model serialization
+
+Covers single obj CRUD, condition queries over 10^2..10^5 notes and
+(de)serialization of notes with 0..500 checkpoints. Reports p50/p95/p99 latency,
+throughput and peak allocated bytes per operation, results are saved as JSON
+together with the commit they were measured on.
+
+Run from repository root:
+    python -m main.benchmarks.db_bench --output bench.json
+    python -m main.benchmarks.db_bench --mongo mongodb://localhost:27017 --compare bench.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from main.models.notion_models import UserModel, NoteModel, CheckPointModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.hydration import hydrate
+from main.utils.responses import dumps
+
+# Benchmark documents use ids far above real ones, so they can be cleaned up from a shared db
+BASE_ID = 1_000_000_000
+BENCH_USER_ID = BASE_ID
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+CHECK_POINTS_COUNTS = (0, 10, 100, 500)
+CREATION_TIME = datetime.datetime(2000, 1, 1)
+TRACED_ITERATIONS = 20
+
+
+class BenchResult(BaseModel):
+    """Latency percentiles (microseconds), throughput and peak memory allocated by one operation of a case"""
+    name: str
+    iterations: int
+    p50_us: float
+    p95_us: float
+    p99_us: float
+    ops_per_sec: float
+    peak_alloc_bytes: float
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def measure(name: str, operation: Callable[[int], Awaitable[object]], iterations: int) -> BenchResult:
+    """Call operation(i) for i in range(traced + iterations), every i exactly once.
+    The first calls are a traced warmup for allocations, the rest are timed.
+    Tracing is kept out of the timed pass as it slows allocations down several times"""
+    traced = min(TRACED_ITERATIONS, iterations)
+    tracemalloc.start()
+    peak_allocated = 0
+    for i in range(traced):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await operation(i)
+        peak_allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    latencies = list()
+    started = time.perf_counter()
+    for i in range(traced, traced + iterations):
+        op_started = time.perf_counter_ns()
+        await operation(i)
+        latencies.append((time.perf_counter_ns() - op_started) / 1000)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return BenchResult(
+        name=name,
+        iterations=iterations,
+        p50_us=percentile(latencies, 50),
+        p95_us=percentile(latencies, 95),
+        p99_us=percentile(latencies, 99),
+        ops_per_sec=iterations / elapsed,
+        peak_alloc_bytes=peak_allocated / traced
+    )
+
+
+def make_note(note_id: int, check_points_count: int = 3, user_id: int = BENCH_USER_ID) -> NoteModel:
+    return NoteModel(
+        _id=note_id,
+        user_id=user_id,
+        name=f"Benchmark note {note_id}",
+        creation_time=CREATION_TIME,
+        notion_id=note_id % 100,
+        description="Benchmark note description",
+        attachments=[],
+        check_points=[
+            CheckPointModel(
+                text=f"Check point {i}",
+                is_finish=bool(i % 2),
+                attachments=[],
+                creation_time=CREATION_TIME,
+                notion_id=None
+            )
+            for i in range(check_points_count)
+        ]
+    )
+
+
+async def bench_crud(db: DbApi, iterations: int) -> list[BenchResult]:
+    total = TRACED_ITERATIONS + iterations
+    users = [UserModel(_id=BASE_ID + i, tg_id=f"bench_{i}", name="Bench") for i in range(total)]
+    notes = [make_note(BASE_ID + i) for i in range(total)]
+    return [
+        await measure("crud.write_new_user", lambda i: db.write_new_user(users[i]), iterations),
+        await measure("crud.get_user", lambda i: db.get_user(users[i].id), iterations),
+        await measure("crud.delete_user", lambda i: db.delete_user(users[i].id), iterations),
+        await measure("crud.write_new_note", lambda i: db.write_new_note(notes[i]), iterations),
+        await measure("crud.get_note", lambda i: db.get_note(notes[i].id), iterations),
+        await measure("crud.delete_note", lambda i: db.delete_note(notes[i].id), iterations),
+    ]
+
+
+async def bench_queries(db: DbApi, size: int, iterations: int) -> list[BenchResult]:
+    """Condition queries over size notes of one user, big sizes get fewer iterations to keep run time sane"""
+    iterations = max(3, min(iterations, 100 * iterations // size))
+    note_ids = [BASE_ID + i for i in range(size)]
+    await db.write_many_notes([make_note(note_id) for note_id in note_ids])
+
+    async def iterate_all(_):
+        async for _batch in db.iter_notes_by_condition({"user_id": BENCH_USER_ID}, batch_size=1000):
+            pass
+
+    try:
+        return [
+            await measure(
+                f"query.get_all_notes_by_condition.indexed[{size}]",
+                lambda _: db.get_all_notes_by_condition({"user_id": BENCH_USER_ID}), iterations
+            ),
+            await measure(
+                f"query.get_all_notes_by_condition.unindexed[{size}]",
+                lambda _: db.get_all_notes_by_condition({"name": f"Benchmark note {BASE_ID}"}), iterations
+            ),
+            await measure(
+                f"query.get_all_notes_by_condition.projected[{size}]",
+                lambda _: db.get_all_notes_by_condition({"user_id": BENCH_USER_ID}, fields=["name"]), iterations
+            ),
+            await measure(
+                f"query.search_notes[{size}]",
+                lambda i: db.search_notes(BENCH_USER_ID, f"benchmark note {BASE_ID + i % size}"), iterations
+            ),
+            await measure(f"query.iter_notes_by_condition.all[{size}]", iterate_all, max(1, iterations // 10)),
+        ]
+    finally:
+        await db.delete_many_notes(note_ids)
+
+
+async def bench_serialization(iterations: int) -> list[BenchResult]:
+    results = list()
+    for count in CHECK_POINTS_COUNTS:
+        note = make_note(1, count)
+        doc = note.dict(by_alias=True)
+        number = max(10, iterations // (count + 1))
+
+        async def parse(_):
+            NoteModel.parse_obj(doc)
+
+        async def dump(_):
+            note.dict(by_alias=True)
+
+        async def trusted(_):
+            hydrate(NoteModel, doc)
+
+        async def encode_default(_):
+            # FastAPI default response path
+            json.dumps(jsonable_encoder(note)).encode()
+
+        async def encode_orjson(_):
+            dumps(note)
+
+        results.append(await measure(f"serialization.parse_obj[{count}]", parse, number))
+        results.append(await measure(f"serialization.dict_by_alias[{count}]", dump, number))
+        results.append(await measure(f"serialization.hydrate_trusted[{count}]", trusted, number))
+        results.append(await measure(f"serialization.jsonable_encoder_json[{count}]", encode_default, number))
+        results.append(await measure(f"serialization.orjson_dumps[{count}]", encode_orjson, number))
+    return results
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: list[BenchResult], baseline: dict[str, dict] | None = None) -> None:
+    header = f"{'case':<56} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10} {'ops/s':>11} {'peak B':>10}"
+    if baseline is not None:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for result in results:
+        line = (f"{result.name:<56} {result.p50_us:>10.1f} {result.p95_us:>10.1f} {result.p99_us:>10.1f} "
+                f"{result.ops_per_sec:>11.0f} {result.peak_alloc_bytes:>10.0f}")
+        if baseline is not None and result.name in baseline:
+            line += f" {result.p50_us / baseline[result.name]['p50_us'] - 1:>+11.1%}"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.mongo:
+        from main.utils.DbApi.MongoAPI import MongoDbApi
+        db = MongoDbApi(args.mongo, is_test=True)
+        # Indexed query cases must use the app indexes, else they are collection scans like unindexed ones
+        await db.ensure_indexes()
+        backend = "mongo"
+    else:
+        db = MemoryDbApi()
+        backend = "memory"
+
+    results = await bench_crud(db, args.iterations)
+    for size in args.sizes:
+        results += await bench_queries(db, size, args.iterations)
+    results += await bench_serialization(args.iterations)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "backend": backend,
+        "results": [result.dict() for result in results],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Data layer and model serialization benchmarks")
+    parser.add_argument("--mongo", help="Mongo connection string, in-memory backend is used if not set")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Collection sizes for queries")
+    parser.add_argument("--iterations", type=int, default=1000, help="Iterations per case")
+    parser.add_argument("--output", help="Path to save results as JSON")
+    parser.add_argument("--compare", help="Path to JSON results of a previous run to compare p50 with")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="UTF-8") as f:
+            baseline = {result["name"]: result for result in json.load(f)["results"]}
+    print_results([BenchResult.parse_obj(result) for result in report["results"]], baseline)
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Compare strict pydantic validation with trusted hydration of db documents
+
+Run from repository root: python -m main.benchmarks.hydration_bench
+"""
+import datetime
+import timeit
+
+from main.models.notion_models import NoteModel, CheckPointModel
+from main.utils.DbApi.hydration import hydrate
+
+CHECK_POINTS_COUNTS = (0, 10, 100, 500)
+
+
+def make_note_doc(check_points_count: int) -> dict:
+    creation_time = datetime.datetime(2000, 1, 1)
+    note = NoteModel(
+        _id=1,
+        user_id=1,
+        name="Benchmark note",
+        creation_time=creation_time,
+        notion_id=1,
+        description="Benchmark note description",
+        attachments=[],
+        check_points=[
+            CheckPointModel(
+                text=f"Check point {i}",
+                is_finish=bool(i % 2),
+                attachments=[],
+                creation_time=creation_time,
+                notion_id=None
+            )
+            for i in range(check_points_count)
+        ]
+    )
+    return note.dict(by_alias=True)
+
+
+def main():
+    print(f"{'check_points':>12} {'strict, us':>12} {'trusted, us':>12} {'speedup':>8}")
+    for count in CHECK_POINTS_COUNTS:
+        doc = make_note_doc(count)
+        assert hydrate(NoteModel, doc) == hydrate(NoteModel, doc, strict=True)
+        number = max(10, 20_000 // (count + 1))
+        strict = min(timeit.repeat(lambda: hydrate(NoteModel, doc, strict=True), number=number, repeat=5)) / number
+        trusted = min(timeit.repeat(lambda: hydrate(NoteModel, doc), number=number, repeat=5)) / number
+        print(f"{count:>12} {strict * 1e6:>12.1f} {trusted * 1e6:>12.1f} {strict / trusted:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
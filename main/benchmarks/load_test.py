@@ -0,0 +1,425 @@
+"""Load generator for the HTTP API, to find the saturation point of the event loop and the Mongo pool
+
+Drives the app from app_main in-process through ASGI transport (its lifespan is run here, so the db
+is the one MONGO_* settings select) or a running uvicorn by url. The workload mixes the bot operations:
+user lookup, note fetch, check point toggle and due reminders scan, over documents seeded with
+benchmark ids. Every stage runs for a fixed time at one load level and reports throughput,
+latency percentiles, error rate, event loop lag and Mongo pool check outs waiting for a connection.
+
+Closed loop: concurrency workers send a request as soon as the previous one is answered,
+throughput stops growing at saturation. Open loop: requests arrive at a fixed rate (Poisson)
+whatever the latency, latency is counted from the planned arrival, so queueing is not hidden.
+
+Run from repository root (app_main imports modules from main dir as top level ones):
+    PYTHONPATH=main MONGO_BACKEND=memory python -m main.benchmarks.load_test --concurrency 1 4 16 64
+    PYTHONPATH=main python -m main.benchmarks.load_test --mode open --rates 200 400 800 1600
+    PYTHONPATH=main python -m main.benchmarks.load_test --url http://127.0.0.1:8000 --seed --output load.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+from pydantic import BaseModel
+
+from main.benchmarks.db_bench import BASE_ID, make_note, percentile, current_commit
+from main.models.notion_models import UserModel, NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import open_db
+from main.utils.metrics import MONGO_POOL_CONNECTIONS
+from main.utils.settings import MongoSettings
+
+Operation = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+PoolSampler = Callable[[], Awaitable[float | None]]
+
+DEFAULT_MIX = {"user_lookup": 40, "note_fetch": 35, "checkpoint_toggle": 15, "due_scan": 10}
+DEFAULT_CONCURRENCY = (1, 2, 4, 8, 16, 32, 64)
+DEFAULT_RATES = (100, 200, 400, 800, 1600)
+CHECK_POINTS_COUNT = 10
+# Closed loop stage is saturated when throughput grows by less than that share over the previous one
+SATURATION_GAIN = 0.05
+# Open loop stage is saturated when less than that share of requests arrived is served in time they arrived in
+SATURATION_SERVED = 0.95
+LOOP_PROBE_INTERVAL = 0.01
+POOL_PROBE_INTERVAL = 0.5
+_POOL_WAITING_RE = re.compile(r'^mongo_pool_connections\{state="waiting"\} (\S+)$', re.MULTILINE)
+
+
+class Dataset(BaseModel):
+    """Ids of seeded documents requests are made for"""
+    user_ids: list[int]
+    notes: list[tuple[int, int]]  # (user id, note id)
+
+
+class OperationStats(BaseModel):
+    requests: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+
+
+class StageResult(BaseModel):
+    """Measurements of one load level, latencies of successful and failed requests together"""
+    mode: str
+    level: float
+    duration_s: float
+    requests: int
+    errors: int
+    dropped: int
+    error_rate: float
+    offered_rps: float
+    throughput_rps: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    loop_lag_p99_ms: float
+    pool_waiting_max: float | None
+    statuses: dict[str, int]
+    operations: dict[str, OperationStats]
+
+
+# ----- Dataset ----- #
+async def seed(db: DbApi, users: int, notes_per_user: int, notions_per_user: int) -> Dataset:
+    """Write benchmark users with notes and notions, notions are spread around now, so some are due"""
+    now = datetime.datetime.utcnow()
+    user_ids = [BASE_ID + i for i in range(users)]
+    notes = [(user_id, BASE_ID + u * notes_per_user + i)
+             for u, user_id in enumerate(user_ids) for i in range(notes_per_user)]
+    await db.write_many_users([UserModel(_id=user_id, tg_id=f"bench_{user_id}", name="Bench") for user_id in user_ids])
+    await db.write_many_notes([make_note(note_id, CHECK_POINTS_COUNT, user_id) for user_id, note_id in notes])
+    await db.write_many_notions([
+        NotionModel(
+            _id=BASE_ID + u * notions_per_user + i,
+            user_id=user_id,
+            parent_id=0,
+            creation_time=now,
+            next_notion_time=now + datetime.timedelta(minutes=random.randint(-60, 60)),
+            is_repeatable=bool(i % 2),
+            description="Bench notion"
+        )
+        for u, user_id in enumerate(user_ids) for i in range(notions_per_user)
+    ])
+    return Dataset(user_ids=user_ids, notes=notes)
+
+
+async def cleanup(db: DbApi, dataset: Dataset) -> None:
+    await asyncio.gather(*(db.purge_user(user_id) for user_id in dataset.user_ids))
+
+
+def make_operations(dataset: Dataset) -> dict[str, Operation]:
+    def user_lookup(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+        return client.get(f"/users/{rng.choice(dataset.user_ids)}")
+
+    def note_fetch(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+        user_id, note_id = rng.choice(dataset.notes)
+        return client.get(f"/users/{user_id}/notes/{note_id}")
+
+    def checkpoint_toggle(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+        user_id, note_id = rng.choice(dataset.notes)
+        return client.post(
+            f"/users/{user_id}/notes/{note_id}/check_points/{rng.randrange(CHECK_POINTS_COUNT)}/toggle"
+        )
+
+    def due_scan(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+        return client.get("/reminders/due", params={"limit": 100})
+
+    return {
+        "user_lookup": user_lookup,
+        "note_fetch": note_fetch,
+        "checkpoint_toggle": checkpoint_toggle,
+        "due_scan": due_scan,
+    }
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """Parse "user_lookup=40,due_scan=10" into weights"""
+    mix = dict()
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}, expected one of {list(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+# ----- Load ----- #
+class _Recorder:
+    """Outcomes of requests of one stage"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = dict()
+        self.errors: dict[str, int] = dict()
+        self.statuses: dict[str, int] = dict()
+        self.dropped = 0
+        self.loop_lags: list[float] = list()
+        self.pool_waiting: list[float] = list()
+
+    def record(self, operation: str, latency: float, status: str, is_error: bool) -> None:
+        self.latencies.setdefault(operation, list()).append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if is_error:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def result(self, mode: str, level: float, duration: float, arrival_window: float | None = None) -> StageResult:
+        """arrival_window is the time requests arrived in for open loop, offered rate of closed loop is its throughput"""
+        latencies = sorted(latency for values in self.latencies.values() for latency in values) or [0.0]
+        requests = sum(len(values) for values in self.latencies.values())
+        errors = sum(self.errors.values())
+        lags = sorted(self.loop_lags) or [0.0]
+        return StageResult(
+            mode=mode,
+            level=level,
+            duration_s=duration,
+            requests=requests,
+            errors=errors,
+            dropped=self.dropped,
+            error_rate=(errors + self.dropped) / max(requests + self.dropped, 1),
+            offered_rps=(requests + self.dropped) / (arrival_window or duration),
+            throughput_rps=(requests - errors) / duration,
+            p50_ms=percentile(latencies, 50) * 1000,
+            p90_ms=percentile(latencies, 90) * 1000,
+            p99_ms=percentile(latencies, 99) * 1000,
+            max_ms=latencies[-1] * 1000,
+            loop_lag_p99_ms=percentile(lags, 99) * 1000,
+            pool_waiting_max=max(self.pool_waiting) if self.pool_waiting else None,
+            statuses=self.statuses,
+            operations={
+                operation: OperationStats(
+                    requests=len(values),
+                    errors=self.errors.get(operation, 0),
+                    p50_ms=percentile(sorted(values), 50) * 1000,
+                    p99_ms=percentile(sorted(values), 99) * 1000,
+                )
+                for operation, values in sorted(self.latencies.items())
+            }
+        )
+
+
+async def _call(client: httpx.AsyncClient, operation_name: str, operation: Operation, rng: random.Random,
+                recorder: _Recorder, scheduled: float) -> None:
+    try:
+        response = await operation(client, rng)
+        status, is_error = str(response.status_code), response.status_code >= 400
+    except Exception as err:
+        status, is_error = type(err).__name__, True
+    recorder.record(operation_name, time.perf_counter() - scheduled, status, is_error)
+
+
+async def _probe(recorder: _Recorder, pool_sampler: PoolSampler) -> None:
+    """Sample event loop lag (how late a short sleep wakes up) and Mongo pool waiters until cancelled"""
+    next_pool_sample = time.perf_counter()
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_PROBE_INTERVAL)
+        now = time.perf_counter()
+        recorder.loop_lags.append(max(now - started - LOOP_PROBE_INTERVAL, 0.0))
+        if now >= next_pool_sample:
+            next_pool_sample = now + POOL_PROBE_INTERVAL
+            waiting = await pool_sampler()
+            if waiting is not None:
+                recorder.pool_waiting.append(waiting)
+
+
+def _picker(operations: dict[str, Operation], mix: dict[str, float]) -> Callable[[random.Random], str]:
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    return lambda rng: rng.choices(names, weights)[0]
+
+
+async def run_closed_stage(client: httpx.AsyncClient, operations: dict[str, Operation], mix: dict[str, float],
+                           concurrency: int, duration: float, pool_sampler: PoolSampler) -> StageResult:
+    """concurrency workers, each sends the next request when the previous one is answered"""
+    recorder = _Recorder()
+    pick = _picker(operations, mix)
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_seed: int) -> None:
+        rng = random.Random(worker_seed)
+        while time.perf_counter() < deadline:
+            name = pick(rng)
+            await _call(client, name, operations[name], rng, recorder, time.perf_counter())
+
+    probe = asyncio.create_task(_probe(recorder, pool_sampler))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    finally:
+        probe.cancel()
+    return recorder.result("closed", concurrency, time.perf_counter() - started)
+
+
+async def run_open_stage(client: httpx.AsyncClient, operations: dict[str, Operation], mix: dict[str, float],
+                         rate: float, duration: float, pool_sampler: PoolSampler,
+                         max_in_flight: int = 10_000) -> StageResult:
+    """Requests arrive at rate per second with exponential gaps, not waiting for answers.
+    Arrivals over max_in_flight requests are dropped and count as errors"""
+    recorder = _Recorder()
+    pick = _picker(operations, mix)
+    rng = random.Random(0)
+    in_flight: set[asyncio.Task] = set()
+
+    probe = asyncio.create_task(_probe(recorder, pool_sampler))
+    started = time.perf_counter()
+    arrival = started
+    try:
+        while True:
+            arrival += rng.expovariate(rate)
+            if arrival - started >= duration:
+                break
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                recorder.dropped += 1
+                continue
+            name = pick(rng)
+            task = asyncio.create_task(_call(client, name, operations[name], rng, recorder, arrival))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.gather(*in_flight)
+    finally:
+        probe.cancel()
+    return recorder.result("open", rate, time.perf_counter() - started, duration)
+
+
+def find_saturation(results: list[StageResult]) -> StageResult | None:
+    """The first stage where more load doesn't give more throughput. Open loop throughput is counted
+    until the last answer, so it falls behind offered rate once requests queue up"""
+    for previous, result in zip(results, results[1:]):
+        if result.mode == "closed" and result.throughput_rps < previous.throughput_rps * (1 + SATURATION_GAIN):
+            return result
+    for result in results:
+        if result.mode == "open" and (result.throughput_rps < result.offered_rps * SATURATION_SERVED or result.dropped):
+            return result
+    return None
+
+
+# ----- Targets ----- #
+@asynccontextmanager
+async def in_process_target(args: argparse.Namespace) -> AsyncIterator[tuple[httpx.AsyncClient, DbApi, PoolSampler]]:
+    """Client calling the app directly, the app lifespan opens its db as on startup"""
+    from main.app_main import app
+
+    async def sample_pool() -> float:
+        return MONGO_POOL_CONNECTIONS.labels("waiting").value
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=args.timeout) as client:
+            yield client, app.state.db, sample_pool
+
+
+@asynccontextmanager
+async def url_target(args: argparse.Namespace) -> AsyncIterator[tuple[httpx.AsyncClient, DbApi | None, PoolSampler]]:
+    """Client calling running server, pool waiters are scraped from its /metrics.
+    Documents are seeded to the db MONGO_* settings point to, which must be the server one"""
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+
+        async def sample_pool() -> float | None:
+            try:
+                match = _POOL_WAITING_RE.search((await client.get("/metrics")).text)
+            except httpx.HTTPError:
+                return None
+            return float(match.group(1)) if match else None
+
+        if args.seed:
+            async with open_db(MongoSettings(warmup_connections=1)) as db:
+                yield client, db, sample_pool
+        else:
+            yield client, None, sample_pool
+
+
+# ----- Report ----- #
+def print_results(results: list[StageResult]) -> None:
+    print(f"{'mode':<6} {'level':>7} {'requests':>9} {'offered':>9} {'rps':>9} {'err %':>6} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'lag p99':>8} {'pool wait':>9}")
+    for result in results:
+        pool_waiting = "-" if result.pool_waiting_max is None else f"{result.pool_waiting_max:.0f}"
+        print(f"{result.mode:<6} {result.level:>7.0f} {result.requests:>9} {result.offered_rps:>9.0f} {result.throughput_rps:>9.0f} "
+              f"{result.error_rate:>6.1%} {result.p50_ms:>8.2f} {result.p90_ms:>8.2f} {result.p99_ms:>8.2f} "
+              f"{result.max_ms:>8.2f} {result.loop_lag_p99_ms:>8.2f} {pool_waiting:>9}")
+    saturation = find_saturation(results)
+    if saturation is not None:
+        print(f"Saturated at {saturation.mode} loop level {saturation.level:.0f}: "
+              f"{saturation.throughput_rps:.0f} rps, p99 {saturation.p99_ms:.2f} ms")
+    else:
+        print("Not saturated, raise the load")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    target = url_target(args) if args.url else in_process_target(args)
+    results = list()
+    async with target as (client, db, pool_sampler):
+        if db is not None and (args.seed or not args.url):
+            dataset = await seed(db, args.users, args.notes_per_user, args.notions_per_user)
+        else:
+            dataset = Dataset(
+                user_ids=[BASE_ID + i for i in range(args.users)],
+                notes=[(BASE_ID + u, BASE_ID + u * args.notes_per_user + i)
+                       for u in range(args.users) for i in range(args.notes_per_user)]
+            )
+        operations = make_operations(dataset)
+        try:
+            if args.mode == "closed":
+                for concurrency in args.concurrency:
+                    results.append(await run_closed_stage(
+                        client, operations, args.mix, concurrency, args.duration, pool_sampler
+                    ))
+            else:
+                for rate in args.rates:
+                    results.append(await run_open_stage(
+                        client, operations, args.mix, rate, args.duration, pool_sampler, args.max_in_flight
+                    ))
+        finally:
+            if db is not None and (args.seed or not args.url):
+                await cleanup(db, dataset)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "target": args.url or "in-process",
+        "mix": args.mix,
+        "results": [result.dict() for result in results],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API load generator")
+    parser.add_argument("--url", help="Base url of running server, the app is driven in-process if not set")
+    parser.add_argument("--seed", action="store_true",
+                        help="With --url: seed and clean up documents in the db of MONGO_* settings")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY,
+                        help="Closed loop workers per stage")
+    parser.add_argument("--rates", type=float, nargs="+", default=DEFAULT_RATES,
+                        help="Open loop requests per second per stage")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per stage")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Operation weights, e.g. user_lookup=40,note_fetch=35,checkpoint_toggle=15,due_scan=10")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--notes-per-user", type=int, default=20)
+    parser.add_argument("--notions-per-user", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    parser.add_argument("--max-connections", type=int, default=1000, help="HTTP connections to the server")
+    parser.add_argument("--max-in-flight", type=int, default=10_000, help="Open loop requests in progress cap")
+    parser.add_argument("--output", help="Path to save results as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_results([StageResult.parse_obj(result) for result in report["results"]])
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
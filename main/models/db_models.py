@@ -0,0 +1,112 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from main.models.notion_models import NotionModel, ThemeModel
+
+
+class BulkWriteResult(BaseModel):
+    """Result of bulk write, ids rejected as duplicates are reported without stopping the batch"""
+    inserted_ids: list[int] = []
+    duplicate_ids: list[int] = []
+
+
+class BulkDeleteResult(BaseModel):
+    """Result of bulk delete"""
+    requested_count: int = 0
+    deleted_count: int = 0
+
+
+class PurgeResult(BaseModel):
+    """Deleted documents count per collection of user purge"""
+    user_id: int
+    deleted_counts: dict[str, int] = {}
+    used_transaction: bool = False
+
+
+class UserMoveResult(BaseModel):
+    """Copied documents count per collection of user move between shards"""
+    user_id: int
+    source: str
+    target: str
+    copied_counts: dict[str, int] = {}
+
+
+class ImportResult(BaseModel):
+    """Written documents count and ids skipped as duplicates per collection of workspace import"""
+    inserted_counts: dict[str, int] = {}
+    duplicate_ids: dict[str, list[int]] = {}
+
+
+class SearchHit(BaseModel):
+    """Found object id with its relevance score and text fragment around the first matched term"""
+    id: int
+    score: float
+    snippet: str
+
+
+class SearchPage(BaseModel):
+    """Page of search hits, best first. next_offset is None on the last page"""
+    hits: list[SearchHit] = []
+    next_offset: int | None = None
+
+
+class NextNotion(BaseModel):
+    """The earliest scheduled notion of user"""
+    time: datetime
+    id: int
+
+
+class UserSummary(BaseModel):
+    """Counters of user documents and the next notion, maintained on every write"""
+    user_id: int = Field(alias="_id")
+    themes: int = 0
+    notes: int = 0
+    notions: int = 0
+    open_check_points: int = 0
+    finished_check_points: int = 0
+    next_notion: NextNotion | None = None
+
+
+class NotionPage(BaseModel):
+    """Page of notions ordered by next_notion_time. next_cursor is None on the last page"""
+    notions: list[NotionModel] = []
+    next_cursor: str | None = None
+
+
+class Occurrence(BaseModel):
+    """Notion firing at time, repeatable notions have an occurrence per repeat"""
+    time: datetime
+    notion: NotionModel
+
+
+class OccurrencePage(BaseModel):
+    """Page of occurrences ordered by time. next_cursor is None on the last page"""
+    occurrences: list[Occurrence] = []
+    next_cursor: str | None = None
+
+
+class IndexUsage(BaseModel):
+    """Usage of single index since server start or index creation"""
+    collection: str
+    name: str
+    accesses: int
+    since: datetime
+
+
+class CacheStats(BaseModel):
+    """Counters of one entity cache"""
+    entity: str
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class ThemeTreeNode(BaseModel):
+    """Theme with its sub themes"""
+    theme: ThemeModel
+    children: list["ThemeTreeNode"] = []
+
+
+ThemeTreeNode.update_forward_refs()
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from main.models.notion_models import NoteModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.DbApi.hydration import projection
+from main.utils.exceptons import DBNotFound, DBConflict
+from main.utils.responses import OrjsonResponse, StreamingJsonArrayResponse
+
+router = APIRouter(prefix="/users/{user_id}/notes", tags=["notes"])
+
+
+@router.get("", response_model=list[NoteModel], response_class=StreamingJsonArrayResponse)
+async def get_user_notes(
+        user_id: int,
+        fields: list[str] | None = Query(None),
+        batch_size: int = Query(500, gt=0, le=5000),
+        db: DbApi = Depends(get_db)
+) -> StreamingJsonArrayResponse:
+    """Stream all notes of user as JSON array, only given fields if set"""
+    try:
+        projection(NoteModel, fields)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
+    return StreamingJsonArrayResponse(
+        db.iter_notes_by_condition({"user_id": user_id}, batch_size=batch_size, fields=fields)
+    )
+
+
+async def _get_user_note(db: DbApi, user_id: int, note_id: int) -> NoteModel:
+    """Note of user, 404 if it doesn't exist or belongs to another user"""
+    try:
+        note = await db.get_note(note_id)
+    except DBNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    if note.user_id != user_id:
+        raise HTTPException(status_code=404, detail=f"Not found note with id: {note_id}")
+    return note
+
+
+@router.get("/{note_id}", response_model=NoteModel)
+async def get_user_note(user_id: int, note_id: int, db: DbApi = Depends(get_db)) -> OrjsonResponse:
+    return OrjsonResponse(await _get_user_note(db, user_id, note_id))
+
+
+@router.post("/{note_id}/check_points/{index}/toggle")
+async def toggle_note_check_point(user_id: int, note_id: int, index: int,
+                                  db: DbApi = Depends(get_db)) -> dict[str, bool]:
+    """Flip is_finish of check point at index, note must belong to user. Return new is_finish.
+    Missing check point is 409, same as the note given to another user meanwhile"""
+    await _get_user_note(db, user_id, note_id)
+    try:
+        return {"is_finish": await db.toggle_check_point(note_id, index=index, expected={"user_id": user_id})}
+    except DBNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    except DBConflict as err:
+        raise HTTPException(status_code=409, detail=str(err))
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
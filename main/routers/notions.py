@@ -0,0 +1,49 @@
+import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from main.models.db_models import OccurrencePage
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.DbApi.hydration import projection
+from main.utils.responses import OrjsonResponse, StreamingJsonArrayResponse
+from main.utils.upcoming import DEFAULT_WINDOW, get_upcoming
+
+router = APIRouter(prefix="/users/{user_id}/notions", tags=["notions"])
+
+
+@router.get("", response_model=list[NotionModel], response_class=StreamingJsonArrayResponse)
+async def get_user_notions(
+        user_id: int,
+        fields: list[str] | None = Query(None),
+        batch_size: int = Query(500, gt=0, le=5000),
+        db: DbApi = Depends(get_db)
+) -> StreamingJsonArrayResponse:
+    """Stream all notions of user as JSON array, only given fields if set"""
+    try:
+        projection(NotionModel, fields)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
+    return StreamingJsonArrayResponse(
+        db.iter_notions_by_condition({"user_id": user_id}, batch_size=batch_size, fields=fields)
+    )
+
+
+@router.get("/upcoming", response_model=OccurrencePage)
+async def get_upcoming_notions(
+        user_id: int,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        limit: int = Query(100, gt=0, le=1000),
+        cursor: str | None = None,
+        db: DbApi = Depends(get_db)
+) -> OrjsonResponse:
+    """Occurrences of user notions from start (default: now) until end (default: a week after start),
+    repeatable notions occur once per repeat. Pass next_cursor as cursor to get the next page"""
+    start = start or datetime.datetime.utcnow()
+    end = end or start + DEFAULT_WINDOW
+    try:
+        return OrjsonResponse(await get_upcoming(db, user_id, start, end, limit, cursor))
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
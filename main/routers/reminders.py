@@ -0,0 +1,20 @@
+import datetime
+
+from fastapi import APIRouter, Depends, Query
+
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.responses import OrjsonResponse
+
+router = APIRouter(prefix="/reminders", tags=["reminders"])
+
+
+@router.get("/due", response_model=list[NotionModel])
+async def get_due_reminders(
+        until: datetime.datetime | None = None,
+        limit: int = Query(100, gt=0, le=1000),
+        db: DbApi = Depends(get_db)
+) -> OrjsonResponse:
+    """Notions of all users due before until (default: now), earliest first"""
+    return OrjsonResponse(await db.get_notions_due_before(until or datetime.datetime.utcnow(), limit))
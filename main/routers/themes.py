@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from main.models.notion_models import ThemeModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.DbApi.hydration import projection
+from main.utils.responses import StreamingJsonArrayResponse
+
+router = APIRouter(prefix="/users/{user_id}/themes", tags=["themes"])
+
+
+@router.get("", response_model=list[ThemeModel], response_class=StreamingJsonArrayResponse)
+async def get_user_themes(
+        user_id: int,
+        fields: list[str] | None = Query(None),
+        batch_size: int = Query(500, gt=0, le=5000),
+        db: DbApi = Depends(get_db)
+) -> StreamingJsonArrayResponse:
+    """Stream all themes of user as JSON array, only given fields if set"""
+    try:
+        projection(ThemeModel, fields)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
+    return StreamingJsonArrayResponse(
+        db.iter_themes_by_condition({"user_id": user_id}, batch_size=batch_size, fields=fields)
+    )
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from main.models.db_models import UserSummary
+from main.models.notion_models import UserModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.exceptons import DBNotFound
+from main.utils.responses import OrjsonResponse
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+
+@router.get("/{user_id}", response_model=UserModel)
+async def get_user(user_id: int, db: DbApi = Depends(get_db)) -> OrjsonResponse:
+    try:
+        return OrjsonResponse(await db.get_user(user_id))
+    except DBNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+
+
+@router.get("/{user_id}/summary", response_model=UserSummary)
+async def get_user_summary(user_id: int, db: DbApi = Depends(get_db)) -> OrjsonResponse:
+    """Counters of user documents and the next notion, for the bot home screen"""
+    try:
+        return OrjsonResponse(await db.get_user_summary(user_id))
+    except DBNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
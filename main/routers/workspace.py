@@ -0,0 +1,46 @@
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from main.models.db_models import ImportResult
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.connection import get_db
+from main.utils.DbApi.workspace import export_workspace, gzip_chunks, import_workspace
+from main.utils.exceptons import DBNotFound
+
+router = APIRouter(prefix="/users/{user_id}/workspace", tags=["workspace"])
+
+
+async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_user_workspace(user_id: int, gzip: bool = False, db: DbApi = Depends(get_db)) -> StreamingResponse:
+    """Stream user workspace as NDJSON, optionally gzip compressed"""
+    chunks = export_workspace(db, user_id)
+    # Get the user line before the response starts, missing user must be 404, not a broken stream
+    try:
+        first = await chunks.__anext__()
+    except DBNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    chunks = _prepend(first, chunks)
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(chunks), media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="user_{user_id}.ndjson.gz"'}
+        )
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+
+@router.post("/import")
+async def import_user_workspace(user_id: int, request: Request, db: DbApi = Depends(get_db)) -> ImportResult:
+    """Import NDJSON workspace (plain or gzip) of the user from request body stream,
+    body is read as fast as it is written to db"""
+    try:
+        return await import_workspace(db, request.stream(), user_id)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
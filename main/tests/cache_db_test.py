@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from main.models.notion_models import UserModel
+from main.tests import db_test
+from main.utils.DbApi.CachedAPI import CachedDbApi, CacheLimits
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.exceptons import DBNotFound
+
+
+class CountingUsersDb(DbApi):
+    """Keep users in dict, count get_user queries"""
+
+    def __init__(self, users: list[UserModel]):
+        self.users = {user.id: user for user in users}
+        self.get_calls = 0
+
+    async def get_user(self, user_id: int) -> UserModel:
+        self.get_calls += 1
+        await asyncio.sleep(0)
+        if user_id not in self.users:
+            raise DBNotFound(f"No user found with id: {user_id}")
+        return self.users[user_id]
+
+    async def delete_user(self, user_id: int) -> int:
+        self.users.pop(user_id)
+        return user_id
+
+
+class TestCachedDB:
+    test_user = UserModel(_id=1, tg_id="test_1", name="Test Name")
+
+    def make_db(self, now: list[float] | None = None) -> tuple[CachedDbApi, CountingUsersDb]:
+        inner = CountingUsersDb([self.test_user])
+        now = now or [0.0]
+        limits = {"users": CacheLimits(max_size=2, ttl=10)}
+        return CachedDbApi(inner, limits, clock=lambda: now[0]), inner
+
+    async def test_get_user_hit(self):
+        """Positive test | second get is served from cache"""
+        db, inner = self.make_db()
+        assert await db.get_user(self.test_user.id) == self.test_user
+        assert await db.get_user(self.test_user.id) == self.test_user
+        assert inner.get_calls == 1
+        users_stats = db.get_stats()[0]
+        assert (users_stats.hits, users_stats.misses) == (1, 1)
+
+    async def test_get_user_concurrent_misses(self):
+        """Positive test | concurrent misses for one id share single query"""
+        db, inner = self.make_db()
+        users = await asyncio.gather(*(db.get_user(self.test_user.id) for _ in range(10)))
+        assert users == [self.test_user] * 10
+        assert inner.get_calls == 1
+
+    async def test_get_user_ttl_expired(self):
+        """Positive test | expired entry is loaded again"""
+        now = [0.0]
+        db, inner = self.make_db(now)
+        await db.get_user(self.test_user.id)
+        now[0] = 11
+        await db.get_user(self.test_user.id)
+        assert inner.get_calls == 2
+
+    async def test_delete_user_invalidates(self):
+        """Negative test | deleted user is not served from cache"""
+        db, inner = self.make_db()
+        await db.get_user(self.test_user.id)
+        await db.delete_user(self.test_user.id)
+        with pytest.raises(DBNotFound):
+            await db.get_user(self.test_user.id)
+
+    async def test_get_user_not_found_not_cached(self):
+        """Negative test | not found error is not cached"""
+        db, inner = self.make_db()
+        for _ in range(2):
+            with pytest.raises(DBNotFound):
+                await db.get_user(11111111)
+        assert inner.get_calls == 2
+
+    async def test_toggle_check_point_invalidates(self):
+        """Positive test | note is loaded again after partial update"""
+        note = db_test.TestDB.test_note_cons
+        db = CachedDbApi(MemoryDbApi(notes=[note]))
+        await db.get_note(note.id)
+        await db.toggle_check_point(note.id, index=0)
+        assert (await db.get_note(note.id)).check_points[0].is_finish is True
+
+    async def test_purge_user_invalidates(self):
+        """Negative test | note of purged user is not served from cache"""
+        note = db_test.TestDB.test_note_cons
+        db = CachedDbApi(MemoryDbApi(notes=[note]))
+        await db.get_note(note.id)
+        await db.purge_user(note.user_id)
+        with pytest.raises(DBNotFound):
+            await db.get_note(note.id)
@@ -1,6 +1,9 @@
 import asyncio
 import pytest
 
+from main.utils.DbApi.connection import open_db
+from main.utils.settings import MongoSettings
+
 
 @pytest.fixture(scope="session")
 def event_loop():
@@ -8,3 +11,12 @@ def event_loop():
     loop = asyncio.get_event_loop_policy().new_event_loop()
     yield loop
     loop.close()
+
+
+@pytest.fixture(scope="session")
+async def mongo_db():
+    """One client to test Mongo db for the whole session, created on first use"""
+    from main.utils.config import MONGO_TEST_DB_CONNECTION_PATH
+    settings = MongoSettings(connection_string=MONGO_TEST_DB_CONNECTION_PATH, is_test=True, warmup_connections=1)
+    async with open_db(settings) as db:
+        yield db
@@ -0,0 +1,52 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from main.utils.DbApi.InstrumentedAPI import InstrumentedDbApi
+from main.utils.DbApi.connection import db_lifespan
+from main.utils.settings import MongoSettings
+
+
+class TestConnection:
+
+    def test_client_options(self):
+        """Positive test | settings are mapped to driver options, unset ones are skipped"""
+        settings = MongoSettings(max_pool_size=20, min_pool_size=5, read_preference="secondaryPreferred")
+        assert settings.client_options() == {
+            "maxPoolSize": 20,
+            "minPoolSize": 5,
+            "connectTimeoutMS": 5000,
+            "serverSelectionTimeoutMS": 5000,
+            "readPreference": "secondaryPreferred",
+        }
+
+    def test_settings_from_env(self, monkeypatch):
+        """Positive test | settings are read from MONGO_* environment variables"""
+        monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "42")
+        monkeypatch.setenv("MONGO_BACKEND", "memory")
+        settings = MongoSettings()
+        assert (settings.max_pool_size, settings.backend) == (42, "memory")
+
+    def test_min_pool_size_above_max(self):
+        """Negative test | min pool size can't be above max pool size"""
+        with pytest.raises(ValidationError):
+            MongoSettings(max_pool_size=5, min_pool_size=10)
+
+    def test_lifespan(self):
+        """Positive test | db is created on startup and kept in app state"""
+        app = FastAPI(lifespan=db_lifespan(MongoSettings(backend="memory")))
+        with TestClient(app):
+            assert isinstance(app.state.db, InstrumentedDbApi)
+
+    def test_sharded_lifespan(self):
+        """Positive test | db of every shard is opened and routed by one sharded db"""
+        settings = MongoSettings(backend="memory", shards={"a": "memory://a", "b": "memory://b"})
+        app = FastAPI(lifespan=db_lifespan(settings))
+        with TestClient(app):
+            assert app.state.db._db.shard_names == ("a", "b")
+
+    def test_placement_on_unknown_shard(self):
+        """Negative test | users can be placed only on configured shards"""
+        with pytest.raises(ValidationError):
+            MongoSettings(shards={"a": "mongodb://a:27017"}, shard_placements={1: "b"})
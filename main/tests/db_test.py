@@ -4,14 +4,19 @@ import pytest
 
 from pymongo.errors import DuplicateKeyError
 
+from main.models.db_models import ThemeTreeNode
 from main.models.notion_models import ThemeModel, NotionModel, NoteModel, CheckPointModel
-from main.utils.config import MONGO_TEST_DB_CONNECTION_PATH
-from main.utils.DbApi.MongoAPI import MongoDbApi, UserModel
-from main.utils.exceptons import DBNotFound
+from main.utils.DbApi.MongoAPI import DbApi, UserModel
+from main.utils.exceptons import DBNotFound, DBConflict
 
 
 class TestDB:
-    db = MongoDbApi(connection_string=MONGO_TEST_DB_CONNECTION_PATH, is_test=True)
+    db: DbApi
+
+    @pytest.fixture(autouse=True)
+    def connect(self, mongo_db: DbApi):
+        self.db = mongo_db
+
     test_user_const = UserModel(
         _id=1,
         tg_id="test_1",
@@ -88,6 +93,19 @@ class TestDB:
     )
     non_exist_id = 11111111
 
+    # ----- Ids ----- #
+    async def test_reserve_id_block(self):
+        """Positive test | blocks don't overlap and start above existing ids"""
+        first = await self.db.reserve_id_block("notes", 10)
+        second = await self.db.reserve_id_block("notes", 10)
+        assert first > self.test_note_cons.id
+        assert second >= first + 10
+
+    async def test_reserve_id_block_unknown_entity(self):
+        """Negative test | entity without collection"""
+        with pytest.raises(ValueError):
+            await self.db.reserve_id_block("attachments", 10)
+
     # ----- Users ----- #
     async def test_get_user(self):
         """Positive test | get user from db"""
@@ -99,6 +117,16 @@ class TestDB:
         with pytest.raises(DBNotFound):
             await self.db.get_user(self.non_exist_id)
 
+    async def test_get_users_by_ids(self):
+        """Positive test | get users by ids, non-existent id is skipped"""
+        users = await self.db.get_users_by_ids([self.test_user_const.id, self.non_exist_id])
+        assert users == [self.test_user_const]
+
+    async def test_iter_users_by_condition(self):
+        """Positive test | iterate users with condition {"_id": 1}"""
+        batches = [batch async for batch in self.db.iter_users_by_condition({"_id": self.test_user_const.id})]
+        assert batches == [[self.test_user_const]]
+
     async def test_write_new_user(self):
         """Positive test | write new user to db"""
         user_id = await self.db.write_new_user(self.test_user_flex)
@@ -119,6 +147,78 @@ class TestDB:
         with pytest.raises(DBNotFound):
             await self.db.delete_user(self.non_exist_id)
 
+    async def test_purge_user(self):
+        """Positive test | delete user with all owned objects and report progress"""
+        user = UserModel(_id=3, tg_id="test_3", name="Purged Name")
+        await self.db.write_new_user(user)
+        await self.db.write_new_theme(self.test_theme_flex.copy(update={"id": 100, "user_id": user.id}))
+        await self.db.write_new_note(self.test_note_flex.copy(update={"id": 100, "user_id": user.id}))
+        await self.db.write_many_notions([
+            self.test_notion_flex.copy(update={"id": notion_id, "user_id": user.id}) for notion_id in (100, 101)
+        ])
+        progress = dict()
+
+        result = await self.db.purge_user(user.id, on_progress=progress.__setitem__)
+        assert result.deleted_counts == {"themes": 1, "notes": 1, "notions": 2, "users": 1}
+        assert progress == result.deleted_counts
+        with pytest.raises(DBNotFound):
+            await self.db.get_note(100)
+
+    async def test_purge_user_not_exist(self):
+        """Positive test | purge of non-exist user deletes nothing"""
+        result = await self.db.purge_user(self.non_exist_id)
+        assert result.deleted_counts == {"themes": 0, "notes": 0, "notions": 0, "users": 0}
+
+    # ----- Summaries ----- #
+    async def test_user_summary(self):
+        """Positive test | summary follows writes, check point changes, reschedules and deletes"""
+        user = UserModel(_id=4, tg_id="test_4", name="Summary Name")
+        next_time = datetime.datetime(2030, 1, 1)
+        await self.db.write_new_user(user)
+        await self.db.write_new_theme(self.test_theme_flex.copy(update={"id": 200, "user_id": user.id}))
+        await self.db.write_new_note(self.test_note_cons.copy(update={"id": 200, "user_id": user.id}))
+        await self.db.write_many_notions([
+            self.test_notion_cons.copy(update={
+                "id": notion_id, "user_id": user.id, "next_notion_time": next_time + datetime.timedelta(days=day)
+            })
+            for day, notion_id in enumerate((200, 201, 202))
+        ])
+        await self.db.append_check_point(200, self.test_note_cons.check_points[0].copy(update={
+            "creation_time": datetime.datetime(2000, 1, 1)
+        }))
+        await self.db.toggle_check_point(200, index=0)
+        await self.db.reschedule_notion(200, next_time + datetime.timedelta(days=10))
+        await self.db.delete_notion(201)
+
+        summary = await self.db.get_user_summary(user.id)
+        assert (summary.themes, summary.notes, summary.notions) == (1, 1, 2)
+        assert (summary.open_check_points, summary.finished_check_points) == (1, 1)
+        assert summary.next_notion.id == 202
+        assert await self.db.rebuild_user_summaries([user.id]) == 1
+        assert await self.db.get_user_summary(user.id) == summary
+
+        await self.db.purge_user(user.id)
+        with pytest.raises(DBNotFound):
+            await self.db.get_user_summary(user.id)
+
+    async def test_get_user_summary_not_found(self):
+        """Negative test | try to get summary of non-existent user"""
+        with pytest.raises(DBNotFound):
+            await self.db.get_user_summary(self.non_exist_id)
+
+    async def test_user_summary_of_documents_without_user(self):
+        """Negative test | documents of non-existent user don't create its summary, it counts them once written"""
+        user = UserModel(_id=5, tg_id="test_5", name="Summary Name")
+        await self.db.write_new_note(self.test_note_flex.copy(update={"id": 210, "user_id": user.id}))
+        with pytest.raises(DBNotFound):
+            await self.db.get_user_summary(user.id)
+
+        await self.db.write_new_user(user)
+        assert (await self.db.get_user_summary(user.id)).notes == 1
+        await self.db.delete_note(210)
+        assert (await self.db.get_user_summary(user.id)).notes == 0
+        await self.db.purge_user(user.id)
+
     # ----- Themes ----- #
     async def test_get_theme(self):
         """Positive test | get theme from db"""
@@ -150,6 +250,40 @@ class TestDB:
         with pytest.raises(DBNotFound):
             await self.db.get_all_themes_by_condition({"name": "no support name"})
 
+    async def test_get_theme_tree(self):
+        """Positive test | get theme tree from root theme"""
+        tree = await self.db.get_theme_tree(root_theme_id=self.test_theme_cons.id)
+        assert tree == [ThemeTreeNode(theme=self.test_theme_cons, children=[])]
+
+    async def test_get_theme_tree_not_found(self):
+        """Negative test | try to get tree of non-existent root theme"""
+        with pytest.raises(DBNotFound):
+            await self.db.get_theme_tree(root_theme_id=self.non_exist_id)
+
+    async def test_iter_themes_by_condition(self):
+        """Positive test | iterate themes by one per batch with condition {"name": "Test Theme Name"}"""
+        batches = [batch async for batch in self.db.iter_themes_by_condition({"name": "Test Theme Name"}, batch_size=1)]
+        assert batches == [[self.test_theme_cons], [self.test_theme_flex]]
+
+    async def test_iter_themes_by_condition_resume(self):
+        """Positive test | resume themes iteration from continuation token"""
+        batches = [
+            batch async for batch in self.db.iter_themes_by_condition(
+                {"name": "Test Theme Name"}, start_after=self.test_theme_cons.id
+            )
+        ]
+        assert batches == [[self.test_theme_flex]]
+
+    async def test_iter_themes_by_condition_non_exist(self):
+        """Negative test | iterate themes, No one themes found setting conditions"""
+        batches = [batch async for batch in self.db.iter_themes_by_condition({"name": "no support name"})]
+        assert batches == []
+
+    async def test_search_themes(self):
+        """Positive test | find theme by name"""
+        page = await self.db.search_themes(self.test_user_const.id, "theme")
+        assert self.test_theme_cons.id in [hit.id for hit in page.hits]
+
     async def test_delete_theme(self):
         """Positive test | delete theme from db"""
         theme_id = await self.db.delete_theme(self.test_theme_flex.id)
@@ -160,6 +294,18 @@ class TestDB:
         with pytest.raises(DBNotFound):
             await self.db.delete_theme(self.non_exist_id)
 
+    async def test_write_many_themes(self):
+        """Positive test | write themes in bulk, already exist theme is reported as duplicate"""
+        result = await self.db.write_many_themes([self.test_theme_cons, self.test_theme_flex], chunk_size=1)
+        assert result.inserted_ids == [self.test_theme_flex.id]
+        assert result.duplicate_ids == [self.test_theme_cons.id]
+
+    async def test_delete_many_themes(self):
+        """Positive test | delete themes in bulk, non-exist id is skipped"""
+        result = await self.db.delete_many_themes([self.test_theme_flex.id, self.non_exist_id])
+        assert result.requested_count == 2
+        assert result.deleted_count == 1
+
     # ----- Notions ----- #
     async def test_get_notion(self):
         """Positive test | get notion from db"""
@@ -191,6 +337,78 @@ class TestDB:
         with pytest.raises(DBNotFound):
             await self.db.get_all_notion_by_condition({"name": "no support name"})
 
+    async def test_iter_notions_by_condition(self):
+        """Positive test | iterate notions by one per batch with condition {"description": "Some alarm desc"}"""
+        batches = [
+            batch async for batch in self.db.iter_notions_by_condition({"description": "Some alarm desc"}, batch_size=1)
+        ]
+        assert batches == [[self.test_notion_cons], [self.test_notion_flex]]
+
+    async def test_get_notions_due_before(self):
+        """Positive test | get notions due before time, notion without next_notion_time is never due"""
+        notions = await self.db.get_notions_due_before(datetime.datetime(2000, 1, 1))
+        assert notions == [self.test_notion_cons]
+
+    async def test_get_notions_in_window(self):
+        """Positive test | notions in window are paged by cursor in next_notion_time order"""
+        start = datetime.datetime(2030, 1, 1)
+        await self.db.write_many_notions([
+            self.test_notion_cons.copy(update={"id": notion_id, "user_id": 5, "next_notion_time": next_time})
+            for notion_id, next_time in (
+                (303, start + datetime.timedelta(hours=1)), (302, start), (301, start),
+                (300, start + datetime.timedelta(days=7))
+            )
+        ])
+        first = await self.db.get_notions_in_window(5, start, start + datetime.timedelta(days=7), limit=2)
+        second = await self.db.get_notions_in_window(
+            5, start, start + datetime.timedelta(days=7), limit=2, cursor=first.next_cursor
+        )
+        await self.db.purge_user(5)
+        assert [notion.id for notion in first.notions + second.notions] == [301, 302, 303]
+        assert second.next_cursor is None
+
+    async def test_get_notions_in_window_bad_cursor(self):
+        """Negative test | cursor is not a cursor token"""
+        with pytest.raises(ValueError):
+            await self.db.get_notions_in_window(
+                self.test_user_const.id, datetime.datetime(2000, 1, 1), datetime.datetime(2000, 1, 2),
+                cursor="not a cursor"
+            )
+
+    async def test_set_notions_next_time(self):
+        """Positive test | move notion forward and back"""
+        next_time = self.test_notion_cons.next_notion_time + datetime.timedelta(days=1)
+        assert await self.db.set_notions_next_time({self.test_notion_cons.id: next_time}) == 1
+        assert await self.db.get_notions_due_before(datetime.datetime(2000, 1, 1)) == []
+        assert await self.db.set_notions_next_time(
+            {self.test_notion_cons.id: self.test_notion_cons.next_notion_time}
+        ) == 1
+
+    async def test_set_notions_next_time_expected(self):
+        """Negative test | notion which doesn't have expected time is not moved"""
+        next_time = self.test_notion_cons.next_notion_time + datetime.timedelta(days=1)
+        assert await self.db.set_notions_next_time(
+            {self.test_notion_cons.id: next_time}, {self.test_notion_cons.id: datetime.datetime(2000, 1, 1)}
+        ) == 0
+        notion = await self.db.get_notion(self.test_notion_cons.id)
+        assert notion.next_notion_time == self.test_notion_cons.next_notion_time
+
+    async def test_reschedule_notion(self):
+        """Positive test | reschedule notion if it still has expected time and reschedule it back"""
+        next_time = self.test_notion_cons.next_notion_time + datetime.timedelta(days=1)
+        await self.db.reschedule_notion(
+            self.test_notion_cons.id, next_time, expected={"next_notion_time": self.test_notion_cons.next_notion_time}
+        )
+        assert (await self.db.get_notion(self.test_notion_cons.id)).next_notion_time == next_time
+        await self.db.reschedule_notion(self.test_notion_cons.id, self.test_notion_cons.next_notion_time)
+
+    async def test_reschedule_notion_conflict(self):
+        """Negative test | notion was already rescheduled"""
+        with pytest.raises(DBConflict):
+            await self.db.reschedule_notion(
+                self.test_notion_cons.id, None, expected={"next_notion_time": datetime.datetime(2000, 1, 1)}
+            )
+
     async def test_delete_notion(self):
         """Positive test | delete theme from db"""
         notion_id = await self.db.delete_notion(self.test_notion_flex.id)
@@ -225,11 +443,30 @@ class TestDB:
         notes = await self.db.get_all_notes_by_condition({"name": "test notion name"})
         assert notes == [self.test_note_cons, self.test_note_flex]
 
+    async def test_get_all_notes_by_condition_fields(self):
+        """Positive test | get only requested fields of all notes with condition {"name": "test notion name"}"""
+        notes = await self.db.get_all_notes_by_condition({"name": "test notion name"}, fields=["name"])
+        assert [(note.id, note.name) for note in notes] == [
+            (self.test_note_cons.id, self.test_note_cons.name),
+            (self.test_note_flex.id, self.test_note_flex.name),
+        ]
+        assert "check_points" not in notes[0].dict()
+
+    async def test_get_all_notes_by_condition_list_length(self):
+        """Positive test | list_length passed positionally caps the number of notes"""
+        notes = await self.db.get_all_notes_by_condition({"name": "test notion name"}, 1)
+        assert notes == [self.test_note_cons]
+
     async def test_get_all_notes_by_condition_non_exist(self):
         """Negative test | try to get all notes, No one notion found setting conditions"""
         with pytest.raises(DBNotFound):
             await self.db.get_all_notes_by_condition({"name": "no support name"})
 
+    async def test_iter_notes_by_condition(self):
+        """Positive test | iterate notes in a single batch with condition {"name": "test notion name"}"""
+        batches = [batch async for batch in self.db.iter_notes_by_condition({"name": "test notion name"})]
+        assert batches == [[self.test_note_cons, self.test_note_flex]]
+
     async def test_delete_note(self):
         """Positive test | delete note from db"""
         note_id = await self.db.delete_note(self.test_note_flex.id)
@@ -239,3 +476,85 @@ class TestDB:
         """Negative test | try to delete non-exist note"""
         with pytest.raises(DBNotFound):
             await self.db.delete_note(self.non_exist_id)
+
+    async def test_search_notes(self):
+        """Positive test | find note by check point text with snippet"""
+        page = await self.db.search_notes(self.test_user_const.id, "chek")
+        assert [hit.id for hit in page.hits] == [self.test_note_cons.id]
+        assert page.hits[0].snippet == "Chek-list text"
+        assert page.next_offset is None
+
+    async def test_search_notes_other_user(self):
+        """Negative test | notes of other users are not found"""
+        page = await self.db.search_notes(self.non_exist_id, "chek")
+        assert page.hits == []
+
+    async def test_update_note_fields(self):
+        """Positive test | set note field if it still has expected value and set it back"""
+        description = self.test_note_cons.description
+        await self.db.update_note_fields(
+            self.test_note_cons.id, {"description": "New description"}, expected={"description": description}
+        )
+        assert (await self.db.get_note(self.test_note_cons.id)).description == "New description"
+        await self.db.update_note_fields(self.test_note_cons.id, {"description": description})
+        assert await self.db.get_note(self.test_note_cons.id) == self.test_note_cons
+
+    async def test_update_note_fields_conflict(self):
+        """Negative test | note doesn't have expected value anymore"""
+        with pytest.raises(DBConflict):
+            await self.db.update_note_fields(
+                self.test_note_cons.id, {"description": "New description"}, expected={"description": "Old"}
+            )
+
+    async def test_update_note_fields_not_found(self):
+        """Negative test | try to update non-exist note"""
+        with pytest.raises(DBNotFound):
+            await self.db.update_note_fields(self.non_exist_id, {"description": "New description"})
+
+    async def test_update_note_fields_check_points(self):
+        """Negative test | check points can't be set as note field"""
+        with pytest.raises(ValueError):
+            await self.db.update_note_fields(self.test_note_cons.id, {"check_points": []})
+
+    async def test_toggle_check_point(self):
+        """Positive test | toggle check point by index, then back by key"""
+        key = self.test_note_cons.check_points[0].creation_time
+        assert await self.db.toggle_check_point(self.test_note_cons.id, index=0) is True
+        assert (await self.db.get_note(self.test_note_cons.id)).check_points[0].is_finish is True
+        assert await self.db.toggle_check_point(self.test_note_cons.id, key=key) is False
+        assert await self.db.get_note(self.test_note_cons.id) == self.test_note_cons
+
+    async def test_toggle_check_point_moved(self):
+        """Negative test | check point at index doesn't have expected key"""
+        with pytest.raises(DBConflict):
+            await self.db.toggle_check_point(self.test_note_cons.id, index=0, key=datetime.datetime(2000, 1, 1))
+
+    async def test_append_and_remove_check_point(self):
+        """Positive test | append check points and remove them by key and by index"""
+        check_point = CheckPointModel(
+            text="New check point",
+            is_finish=False,
+            attachments=[],
+            creation_time=datetime.datetime(2000, 1, 1),
+            notion_id=None
+        )
+        await self.db.append_check_point(self.test_note_cons.id, check_point)
+        note = await self.db.get_note(self.test_note_cons.id)
+        assert note.check_points == self.test_note_cons.check_points + [check_point]
+
+        await self.db.remove_check_point(self.test_note_cons.id, key=check_point.creation_time)
+        assert await self.db.get_note(self.test_note_cons.id) == self.test_note_cons
+
+        await self.db.append_check_point(self.test_note_cons.id, check_point)
+        await self.db.remove_check_point(self.test_note_cons.id, index=1)
+        assert await self.db.get_note(self.test_note_cons.id) == self.test_note_cons
+
+    async def test_append_check_point_same_key(self):
+        """Negative test | note already has check point with this creation time"""
+        with pytest.raises(DBConflict):
+            await self.db.append_check_point(self.test_note_cons.id, self.test_note_cons.check_points[0])
+
+    async def test_remove_check_point_not_exist(self):
+        """Negative test | try to remove check point with index out of range"""
+        with pytest.raises(DBConflict):
+            await self.db.remove_check_point(self.test_note_cons.id, index=10)
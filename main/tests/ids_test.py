@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.ids import IdAllocator
+
+
+class CountingMemoryDbApi(MemoryDbApi):
+    """Count id block reservations"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reserve_calls = 0
+
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        self.reserve_calls += 1
+        await asyncio.sleep(0)
+        return await super().reserve_id_block(entity, size)
+
+
+class TestIdAllocator:
+
+    async def test_next_id_above_existing(self):
+        """Positive test | ids start after max existing id and are taken from one block"""
+        db = CountingMemoryDbApi(notes=[db_test.TestDB.test_note_flex])
+        allocator = IdAllocator(db, block_size=10)
+        assert [await allocator.next_id("notes") for _ in range(10)] == list(range(2, 12))
+        assert db.reserve_calls == 1
+
+    async def test_next_id_concurrent(self):
+        """Positive test | concurrent callers share one reservation and get unique ids"""
+        db = CountingMemoryDbApi()
+        allocator = IdAllocator(db, block_size=100)
+        ids = await asyncio.gather(*(allocator.next_id("users") for _ in range(150)))
+        assert sorted(ids) == list(range(1, 151))
+        assert db.reserve_calls == 2
+
+    async def test_allocators_share_db(self):
+        """Positive test | allocators of different workers never hand out the same id"""
+        db = MemoryDbApi()
+        first, second = IdAllocator(db, block_size=5), IdAllocator(db, block_size=5)
+        ids = [await allocator.next_id("themes") for _ in range(7) for allocator in (first, second)]
+        assert len(set(ids)) == len(ids)
+
+    async def test_next_ids_big_count(self):
+        """Positive test | big count is reserved as one block"""
+        allocator = IdAllocator(MemoryDbApi(), block_size=10)
+        assert await allocator.next_ids("notions", 25) == list(range(1, 26))
+
+    async def test_unknown_entity(self):
+        """Negative test | entity without collection"""
+        with pytest.raises(ValueError):
+            await IdAllocator(MemoryDbApi()).next_id("attachments")
@@ -0,0 +1,68 @@
+import argparse
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from main.benchmarks import load_test
+from main.routers import notes, reminders, users
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.exceptons import DBNotFound
+
+
+async def _no_pool() -> None:
+    return None
+
+
+async def _setup() -> tuple[FastAPI, load_test.Dataset]:
+    app = FastAPI()
+    for module in (users, notes, reminders):
+        app.include_router(module.router)
+    app.state.db = MemoryDbApi()
+    dataset = await load_test.seed(app.state.db, users=3, notes_per_user=2, notions_per_user=2)
+    return app, dataset
+
+
+def _client(app: FastAPI) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app")
+
+
+class TestLoadTest:
+
+    async def test_closed_stage(self):
+        """Positive test | every operation of the mix is answered without errors"""
+        app, dataset = await _setup()
+        async with _client(app) as client:
+            result = await load_test.run_closed_stage(
+                client, load_test.make_operations(dataset), load_test.DEFAULT_MIX, 2, 0.3, _no_pool
+            )
+        assert result.requests > 0 and result.errors == 0
+        assert set(result.operations) == set(load_test.DEFAULT_MIX)
+        assert result.p50_ms <= result.p99_ms <= result.max_ms
+
+    async def test_open_stage(self):
+        """Positive test | low rate is served in full"""
+        app, dataset = await _setup()
+        async with _client(app) as client:
+            result = await load_test.run_open_stage(
+                client, load_test.make_operations(dataset), {"user_lookup": 1}, 100, 0.3, _no_pool
+            )
+        assert result.requests > 0 and result.errors == 0 and result.dropped == 0
+        assert set(result.operations) == {"user_lookup"}
+
+    async def test_cleanup(self):
+        """Positive test | seeded users are purged with their documents"""
+        app, dataset = await _setup()
+        await load_test.cleanup(app.state.db, dataset)
+        assert await app.state.db.get_users_by_ids(dataset.user_ids) == []
+        with pytest.raises(DBNotFound):
+            await app.state.db.get_all_notes_by_condition({"user_id": {"$in": dataset.user_ids}})
+
+    def test_parse_mix(self):
+        """Positive test | mix is parsed into weights by operation"""
+        assert load_test.parse_mix("user_lookup=3,due_scan=1") == {"user_lookup": 3.0, "due_scan": 1.0}
+
+    def test_parse_mix_unknown(self):
+        """Negative test | unknown operation is rejected"""
+        with pytest.raises(argparse.ArgumentTypeError):
+            load_test.parse_mix("unknown=1")
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from main.models.notion_models import UserModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.loader import DbLoader
+from main.utils.exceptons import DBNotFound
+
+
+class CountingUsersDb(DbApi):
+    """Keep users in dict, record every batch query"""
+
+    def __init__(self, users: list[UserModel]):
+        self.users = {user.id: user for user in users}
+        self.batches = list()
+
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        self.batches.append(sorted(user_ids))
+        return [self.users[user_id] for user_id in user_ids if user_id in self.users]
+
+
+class TestLoader:
+    users = [UserModel(_id=user_id, tg_id=f"test_{user_id}", name="Test Name") for user_id in range(1, 4)]
+
+    async def test_get_users_single_query(self):
+        """Positive test | concurrent loads are coalesced into one query and returned in order"""
+        db = CountingUsersDb(self.users)
+        loader = DbLoader(db)
+        users = await asyncio.gather(loader.get_user(3), loader.get_user(1), loader.get_user(3))
+        assert users == [self.users[2], self.users[0], self.users[2]]
+        assert db.batches == [[1, 3]]
+
+    async def test_get_users_missing(self):
+        """Negative test | missing id fails only its own load"""
+        db = CountingUsersDb(self.users)
+        loader = DbLoader(db)
+        found, missing = await asyncio.gather(loader.get_user(1), loader.get_user(11111111), return_exceptions=True)
+        assert found == self.users[0]
+        assert isinstance(missing, DBNotFound)
+
+    async def test_get_users_max_batch_size(self):
+        """Positive test | batch is split by max_batch_size"""
+        db = CountingUsersDb(self.users)
+        loader = DbLoader(db, max_batch_size=2)
+        assert await loader.get_users([1, 2, 3]) == self.users
+        assert db.batches == [[1, 2], [3]]
+
+    async def test_get_users_not_found(self):
+        """Negative test | load_many raise DBNotFound if any id is missing"""
+        loader = DbLoader(CountingUsersDb(self.users))
+        with pytest.raises(DBNotFound):
+            await loader.get_users([1, 11111111])
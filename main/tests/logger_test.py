@@ -0,0 +1,55 @@
+import logging
+import logging.handlers
+
+import orjson
+
+from main.utils.logger import JsonFormatter, SamplingFilter, init_app_logger, stop_app_logger
+
+LOGGER_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"json": {"()": JsonFormatter}},
+    "handlers": {
+        "buffer": {"class": "logging.handlers.BufferingHandler", "capacity": 1000, "formatter": "json"}
+    },
+    "loggers": {"test_queue": {"handlers": ["buffer"], "level": "DEBUG", "propagate": False}}
+}
+
+
+class TestLogger:
+
+    def test_queue_logging(self):
+        """Positive test | records go through queue to configured handlers, formatted as JSON"""
+        init_app_logger(LOGGER_CONFIG)
+        test_logger = logging.getLogger("test_queue")
+        test_logger.info("Success write %s with id: %s", "note", 1, extra={"operation": "write_new_note"})
+        queue_handler = test_logger.handlers[0]
+        stop_app_logger()
+
+        buffer_handler = queue_handler.target_handlers[0]
+        entry = orjson.loads(buffer_handler.format(buffer_handler.buffer[0]))
+        assert entry["message"] == "Success write note with id: 1"
+        assert entry["level"] == "INFO"
+        assert entry["operation"] == "write_new_note"
+        test_logger.removeHandler(queue_handler)
+
+    def test_sampling_filter(self):
+        """Positive test | info records are sampled, errors always pass"""
+        sampling = SamplingFilter(0)
+        info = logging.LogRecord("app.db", logging.INFO, "", 0, "msg", None, None)
+        error = logging.LogRecord("app.db", logging.ERROR, "", 0, "msg", None, None)
+        assert not sampling.filter(info)
+        assert sampling.filter(error)
+
+    def test_sampling_child_loggers(self):
+        """Positive test | records of child loggers are sampled, records of other loggers pass"""
+        handler = logging.handlers.BufferingHandler(1000)
+        parent = logging.getLogger("test_sampling")
+        parent.addHandler(handler)
+        parent.setLevel(logging.INFO)
+        init_app_logger(sample_rates={"test_sampling.db": 0})
+        logging.getLogger("test_sampling.db.cache").info("Sampled out")
+        logging.getLogger("test_sampling.db.cache").error("Kept")
+        logging.getLogger("test_sampling.api").info("Not sampled")
+        assert [record.getMessage() for record in handler.buffer] == ["Kept", "Not sampled"]
+        parent.removeHandler(handler)
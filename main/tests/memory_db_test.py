@@ -0,0 +1,18 @@
+import pytest
+
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+
+
+class TestMemoryDB(db_test.TestDB):
+    """Run the same behavioral suite against in-memory backend seeded like the test Mongo db"""
+    db = MemoryDbApi(
+        users=[db_test.TestDB.test_user_const],
+        themes=[db_test.TestDB.test_theme_cons],
+        notes=[db_test.TestDB.test_note_cons],
+        notions=[db_test.TestDB.test_notion_cons]
+    )
+
+    @pytest.fixture(autouse=True)
+    def connect(self):
+        pass
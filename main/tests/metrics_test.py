@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main.app_main import app
+from main.tests import db_test
+from main.utils.DbApi.InstrumentedAPI import InstrumentedDbApi
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.exceptons import DBNotFound
+from main.utils.metrics import Histogram, DB_OPERATION_SECONDS
+
+
+class TestMetrics:
+
+    def test_histogram_render(self):
+        """Positive test | histogram buckets are rendered cumulative with sum and count"""
+        histogram = Histogram("test_seconds", "Test histogram", ("operation",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.labels("get").observe(value)
+        assert histogram.render().splitlines() == [
+            "# HELP test_seconds Test histogram",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{operation="get",le="0.1"} 1',
+            'test_seconds_bucket{operation="get",le="1.0"} 2',
+            'test_seconds_bucket{operation="get",le="+Inf"} 3',
+            'test_seconds_sum{operation="get"} 5.55',
+            'test_seconds_count{operation="get"} 3',
+        ]
+
+    async def test_instrumented_db(self):
+        """Positive test | db calls are counted by operation and status"""
+        db = InstrumentedDbApi(MemoryDbApi(users=[db_test.TestDB.test_user_const]))
+        ok_count = sum(DB_OPERATION_SECONDS.labels("get_user", "ok").counts)
+        not_found_count = sum(DB_OPERATION_SECONDS.labels("get_user", "not_found").counts)
+
+        assert await db.get_user(db_test.TestDB.test_user_const.id) == db_test.TestDB.test_user_const
+        with pytest.raises(DBNotFound):
+            await db.get_user(db_test.TestDB.non_exist_id)
+        assert sum(DB_OPERATION_SECONDS.labels("get_user", "ok").counts) == ok_count + 1
+        assert sum(DB_OPERATION_SECONDS.labels("get_user", "not_found").counts) == not_found_count + 1
+
+    def test_metrics_endpoint(self):
+        """Positive test | /metrics serves Prometheus text with HTTP route metrics"""
+        client = TestClient(app)
+        client.get("/metrics")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_request_seconds_count{method="GET",route="/metrics",status="200"}' in response.text
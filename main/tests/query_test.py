@@ -0,0 +1,38 @@
+import datetime
+
+import pytest
+
+from main.utils.DbApi.query import matches, QueryError
+
+DOC = {
+    "_id": 1,
+    "user_id": 1,
+    "name": "Test Note",
+    "next_notion_time": datetime.datetime(2000, 1, 1),
+    "description": None,
+    "check_points": [{"text": "first", "is_finish": True}, {"text": "second", "is_finish": False}],
+}
+
+
+class TestQuery:
+
+    @pytest.mark.parametrize("condition, expected", [
+        ({"user_id": 1, "name": "Test Note"}, True),
+        ({"user_id": {"$in": [2, 3]}}, False),
+        ({"next_notion_time": {"$type": "date", "$lte": datetime.datetime(2000, 1, 2)}}, True),
+        ({"description": {"$lte": datetime.datetime(2000, 1, 2)}}, False),
+        ({"description": None, "missing": None}, True),
+        ({"check_points.text": "second"}, True),
+        ({"check_points.1.is_finish": True}, False),
+        ({"check_points": {"$elemMatch": {"text": "first", "is_finish": False}}}, False),
+        ({"$or": [{"_id": 2}, {"name": {"$regex": "^test", "$options": "i"}}]}, True),
+        ({"$and": [{"_id": {"$gt": 0}}, {"_id": {"$ne": 1}}]}, False),
+    ])
+    def test_matches(self, condition, expected):
+        """Positive test | evaluate supported operators"""
+        assert matches(DOC, condition) == expected
+
+    def test_matches_unsupported(self):
+        """Negative test | unsupported operator is an error, not a silent mismatch"""
+        with pytest.raises(QueryError):
+            matches(DOC, {"name": {"$where": "true"}})
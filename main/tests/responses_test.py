@@ -0,0 +1,60 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from main.routers import notes
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.responses import dumps, json_array_chunks
+
+
+async def _batches(*batches: list):
+    for batch in batches:
+        yield batch
+
+
+async def _collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TestResponses:
+
+    def test_dumps_like_fastapi(self):
+        """Positive test | model with alias, nested models and datetimes renders as FastAPI renders it"""
+        note = db_test.TestDB.test_note_cons
+        assert json.loads(dumps([note])) == jsonable_encoder([note])
+        assert json.loads(dumps(note))["_id"] == note.id
+
+    async def test_array_chunks(self):
+        """Positive test | batches make one JSON array, empty batches are skipped"""
+        note = db_test.TestDB.test_note_cons
+        data = await _collect(json_array_chunks(_batches([note, note], [], [note])))
+        assert json.loads(data) == jsonable_encoder([note] * 3)
+
+    async def test_empty_array(self):
+        """Positive test | no batches make empty array"""
+        assert await _collect(json_array_chunks(_batches())) == b"[]"
+
+    def test_route_streams_notes(self):
+        """Positive test | user notes are streamed as JSON array, partially if fields are set"""
+        app = FastAPI()
+        app.include_router(notes.router)
+        app.state.db = MemoryDbApi(notes=[
+            db_test.TestDB.test_note_cons.copy(update={"id": note_id}) for note_id in range(5)
+        ])
+        client = TestClient(app)
+        response = client.get("/users/1/notes", params={"batch_size": 2})
+        assert response.status_code == 200
+        assert [note["_id"] for note in response.json()] == list(range(5))
+        response = client.get("/users/1/notes", params={"fields": ["name"]})
+        assert response.json()[0]["name"] == db_test.TestDB.test_note_cons.name
+        assert "check_points" not in response.json()[0]
+
+    def test_route_unknown_field(self):
+        """Negative test | unknown field is rejected before the stream starts"""
+        app = FastAPI()
+        app.include_router(notes.router)
+        app.state.db = MemoryDbApi()
+        assert TestClient(app).get("/users/1/notes", params={"fields": ["unknown"]}).status_code == 422
@@ -0,0 +1,70 @@
+import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main.routers import notes, reminders, users
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+
+
+def _client(db: MemoryDbApi) -> TestClient:
+    app = FastAPI()
+    for module in (users, notes, reminders):
+        app.include_router(module.router)
+    app.state.db = db
+    return TestClient(app)
+
+
+class TestRoutes:
+
+    def test_get_user(self):
+        """Positive test | user and its summary are found by id"""
+        client = _client(MemoryDbApi(users=[db_test.TestDB.test_user_const]))
+        user_id = db_test.TestDB.test_user_const.id
+        assert client.get(f"/users/{user_id}").json()["_id"] == user_id
+        assert client.get(f"/users/{user_id}/summary").json()["_id"] == user_id
+
+    def test_get_user_not_found(self):
+        """Negative test | unknown user is 404"""
+        client = _client(MemoryDbApi())
+        assert client.get("/users/404").status_code == 404
+        assert client.get("/users/404/summary").status_code == 404
+
+    def test_get_note(self):
+        """Positive test | note is found by user and note id, other user's note is not"""
+        note = db_test.TestDB.test_note_cons
+        client = _client(MemoryDbApi(notes=[note]))
+        assert client.get(f"/users/{note.user_id}/notes/{note.id}").json()["_id"] == note.id
+        assert client.get(f"/users/{note.user_id + 1}/notes/{note.id}").status_code == 404
+        assert client.get(f"/users/{note.user_id}/notes/404").status_code == 404
+
+    def test_toggle_check_point(self):
+        """Positive test | check point is flipped and new is_finish returned"""
+        note = db_test.TestDB.test_note_cons
+        client = _client(MemoryDbApi(notes=[note]))
+        url = f"/users/{note.user_id}/notes/{note.id}/check_points/0/toggle"
+        assert client.post(url).json() == {"is_finish": not note.check_points[0].is_finish}
+        assert client.post(url).json() == {"is_finish": note.check_points[0].is_finish}
+
+    def test_toggle_check_point_errors(self):
+        """Negative test | other user's or unknown note is 404, missing check point is 409, negative index is 422"""
+        note = db_test.TestDB.test_note_cons
+        client = _client(MemoryDbApi(notes=[note]))
+        assert client.post(f"/users/{note.user_id + 1}/notes/{note.id}/check_points/0/toggle").status_code == 404
+        assert client.post(f"/users/{note.user_id}/notes/404/check_points/0/toggle").status_code == 404
+        assert client.post(f"/users/{note.user_id}/notes/{note.id}/check_points/100/toggle").status_code == 409
+        assert client.post(f"/users/{note.user_id}/notes/{note.id}/check_points/-1/toggle").status_code == 422
+
+    def test_due_reminders(self):
+        """Positive test | only notions due before until are returned, earliest first"""
+        now = datetime.datetime(2023, 1, 1)
+        notion = db_test.TestDB.test_notion_cons
+        client = _client(MemoryDbApi(notions=[
+            notion.copy(update={"id": 1, "next_notion_time": now - datetime.timedelta(minutes=1)}),
+            notion.copy(update={"id": 2, "next_notion_time": now - datetime.timedelta(minutes=2)}),
+            notion.copy(update={"id": 3, "next_notion_time": now + datetime.timedelta(minutes=1)}),
+        ]))
+        response = client.get("/reminders/due", params={"until": now.isoformat()})
+        assert [notion["_id"] for notion in response.json()] == [2, 1]
+        assert client.get("/reminders/due", params={"limit": 0}).status_code == 422
@@ -0,0 +1,124 @@
+import datetime
+
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.scheduler import NotionScheduler, repeat_every
+
+START = datetime.datetime(2000, 1, 1, 12, 0)
+
+
+class FakeNotionsDb(DbApi):
+    """Keep notions in dict, count queries"""
+
+    def __init__(self, notions: list[NotionModel]):
+        self.notions = {notion.id: notion for notion in notions}
+        self.due_queries = 0
+        self.reschedules = 0
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        self.due_queries += 1
+        due = [n for n in self.notions.values() if n.next_notion_time is not None and n.next_notion_time <= until]
+        return sorted(due, key=lambda n: (n.next_notion_time, n.id))[:limit]
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        self.reschedules += 1
+        modified_count = 0
+        for notion_id, next_time in schedule.items():
+            if expected_times and self.notions[notion_id].next_notion_time != expected_times[notion_id]:
+                continue
+            self.notions[notion_id] = self.notions[notion_id].copy(update={"next_notion_time": next_time})
+            modified_count += 1
+        return modified_count
+
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        return [self.notions[notion_id] for notion_id in notion_ids if notion_id in self.notions]
+
+
+def make_notion(notion_id: int, next_time: datetime.datetime | None, is_repeatable: bool) -> NotionModel:
+    return NotionModel(
+        _id=notion_id,
+        user_id=1,
+        parent_id=0,
+        creation_time=START,
+        next_notion_time=next_time,
+        is_repeatable=is_repeatable,
+        description=None
+    )
+
+
+class TestScheduler:
+
+    def make_scheduler(self, db: DbApi, fired: list, now: list[datetime.datetime]) -> NotionScheduler:
+        async def sink(notion: NotionModel):
+            fired.append(notion.id)
+
+        return NotionScheduler(
+            db, sink, repeat_rule=repeat_every(datetime.timedelta(hours=1)),
+            window=datetime.timedelta(minutes=10), clock=lambda: now[0]
+        )
+
+    async def test_tick_fires_only_due(self):
+        """Positive test | only notions with next_notion_time <= now are fired, in time order"""
+        db = FakeNotionsDb([
+            make_notion(1, START + datetime.timedelta(minutes=1), False),
+            make_notion(2, START - datetime.timedelta(minutes=1), False),
+            make_notion(3, START + datetime.timedelta(days=1), False),
+            make_notion(4, None, False),
+        ])
+        fired, now = list(), [START]
+        scheduler = self.make_scheduler(db, fired, now)
+
+        assert await scheduler.tick() == 1
+        now[0] = START + datetime.timedelta(minutes=2)
+        assert await scheduler.tick() == 1
+        assert fired == [2, 1]
+        assert db.notions[1].next_notion_time is None
+        assert db.notions[3].next_notion_time == START + datetime.timedelta(days=1)
+
+    async def test_tick_reschedules_repeatable(self):
+        """Positive test | repeatable notion is moved past now, missed occurrences are skipped"""
+        db = FakeNotionsDb([make_notion(1, START - datetime.timedelta(minutes=150), True)])
+        fired, now = list(), [START]
+        scheduler = self.make_scheduler(db, fired, now)
+
+        assert await scheduler.tick() == 1
+        assert db.notions[1].next_notion_time == START + datetime.timedelta(minutes=30)
+        assert db.reschedules == 1
+
+    async def test_tick_without_due_skips_db(self):
+        """Positive test | ticks inside loaded window do not query db"""
+        db = FakeNotionsDb([make_notion(1, START + datetime.timedelta(minutes=5), False)])
+        fired, now = list(), [START]
+        scheduler = self.make_scheduler(db, fired, now)
+
+        await scheduler.tick()
+        now[0] = START + datetime.timedelta(seconds=10)
+        await scheduler.tick()
+        assert db.due_queries == 1
+        assert db.reschedules == 0
+        assert scheduler.pending_count == 1
+
+    async def test_tick_keeps_reschedule_made_while_firing(self):
+        """Positive test | notion rescheduled while its sink runs keeps the new time"""
+        db = FakeNotionsDb([make_notion(1, START, True), make_notion(2, START, True)])
+        rescheduled = START + datetime.timedelta(minutes=5)
+        fired, now = list(), [START]
+
+        async def sink(notion: NotionModel):
+            fired.append(notion.id)
+            if notion.id == 1:
+                db.notions[1] = db.notions[1].copy(update={"next_notion_time": rescheduled})
+
+        scheduler = NotionScheduler(
+            db, sink, repeat_rule=repeat_every(datetime.timedelta(hours=1)),
+            window=datetime.timedelta(minutes=10), clock=lambda: now[0]
+        )
+
+        assert await scheduler.tick() == 2
+        assert db.notions[1].next_notion_time == rescheduled
+        assert db.notions[2].next_notion_time == START + datetime.timedelta(hours=1)
+        now[0] = rescheduled
+        assert await scheduler.tick() == 1
+        assert fired == [1, 2, 1]
+        assert db.notions[1].next_notion_time == rescheduled + datetime.timedelta(hours=1)
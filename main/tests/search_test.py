@@ -0,0 +1,75 @@
+import pytest
+
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.search import SearchIndex, make_snippet
+
+FIELDS = {"name": 10, "description": 3}
+
+
+def make_doc(doc_id: int, name: str, description: str = "", user_id: int = 1) -> dict:
+    return {"_id": doc_id, "user_id": user_id, "name": name, "description": description}
+
+
+class TestSearch:
+
+    def test_rank_by_field_weight(self):
+        """Positive test | term in name ranks above term in description"""
+        index = SearchIndex(FIELDS)
+        index.add(make_doc(1, "Shopping", "buy milk"))
+        index.add(make_doc(2, "Milk", "for breakfast"))
+        index.add(make_doc(3, "Work", "deadline"))
+        assert [doc_id for _, doc_id in index.search(1, "milk", 10)] == [2, 1]
+
+    def test_rank_by_matched_terms(self):
+        """Positive test | document with more query terms ranks first, ties are ordered by id"""
+        index = SearchIndex(FIELDS)
+        for doc_id, name in enumerate(["apple", "apple banana", "banana", "cherry"]):
+            index.add(make_doc(doc_id, name))
+        assert [doc_id for _, doc_id in index.search(1, "Apple BANANA", 10)] == [1, 0, 2]
+
+    def test_scoped_by_user(self):
+        """Negative test | documents of other users are not found"""
+        index = SearchIndex(FIELDS)
+        index.add(make_doc(1, "milk", user_id=2))
+        assert index.search(1, "milk", 10) == []
+
+    def test_removed_and_changed(self):
+        """Positive test | removed document is not found, changed one is found by new text only"""
+        index = SearchIndex(FIELDS)
+        index.add(make_doc(1, "milk"))
+        index.add(make_doc(2, "milk"))
+        index.search(1, "milk", 10)
+        index.remove(make_doc(1, "milk"))
+        index.remove(make_doc(2, "milk"))
+        index.add(make_doc(2, "bread"))
+        assert index.search(1, "milk", 10) == []
+        assert [doc_id for _, doc_id in index.search(1, "bread", 10)] == [2]
+
+    def test_snippet(self):
+        """Positive test | snippet is cut around the first matched term"""
+        text = "word " * 100 + "milk " + "word " * 100
+        snippet = make_snippet(["no match", text], {"milk"}, width=40)
+        assert snippet.startswith("...") and snippet.endswith("...")
+        assert "milk" in snippet
+
+    async def test_search_pages(self):
+        """Positive test | pages don't overlap and the last one has no next offset"""
+        note = db_test.TestDB.test_note_flex
+        db = MemoryDbApi(notes=[note.copy(update={"id": note_id}) for note_id in range(5)])
+        first = await db.search_notes(note.user_id, "notion", limit=3)
+        second = await db.search_notes(note.user_id, "notion", limit=3, offset=first.next_offset)
+        assert [hit.id for hit in first.hits + second.hits] == [0, 1, 2, 3, 4]
+        assert second.next_offset is None
+
+    async def test_search_after_update(self):
+        """Positive test | partial update of note is searchable"""
+        db = MemoryDbApi(notes=[db_test.TestDB.test_note_flex])
+        await db.update_note_fields(db_test.TestDB.test_note_flex.id, {"description": "Buy milk"})
+        page = await db.search_notes(db_test.TestDB.test_note_flex.user_id, "milk")
+        assert page.hits[0].snippet == "Buy milk"
+
+    async def test_search_bad_limit(self):
+        """Negative test | limit must be positive"""
+        with pytest.raises(ValueError):
+            await MemoryDbApi().search_notes(1, "milk", limit=0)
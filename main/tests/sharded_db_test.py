@@ -0,0 +1,221 @@
+import asyncio
+import datetime
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from main.models.notion_models import UserModel, NoteModel, NotionModel
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.ShardedAPI import ShardedDbApi, _WriteGate
+from main.utils.DbApi.ring import HashRing
+from main.utils.exceptons import DBNotFound, DBConflict
+
+SHARD_NAMES = ["a", "b", "c"]
+CONST_SHARD = HashRing(SHARD_NAMES).shard_for(db_test.TestDB.test_user_const.id)
+
+
+def _shards() -> dict[str, MemoryDbApi]:
+    return {name: MemoryDbApi() for name in SHARD_NAMES}
+
+
+class TestShardedDB(db_test.TestDB):
+    """Run the same behavioral suite against shards of in-memory backend,
+    the test user is seeded on its ring shard, other users land on any shard"""
+    db = ShardedDbApi(
+        {
+            **_shards(),
+            CONST_SHARD: MemoryDbApi(
+                users=[db_test.TestDB.test_user_const],
+                themes=[db_test.TestDB.test_theme_cons],
+                notes=[db_test.TestDB.test_note_cons],
+                notions=[db_test.TestDB.test_notion_cons]
+            )
+        },
+        id_shard=CONST_SHARD
+    )
+
+    @pytest.fixture(autouse=True)
+    def connect(self):
+        pass
+
+
+class TestSharding:
+
+    @pytest.fixture
+    def shards(self) -> dict[str, MemoryDbApi]:
+        return _shards()
+
+    @pytest.fixture
+    def db(self, shards: dict[str, MemoryDbApi]) -> ShardedDbApi:
+        return ShardedDbApi(shards)
+
+    @staticmethod
+    async def _seed(db: ShardedDbApi, user_ids: range) -> None:
+        await db.write_many_users([UserModel(_id=user_id, tg_id=str(user_id), name="User") for user_id in user_ids])
+        await db.write_many_notes([
+            NoteModel(_id=user_id * 10, user_id=user_id, name="shared", creation_time=datetime.datetime(2000, 1, 1),
+                      notion_id=0, check_points=[], attachments=[])
+            for user_id in user_ids
+        ])
+        await db.write_many_notions([
+            NotionModel(_id=user_id * 10, user_id=user_id, parent_id=0, creation_time=datetime.datetime(2000, 1, 1),
+                        next_notion_time=datetime.datetime(2000, 1, 1) + datetime.timedelta(minutes=-user_id),
+                        is_repeatable=False, description="")
+            for user_id in user_ids
+        ])
+
+    @staticmethod
+    async def _user_ids_on(db: MemoryDbApi) -> list[int]:
+        return [user.id async for batch in db.iter_users_by_condition({}) for user in batch]
+
+    def test_ring_spreads_users(self):
+        """Positive test | users are spread evenly, an added shard takes users only from others"""
+        ring = HashRing(SHARD_NAMES)
+        owners = {user_id: ring.shard_for(user_id) for user_id in range(3000)}
+        for name in SHARD_NAMES:
+            assert 700 < list(owners.values()).count(name) < 1300
+
+        bigger = HashRing(SHARD_NAMES + ["d"])
+        moved = [user_id for user_id, name in owners.items() if bigger.shard_for(user_id) != name]
+        assert all(bigger.shard_for(user_id) == "d" for user_id in moved)
+        assert 500 < len(moved) < 1000
+
+    def test_ring_without_shards(self):
+        """Negative test | ring needs at least one shard"""
+        with pytest.raises(ValueError):
+            HashRing([])
+
+    def test_unknown_placement(self, shards):
+        """Negative test | users can't be placed on unknown shard"""
+        with pytest.raises(ValueError):
+            ShardedDbApi(shards, placements={1: "z"})
+
+    async def test_users_live_on_ring_shard(self, db, shards):
+        """Positive test | user and its documents are written to the ring shard of the user"""
+        await self._seed(db, range(1, 31))
+        ring = HashRing(SHARD_NAMES)
+        for name, shard in shards.items():
+            user_ids = await self._user_ids_on(shard)
+            assert user_ids == [user_id for user_id in range(1, 31) if ring.shard_for(user_id) == name]
+            notes = await shard.get_notes_by_ids([user_id * 10 for user_id in range(1, 31)])
+            assert [note.user_id for note in notes] == user_ids
+        assert len({db.shard_name_of(user_id) for user_id in range(1, 31)}) == len(SHARD_NAMES)
+
+    async def test_fan_out_reads_merged(self, db):
+        """Positive test | cross user reads merge shards in the order of a single db"""
+        await self._seed(db, range(1, 31))
+        notes = await db.get_all_notes_by_condition({"name": "shared"})
+        assert [note.id for note in notes] == [user_id * 10 for user_id in range(1, 31)]
+
+        batches = [batch async for batch in db.iter_notes_by_condition({"name": "shared"}, batch_size=7)]
+        assert [len(batch) for batch in batches] == [7, 7, 7, 7, 2]
+        assert [note.id for batch in batches for note in batch] == [user_id * 10 for user_id in range(1, 31)]
+        rest = [batch async for batch in db.iter_notes_by_condition({}, batch_size=7, start_after=batches[0][-1].id)]
+        assert [note.id for batch in rest for note in batch] == [user_id * 10 for user_id in range(8, 31)]
+
+        due = await db.get_notions_due_before(datetime.datetime(2000, 1, 1), limit=5)
+        assert [notion.user_id for notion in due] == [30, 29, 28, 27, 26]
+
+    async def test_fan_out_not_found(self, db):
+        """Negative test | DBNotFound only if no shard has matching documents"""
+        await self._seed(db, range(1, 4))
+        with pytest.raises(DBNotFound):
+            await db.get_all_notes_by_condition({"name": "missing"})
+
+    async def test_get_by_id_of_unknown_owner(self, db, shards):
+        """Positive test | object is found on all shards by a router which didn't see it"""
+        await self._seed(db, range(1, 11))
+        fresh = ShardedDbApi(shards)
+        assert (await fresh.get_note(50)).user_id == 5
+        assert [note.id for note in await fresh.get_notes_by_ids([30, 70, 111])] == [30, 70]
+        assert await fresh.delete_note(70) == 70
+        with pytest.raises(DBNotFound):
+            await fresh.get_note(70)
+
+    async def test_move_user(self, db, shards):
+        """Positive test | moved user has all documents and the same summary on the new shard"""
+        await self._seed(db, range(1, 11))
+        source = db.shard_name_of(5)
+        target = next(name for name in SHARD_NAMES if name != source)
+        summary = await db.get_user_summary(5)
+
+        result = await db.move_user(5, target)
+        assert result.copied_counts == {"users": 1, "themes": 0, "notes": 1, "notions": 1}
+        assert db.shard_name_of(5) == target and db.placements == {5: target}
+        assert 5 in await self._user_ids_on(shards[target])
+        assert 5 not in await self._user_ids_on(shards[source])
+        assert await db.get_user_summary(5) == summary
+        assert (await db.get_note(50)).user_id == 5
+        await db.append_check_point(50, db_test.TestDB.test_note_cons.check_points[0])
+        assert len((await shards[target].get_note(50)).check_points) == 1
+
+    async def test_writes_wait_for_move(self):
+        """Positive test | writes of a moving user wait for the move, writes of other users don't"""
+        gate = _WriteGate()
+        async with gate.moving(1):
+            other = asyncio.create_task(self._write(gate, 2))
+            moving = asyncio.create_task(self._write(gate, 1))
+            await asyncio.sleep(0)
+            assert other.done() and not moving.done()
+        await moving
+
+    @staticmethod
+    async def _write(gate: _WriteGate, user_id: int) -> None:
+        async with gate.writing([user_id]):
+            pass
+
+    async def test_reshard_adds_shard(self, db, shards):
+        """Positive test | only users of the new ring shard are moved, to it"""
+        await self._seed(db, range(1, 31))
+        ring = HashRing(SHARD_NAMES + ["d"])
+        new_shard = MemoryDbApi()
+
+        results = await db.reshard({**shards, "d": new_shard}, concurrency=4)
+        assert sorted(result.user_id for result in results) == [
+            user_id for user_id in range(1, 31) if ring.shard_for(user_id) == "d"
+        ]
+        assert all(result.target == "d" for result in results)
+        assert await self._user_ids_on(new_shard) == sorted(result.user_id for result in results)
+        assert db.placements == {}
+        assert len(await db.get_notes_by_ids([user_id * 10 for user_id in range(1, 31)])) == 30
+
+    async def test_reshard_removes_shard(self, db, shards):
+        """Positive test | users of removed shard are moved out, the shard is closed and dropped"""
+        await self._seed(db, range(1, 31))
+        closed = list()
+        shards["c"].close = lambda: closed.append("c")
+        await db.reshard({"a": shards["a"], "b": shards["b"]})
+        assert db.shard_names == ("a", "b") and closed == ["c"]
+        assert await self._user_ids_on(shards["c"]) == []
+        user_ids = await self._user_ids_on(shards["a"]) + await self._user_ids_on(shards["b"])
+        assert sorted(user_ids) == list(range(1, 31))
+        assert len(await db.get_all_notes_by_condition({"name": "shared"})) == 30
+
+    async def test_note_given_to_user_of_other_shard(self, db, shards):
+        """Positive test | note is moved to the shard of its new user"""
+        await self._seed(db, range(1, 11))
+        other = next(user_id for user_id in range(2, 11) if db.shard_name_of(user_id) != db.shard_name_of(1))
+        await db.update_note_fields(10, {"user_id": other})
+        assert (await shards[db.shard_name_of(other)].get_note(10)).user_id == other
+        with pytest.raises(DBNotFound):
+            await shards[db.shard_name_of(1)].get_note(10)
+        assert (await db.get_note(10)).user_id == other
+
+    async def test_note_not_moved_on_failed_write(self, db, shards):
+        """Negative test | note stays on its shard unchanged if it can't be written to the new one"""
+        await self._seed(db, range(1, 11))
+        other = next(user_id for user_id in range(2, 11) if db.shard_name_of(user_id) != db.shard_name_of(1))
+        await shards[db.shard_name_of(other)].write_new_note((await db.get_note(10)).copy(update={"user_id": other}))
+        with pytest.raises(DuplicateKeyError):
+            await db.update_note_fields(10, {"user_id": other, "name": "moved"})
+        note = await shards[db.shard_name_of(1)].get_note(10)
+        assert (note.user_id, note.name) == (1, "shared")
+
+    async def test_note_move_conflict(self, db, shards):
+        """Negative test | note isn't moved if it doesn't match expected state"""
+        await self._seed(db, range(1, 11))
+        other = next(user_id for user_id in range(2, 11) if db.shard_name_of(user_id) != db.shard_name_of(1))
+        with pytest.raises(DBConflict):
+            await db.update_note_fields(10, {"user_id": other}, expected={"name": "other"})
+        assert (await shards[db.shard_name_of(1)].get_note(10)).user_id == 1
@@ -0,0 +1,99 @@
+import datetime
+
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.summaries import SummaryIndex
+
+NEXT_TIME = datetime.datetime(2030, 1, 1)
+
+
+def make_notion(notion_id: int, next_notion_time: datetime.datetime | None, user_id: int = 1) -> dict:
+    return {"_id": notion_id, "user_id": user_id, "next_notion_time": next_notion_time}
+
+
+class TestSummaries:
+
+    def test_next_notion_after_remove(self):
+        """Positive test | the next notion is the earliest scheduled one left"""
+        index = SummaryIndex()
+        index.add("notions", make_notion(1, NEXT_TIME))
+        index.add("notions", make_notion(2, NEXT_TIME + datetime.timedelta(hours=1)))
+        index.add("notions", make_notion(3, None))
+        index.remove("notions", make_notion(1, NEXT_TIME))
+        summary = index.get(1)
+        assert summary["notions"] == 2
+        assert summary["next_notion"] == {"time": NEXT_TIME + datetime.timedelta(hours=1), "id": 2}
+
+    def test_empty_summary(self):
+        """Positive test | user without documents has zero counters and no next notion"""
+        index = SummaryIndex()
+        index.add("notions", make_notion(1, NEXT_TIME))
+        index.remove("notions", make_notion(1, NEXT_TIME))
+        assert index.get(1) == {
+            "_id": 1, "themes": 0, "notes": 0, "notions": 0, "open_check_points": 0, "finished_check_points": 0
+        }
+
+    async def test_note_moved_to_other_user(self):
+        """Positive test | counters of note move with it to another user"""
+        user = db_test.TestDB.test_user_const
+        db = MemoryDbApi(
+            users=[user, user.copy(update={"id": 2})],
+            notes=[db_test.TestDB.test_note_cons]
+        )
+        await db.update_note_fields(db_test.TestDB.test_note_cons.id, {"user_id": 2})
+        assert (await db.get_user_summary(1)).notes == 0
+        moved = await db.get_user_summary(2)
+        assert (moved.notes, moved.open_check_points) == (1, 1)
+
+    async def test_scheduler_bulk_reschedule(self):
+        """Positive test | next notion follows bulk reschedule of notions"""
+        notion = db_test.TestDB.test_notion_cons
+        db = MemoryDbApi(
+            users=[db_test.TestDB.test_user_const],
+            notions=[notion, notion.copy(update={"id": 1, "next_notion_time": NEXT_TIME})]
+        )
+        await db.set_notions_next_time({notion.id: None, 1: NEXT_TIME - datetime.timedelta(days=1)})
+        summary = await db.get_user_summary(notion.user_id)
+        assert summary.next_notion.id == 1
+        assert summary.next_notion.time == NEXT_TIME - datetime.timedelta(days=1)
+
+    async def test_rebuild_all(self):
+        """Positive test | rebuild of all users keeps summaries maintained on writes"""
+        db = MemoryDbApi(
+            users=[db_test.TestDB.test_user_const],
+            themes=[db_test.TestDB.test_theme_cons],
+            notes=[db_test.TestDB.test_note_cons],
+            notions=[db_test.TestDB.test_notion_cons]
+        )
+        summary = await db.get_user_summary(db_test.TestDB.test_user_const.id)
+        assert await db.rebuild_user_summaries() == 1
+        assert await db.get_user_summary(db_test.TestDB.test_user_const.id) == summary
+
+    async def test_documents_written_before_user(self):
+        """Positive test | notion written before its user is counted once the user is written,
+        reschedule and delete keep summary and indexes consistent"""
+        db = MemoryDbApi()
+        notion = db_test.TestDB.test_notion_cons.copy(update={"id": 1, "user_id": 5, "next_notion_time": NEXT_TIME})
+        await db.write_new_notion(notion)
+        await db.write_new_user(db_test.TestDB.test_user_const.copy(update={"id": 5}))
+        assert (await db.get_user_summary(5)).notions == 1
+
+        later = NEXT_TIME + datetime.timedelta(days=365)
+        await db.reschedule_notion(1, later)
+        summary = await db.get_user_summary(5)
+        assert (summary.notions, summary.next_notion.time) == (1, later)
+        assert [found.id for found in await db.get_notions_due_before(later + datetime.timedelta(days=1))] == [1]
+        assert [found.id for found in await db.get_all_notion_by_condition({"user_id": 5})] == [1]
+
+        await db.delete_notion(1)
+        summary = await db.get_user_summary(5)
+        assert (summary.notions, summary.next_notion) == (0, None)
+
+    def test_uncounted_document_removed(self):
+        """Negative test | removing a document that was not counted doesn't change summary"""
+        users = set()
+        index = SummaryIndex(lambda user_id: user_id in users)
+        index.add("notions", make_notion(1, NEXT_TIME, user_id=5))
+        users.add(5)
+        index.remove("notions", make_notion(1, NEXT_TIME, user_id=5))
+        assert index.get(5)["notions"] == 0 and "next_notion" not in index.get(5)
@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main.routers import notions
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.scheduler import repeat_every
+from main.utils.upcoming import get_upcoming, iter_occurrences
+
+START = datetime.datetime(2030, 1, 1)
+END = START + datetime.timedelta(days=7)
+
+
+def make_db() -> MemoryDbApi:
+    notion = db_test.TestDB.test_notion_cons
+    return MemoryDbApi(
+        users=[db_test.TestDB.test_user_const],
+        notions=[
+            # Daily from the second day, 6 occurrences in window
+            notion.copy(update={"id": 1, "next_notion_time": START + datetime.timedelta(days=1)}),
+            notion.copy(update={"id": 2, "next_notion_time": START + datetime.timedelta(days=2, hours=1),
+                                "is_repeatable": False}),
+            # Out of window
+            notion.copy(update={"id": 3, "next_notion_time": END, "is_repeatable": False}),
+        ]
+    )
+
+
+class _CountingDb(MemoryDbApi):
+    """Counts notions read by window pages"""
+    read_count = 0
+
+    async def get_notions_in_window(self, *args, **kwargs):
+        page = await super().get_notions_in_window(*args, **kwargs)
+        self.read_count += len(page.notions)
+        return page
+
+
+class TestUpcoming:
+
+    async def test_repeatable_expanded(self):
+        """Positive test | repeatable notion occurs once per repeat, merged in time order with others"""
+        occurrences = [
+            (occurrence.time, occurrence.notion.id)
+            async for occurrence in iter_occurrences(
+                make_db(), 1, START, END, repeat_every(datetime.timedelta(days=1)), batch_size=1
+            )
+        ]
+        assert len(occurrences) == 7
+        assert occurrences == sorted(occurrences)
+        assert (START + datetime.timedelta(days=2, hours=1), 2) in occurrences
+        assert {notion_id for _, notion_id in occurrences} == {1, 2}
+
+    async def test_pages(self):
+        """Positive test | pages of occurrences don't overlap and the last one has no next cursor"""
+        db = make_db()
+        rule = repeat_every(datetime.timedelta(days=1))
+        pages = [await get_upcoming(db, 1, START, END, limit=3, repeat_rule=rule)]
+        while pages[-1].next_cursor is not None:
+            pages.append(await get_upcoming(db, 1, START, END, limit=3, cursor=pages[-1].next_cursor,
+                                            repeat_rule=rule))
+        times = [occurrence.time for page in pages for occurrence in page.occurrences]
+        assert len(pages) == 3
+        assert times == sorted(set(times)) and len(times) == 7
+
+    async def test_pages_resume_from_cursor(self):
+        """Positive test | a page reads only notions after the previous one, not the pages before"""
+        notion = db_test.TestDB.test_notion_cons
+        db = _CountingDb(notions=[
+            notion.copy(update={"id": notion_id, "next_notion_time": START + datetime.timedelta(hours=notion_id),
+                                "is_repeatable": notion_id == 1})
+            for notion_id in range(1, 21)
+        ])
+        rule = repeat_every(datetime.timedelta(days=1))
+        pages = [await get_upcoming(db, 1, START, END, limit=4, repeat_rule=rule)]
+        while pages[-1].next_cursor is not None:
+            pages.append(await get_upcoming(db, 1, START, END, limit=4, cursor=pages[-1].next_cursor,
+                                            repeat_rule=rule))
+        keys = [(occurrence.time, occurrence.notion.id) for page in pages for occurrence in page.occurrences]
+        assert keys == sorted(set(keys)) and len(keys) == 26
+        # Each notion is read once, plus the one read ahead by every page to tell if there is a next one
+        assert db.read_count <= 20 + len(pages)
+
+    async def test_malformed_cursor(self):
+        """Negative test | cursor is not a token of a previous page"""
+        with pytest.raises(ValueError):
+            await get_upcoming(make_db(), 1, START, END, cursor="not a cursor")
+
+    def test_route(self):
+        """Positive test | upcoming notions of the week from start"""
+        app = FastAPI()
+        app.include_router(notions.router)
+        app.state.db = make_db()
+        response = TestClient(app).get("/users/1/notions/upcoming", params={"start": START.isoformat()})
+        assert response.status_code == 200
+        assert len(response.json()["occurrences"]) == 7
+
+    def test_route_bad_window(self):
+        """Negative test | window ends before it starts"""
+        app = FastAPI()
+        app.include_router(notions.router)
+        app.state.db = make_db()
+        response = TestClient(app).get(
+            "/users/1/notions/upcoming", params={"start": END.isoformat(), "end": START.isoformat()}
+        )
+        assert response.status_code == 422
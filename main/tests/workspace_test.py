@@ -0,0 +1,83 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main.routers import workspace
+from main.tests import db_test
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.workspace import export_workspace, gzip_chunks, import_workspace
+from main.utils.exceptons import DBNotFound
+
+
+async def _collect(chunks) -> list[bytes]:
+    return [chunk async for chunk in chunks]
+
+
+async def _stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestWorkspace:
+
+    @staticmethod
+    def make_db() -> MemoryDbApi:
+        return MemoryDbApi(
+            users=[db_test.TestDB.test_user_const],
+            themes=[db_test.TestDB.test_theme_cons, db_test.TestDB.test_theme_flex],
+            notes=[db_test.TestDB.test_note_cons],
+            notions=[db_test.TestDB.test_notion_cons]
+        )
+
+    async def test_export_import(self):
+        """Positive test | exported workspace is imported to empty db as is"""
+        source = self.make_db()
+        chunks = await _collect(export_workspace(source, db_test.TestDB.test_user_const.id, batch_size=1))
+        target = MemoryDbApi()
+        result = await import_workspace(target, _stream(*chunks), batch_size=1)
+
+        assert result.inserted_counts == {"users": 1, "themes": 2, "notes": 1, "notions": 1}
+        assert await target.get_note(db_test.TestDB.test_note_cons.id) == db_test.TestDB.test_note_cons
+        assert await target.get_theme(db_test.TestDB.test_theme_flex.id) == db_test.TestDB.test_theme_flex
+
+    async def test_export_import_gzip(self):
+        """Positive test | gzip stream split at arbitrary bytes is imported, existing ids are reported"""
+        db = self.make_db()
+        data = b"".join(await _collect(gzip_chunks(export_workspace(db, db_test.TestDB.test_user_const.id))))
+        result = await import_workspace(db, _stream(*(data[i:i + 7] for i in range(0, len(data), 7))))
+        assert result.inserted_counts == {"users": 0, "themes": 0, "notes": 0, "notions": 0}
+        assert result.duplicate_ids["themes"] == [1, 2]
+
+    async def test_import_gzip_first_chunk_of_one_byte(self):
+        """Positive test | gzip is detected when the magic bytes come in separate chunks"""
+        source = self.make_db()
+        data = b"".join(await _collect(gzip_chunks(export_workspace(source, db_test.TestDB.test_user_const.id))))
+        result = await import_workspace(MemoryDbApi(), _stream(b"", data[:1], data[1:]))
+        assert result.inserted_counts == {"users": 1, "themes": 2, "notes": 1, "notions": 1}
+
+    async def test_export_user_not_found(self):
+        """Negative test | export of non-exist user"""
+        with pytest.raises(DBNotFound):
+            await _collect(export_workspace(MemoryDbApi(), db_test.TestDB.non_exist_id))
+
+    async def test_import_malformed_line(self):
+        """Negative test | line is not a workspace document"""
+        with pytest.raises(ValueError):
+            await import_workspace(MemoryDbApi(), _stream(b'{"collection": "notes", "doc": {"_id": 1}}\n'))
+
+    def test_routes(self):
+        """Positive test | export workspace by http and import it for the same user only"""
+        app = FastAPI()
+        app.include_router(workspace.router)
+        app.state.db = self.make_db()
+        client = TestClient(app)
+        user_id = db_test.TestDB.test_user_const.id
+
+        exported = client.get(f"/users/{user_id}/workspace/export", params={"gzip": True})
+        assert exported.status_code == 200
+        assert client.get(f"/users/{db_test.TestDB.non_exist_id}/workspace/export").status_code == 404
+
+        app.state.db = MemoryDbApi()
+        assert client.post(f"/users/{user_id + 1}/workspace/import", content=exported.content).status_code == 422
+        imported = client.post(f"/users/{user_id}/workspace/import", content=exported.content)
+        assert imported.json()["inserted_counts"]["notes"] == 1
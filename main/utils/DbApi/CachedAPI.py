@@ -0,0 +1,360 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Hashable
+
+from pydantic import BaseModel
+
+from main.models.db_models import BulkWriteResult, BulkDeleteResult, CacheStats, NotionPage, PurgeResult, \
+    SearchPage, ThemeTreeNode, UserSummary
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel, CheckPointModel
+from main.utils.DbApi.MongoAPI import DbApi, BULK_CHUNK_SIZE, USER_OWNED_COLLECTIONS
+
+logger = logging.getLogger("app.db.cache")
+
+_MISSING = object()
+
+
+class CacheLimits(BaseModel):
+    """Size limit and time to live (seconds) of one entity cache"""
+    max_size: int
+    ttl: float
+
+
+DEFAULT_LIMITS = {
+    "users": CacheLimits(max_size=10_000, ttl=300),
+    "themes": CacheLimits(max_size=10_000, ttl=60),
+    "notes": CacheLimits(max_size=5_000, ttl=30),
+    "notions": CacheLimits(max_size=10_000, ttl=30),
+}
+
+
+class TTLCache:
+    """LRU cache with the same time to live for every entry"""
+
+    def __init__(self, limits: CacheLimits, clock: Callable[[], float] = time.monotonic):
+        self._max_size = limits.max_size
+        self._ttl = limits.ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> object:
+        """Get value by key or _MISSING if there is no fresh value"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < self._clock():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: object) -> None:
+        self._data[key] = (self._clock() + self._ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[object], bool]) -> None:
+        """Remove all entries with value matching predicate"""
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class CachedDbApi(DbApi):
+    """Read-through cache for single obj getters in front of any DbApi implementation.
+
+    Concurrent misses for one id share a single query to the wrapped db.
+    Cached entries are invalidated by writes and deletes made through this wrapper,
+    writes made around it are visible after entry ttl.
+    Returned models are shared between callers and must be treated as read-only"""
+
+    def __init__(
+            self,
+            db: DbApi,
+            limits: dict[str, CacheLimits] | None = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self._db = db
+        limits = DEFAULT_LIMITS | (limits or {})
+        self._caches = {entity: TTLCache(entity_limits, clock) for entity, entity_limits in limits.items()}
+        self._in_flight: dict[tuple[str, int], asyncio.Task] = dict()
+
+    def get_stats(self) -> list[CacheStats]:
+        return [
+            CacheStats(entity=entity, size=len(cache), hits=cache.hits, misses=cache.misses, evictions=cache.evictions)
+            for entity, cache in self._caches.items()
+        ]
+
+    def clear(self) -> None:
+        for cache in self._caches.values():
+            cache.clear()
+        self._in_flight.clear()
+
+    async def _get(self, entity: str, obj_id: int, loader: Callable[[int], Awaitable[BaseModel]]) -> BaseModel:
+        cache = self._caches[entity]
+        value = cache.get(obj_id)
+        if value is not _MISSING:
+            return value
+
+        key = (entity, obj_id)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader(obj_id))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._on_loaded(key, done))
+        # Shield shared query from cancellation of a single waiter
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, key: tuple[str, int], task: asyncio.Task) -> None:
+        # Entry invalidated while loading has been removed from _in_flight, its result may be stale
+        if self._in_flight.get(key) is not task:
+            return
+        del self._in_flight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._caches[key[0]].put(key[1], task.result())
+
+    def _invalidate(self, entity: str, obj_ids: list[int]) -> None:
+        cache = self._caches[entity]
+        for obj_id in obj_ids:
+            cache.pop(obj_id)
+            self._in_flight.pop((entity, obj_id), None)
+
+    # ----- Getters ----- #
+    async def get_user(self, user_id: int) -> UserModel:
+        return await self._get("users", user_id, self._db.get_user)
+
+    async def get_theme(self, theme_id: int) -> ThemeModel:
+        return await self._get("themes", theme_id, self._db.get_theme)
+
+    async def get_note(self, note_id: int) -> NoteModel:
+        return await self._get("notes", note_id, self._db.get_note)
+
+    async def get_notion(self, notion_id: int) -> NotionModel:
+        return await self._get("notions", notion_id, self._db.get_notion)
+
+    # ----- Writes ----- #
+    async def write_new_user(self, user: UserModel) -> int:
+        self._invalidate("users", [user.id])
+        return await self._db.write_new_user(user)
+
+    async def write_new_theme(self, theme: ThemeModel) -> int:
+        self._invalidate("themes", [theme.id])
+        return await self._db.write_new_theme(theme)
+
+    async def write_new_note(self, note: NoteModel) -> int:
+        self._invalidate("notes", [note.id])
+        return await self._db.write_new_note(note)
+
+    async def write_new_notion(self, notion: NotionModel) -> int:
+        self._invalidate("notions", [notion.id])
+        return await self._db.write_new_notion(notion)
+
+    async def write_many_users(self, users: list[UserModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        self._invalidate("users", [user.id for user in users])
+        return await self._db.write_many_users(users, chunk_size)
+
+    async def write_many_themes(self, themes: list[ThemeModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        self._invalidate("themes", [theme.id for theme in themes])
+        return await self._db.write_many_themes(themes, chunk_size)
+
+    async def write_many_notes(self, notes: list[NoteModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        self._invalidate("notes", [note.id for note in notes])
+        return await self._db.write_many_notes(notes, chunk_size)
+
+    async def write_many_notions(self, notions: list[NotionModel],
+                                 chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        self._invalidate("notions", [notion.id for notion in notions])
+        return await self._db.write_many_notions(notions, chunk_size)
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        try:
+            return await self._db.set_notions_next_time(schedule, expected_times)
+        finally:
+            self._invalidate("notions", list(schedule))
+
+    async def reschedule_notion(self, notion_id: int, next_time: datetime.datetime | None,
+                                expected: dict | None = None) -> int:
+        try:
+            return await self._db.reschedule_notion(notion_id, next_time, expected)
+        finally:
+            self._invalidate("notions", [notion_id])
+
+    # ----- Partial updates ----- #
+    async def update_note_fields(self, note_id: int, fields: dict, expected: dict | None = None) -> int:
+        try:
+            return await self._db.update_note_fields(note_id, fields, expected)
+        finally:
+            self._invalidate("notes", [note_id])
+
+    async def append_check_point(self, note_id: int, check_point: CheckPointModel,
+                                 expected: dict | None = None) -> int:
+        try:
+            return await self._db.append_check_point(note_id, check_point, expected)
+        finally:
+            self._invalidate("notes", [note_id])
+
+    async def remove_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> int:
+        try:
+            return await self._db.remove_check_point(note_id, index, key, expected)
+        finally:
+            self._invalidate("notes", [note_id])
+
+    async def toggle_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> bool:
+        try:
+            return await self._db.toggle_check_point(note_id, index, key, expected)
+        finally:
+            self._invalidate("notes", [note_id])
+
+    # ----- Deletes ----- #
+    async def delete_user(self, user_id: int) -> int:
+        try:
+            return await self._db.delete_user(user_id)
+        finally:
+            self._invalidate("users", [user_id])
+
+    async def delete_theme(self, theme_id: int) -> int:
+        try:
+            return await self._db.delete_theme(theme_id)
+        finally:
+            self._invalidate("themes", [theme_id])
+
+    async def delete_notion(self, notion_id: int) -> int:
+        try:
+            return await self._db.delete_notion(notion_id)
+        finally:
+            self._invalidate("notions", [notion_id])
+
+    async def delete_note(self, note_id: int) -> int:
+        try:
+            return await self._db.delete_note(note_id)
+        finally:
+            self._invalidate("notes", [note_id])
+
+    async def purge_user(self, user_id: int, use_transaction: bool | None = None,
+                         on_progress: Callable[[str, int], None] | None = None) -> PurgeResult:
+        """Ids of purged objects are not known, so cached objects of the user are found by user_id
+        and loads in progress of owned entities are dropped"""
+        try:
+            return await self._db.purge_user(user_id, use_transaction, on_progress)
+        finally:
+            self._invalidate("users", [user_id])
+            for entity in USER_OWNED_COLLECTIONS:
+                self._caches[entity].pop_where(lambda obj: obj.user_id == user_id)
+            self._in_flight = {key: task for key, task in self._in_flight.items()
+                               if key[0] not in USER_OWNED_COLLECTIONS}
+
+    async def delete_many_users(self, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        try:
+            return await self._db.delete_many_users(user_ids, chunk_size)
+        finally:
+            self._invalidate("users", user_ids)
+
+    async def delete_many_themes(self, theme_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        try:
+            return await self._db.delete_many_themes(theme_ids, chunk_size)
+        finally:
+            self._invalidate("themes", theme_ids)
+
+    async def delete_many_notes(self, note_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        try:
+            return await self._db.delete_many_notes(note_ids, chunk_size)
+        finally:
+            self._invalidate("notes", note_ids)
+
+    async def delete_many_notions(self, notion_ids: list[int],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        try:
+            return await self._db.delete_many_notions(notion_ids, chunk_size)
+        finally:
+            self._invalidate("notions", notion_ids)
+
+    # ----- Not cached ----- #
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        return await self._db.reserve_id_block(entity, size)
+
+    async def get_notions_in_window(self, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                                    limit: int = 100, cursor: str | None = None) -> NotionPage:
+        return await self._db.get_notions_in_window(user_id, start, end, limit, cursor)
+
+    async def get_user_summary(self, user_id: int) -> UserSummary:
+        return await self._db.get_user_summary(user_id)
+
+    async def rebuild_user_summaries(self, user_ids: list[int] | None = None) -> int:
+        return await self._db.rebuild_user_summaries(user_ids)
+
+    async def search_themes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        return await self._db.search_themes(user_id, query, limit, offset)
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        return await self._db.search_notes(user_id, query, limit, offset)
+
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        return await self._db.get_users_by_ids(user_ids)
+
+    async def get_themes_by_ids(self, theme_ids: list[int]) -> list[ThemeModel]:
+        return await self._db.get_themes_by_ids(theme_ids)
+
+    async def get_notes_by_ids(self, note_ids: list[int]) -> list[NoteModel]:
+        return await self._db.get_notes_by_ids(note_ids)
+
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        return await self._db.get_notions_by_ids(notion_ids)
+
+    async def get_all_themes_by_condition(self, condition: dict,
+                                          fields: list[str] | None = None) -> list[ThemeModel]:
+        return await self._db.get_all_themes_by_condition(condition, fields=fields)
+
+    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100,
+                                         fields: list[str] | None = None) -> list[NoteModel]:
+        return await self._db.get_all_notes_by_condition(condition, list_length, fields)
+
+    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[NotionModel]:
+        return await self._db.get_all_notion_by_condition(condition, list_length, fields)
+
+    def iter_users_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[UserModel]]:
+        return self._db.iter_users_by_condition(condition, batch_size, start_after, fields)
+
+    def iter_themes_by_condition(self, condition: dict, batch_size: int = 100,
+                                 start_after: int | None = None,
+                                 fields: list[str] | None = None) -> AsyncIterator[list[ThemeModel]]:
+        return self._db.iter_themes_by_condition(condition, batch_size, start_after, fields)
+
+    def iter_notes_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[NoteModel]]:
+        return self._db.iter_notes_by_condition(condition, batch_size, start_after, fields)
+
+    def iter_notions_by_condition(self, condition: dict, batch_size: int = 100,
+                                  start_after: int | None = None,
+                                  fields: list[str] | None = None) -> AsyncIterator[list[NotionModel]]:
+        return self._db.iter_notions_by_condition(condition, batch_size, start_after, fields)
+
+    async def get_theme_tree(self, user_id: int | None = None, root_theme_id: int | None = None,
+                             max_depth: int | None = None) -> list[ThemeTreeNode]:
+        return await self._db.get_theme_tree(user_id, root_theme_id, max_depth)
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        return await self._db.get_notions_due_before(until, limit)
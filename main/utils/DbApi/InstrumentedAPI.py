@@ -0,0 +1,92 @@
+import time
+from typing import AsyncIterator
+
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.exceptons import DBNotFound, DBConflict
+from main.utils.metrics import DB_OPERATION_SECONDS, DB_OPERATIONS_IN_FLIGHT
+
+
+class _OperationMetrics:
+    """Metric children of one operation resolved once, so the hot path does no label lookups"""
+    __slots__ = ("in_flight", "ok", "not_found", "conflict", "error")
+
+    def __init__(self, operation: str):
+        self.in_flight = DB_OPERATIONS_IN_FLIGHT.labels(operation)
+        self.ok = DB_OPERATION_SECONDS.labels(operation, "ok")
+        self.not_found = DB_OPERATION_SECONDS.labels(operation, "not_found")
+        self.conflict = DB_OPERATION_SECONDS.labels(operation, "conflict")
+        self.error = DB_OPERATION_SECONDS.labels(operation, "error")
+
+    def observe(self, started: float, error: BaseException | None = None) -> None:
+        elapsed = time.perf_counter() - started
+        if error is None:
+            self.ok.observe(elapsed)
+        elif isinstance(error, DBNotFound):
+            self.not_found.observe(elapsed)
+        elif isinstance(error, DBConflict):
+            self.conflict.observe(elapsed)
+        else:
+            self.error.observe(elapsed)
+
+
+def _instrument_call(operation: str):
+    metrics = _OperationMetrics(operation)
+
+    async def call(self, *args, **kwargs):
+        metrics.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            result = await getattr(self._db, operation)(*args, **kwargs)
+        except BaseException as err:
+            metrics.observe(started, err)
+            raise
+        finally:
+            metrics.in_flight.dec()
+        metrics.observe(started)
+        return result
+
+    call.__name__ = operation
+    return call
+
+
+def _instrument_iter(operation: str):
+    """Async generators are timed per batch, time the caller spends between batches is not counted"""
+    metrics = _OperationMetrics(operation)
+
+    async def iterate(self, *args, **kwargs) -> AsyncIterator:
+        batches = getattr(self._db, operation)(*args, **kwargs).__aiter__()
+        while True:
+            metrics.in_flight.inc()
+            started = time.perf_counter()
+            try:
+                batch = await batches.__anext__()
+            except StopAsyncIteration:
+                metrics.observe(started)
+                return
+            except BaseException as err:
+                metrics.observe(started, err)
+                raise
+            finally:
+                metrics.in_flight.dec()
+            metrics.observe(started)
+            yield batch
+
+    iterate.__name__ = operation
+    return iterate
+
+
+class InstrumentedDbApi(DbApi):
+    """Record duration and in-flight count of every DbApi call of wrapped db to metrics registry.
+    Wrappers are generated for the whole DbApi contract, so new methods are instrumented too"""
+
+    def __init__(self, db: DbApi):
+        self._db = db
+
+
+for _name in list(vars(DbApi)):
+    if _name.startswith("_") or not callable(getattr(DbApi, _name)):
+        continue
+    setattr(
+        InstrumentedDbApi, _name,
+        _instrument_iter(_name) if _name.startswith("iter_") else _instrument_call(_name)
+    )
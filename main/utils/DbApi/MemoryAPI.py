@@ -0,0 +1,601 @@
+import bisect
+import datetime
+import logging
+from collections import deque
+from typing import AsyncIterator, Callable, Iterable
+
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+from main.models.db_models import BulkWriteResult, BulkDeleteResult, NotionPage, PurgeResult, SearchPage, \
+    ThemeTreeNode, UserSummary
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel, CheckPointModel
+from main.utils.DbApi.MongoAPI import DbApi, BULK_CHUNK_SIZE, DUPLICATE_KEY_CODE, USER_OWNED_COLLECTIONS
+from main.utils.DbApi.hydration import hydrate, projection
+from main.utils.DbApi.indexes import SEARCH_FIELDS
+from main.utils.DbApi.query import matches, equality_values, range_bounds
+from main.utils.DbApi.search import SearchIndex, check_page_args, search_page
+from main.utils.DbApi.summaries import SummaryIndex
+from main.utils.DbApi.tree import build_theme_tree
+from main.utils.DbApi.updates import validate_note_fields, check_point_selector
+from main.utils.DbApi.window import check_window_args, notion_page, window_condition
+from main.utils.exceptons import DBNotFound, DBConflict
+
+logger = logging.getLogger("app.db.memory")
+
+# Fields with hash (equality) and sorted (range) secondary indexes per collection
+HASH_INDEXES = {
+    "users": ["tg_id"],
+    "themes": ["user_id", "parent_id"],
+    "notions": ["user_id", "parent_id"],
+    "notes": ["user_id", "notion_id"],
+}
+SORTED_INDEXES = {
+    "notions": ["next_notion_time"],
+}
+
+
+def _clone(value: object) -> object:
+    """Copy nested dicts and lists of a document, scalars are immutable and shared"""
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+class MemoryCollection:
+    """Documents by _id with secondary indexes.
+    Hash indexes map field value to ids, sorted indexes keep (value, _id) pairs
+    of documents where the value is set, ordered for range scans"""
+
+    def __init__(self, name: str, hash_fields: list[str], sorted_fields: list[str],
+                 text_fields: dict[str, int] | None = None, summary_index: SummaryIndex | None = None):
+        self.name = name
+        self._docs: dict[int, dict] = dict()
+        self._hash_indexes: dict[str, dict[object, set[int]]] = {field: dict() for field in hash_fields}
+        self._sorted_indexes: dict[str, list[tuple[object, int]]] = {field: list() for field in sorted_fields}
+        self.text_index = SearchIndex(text_fields) if text_fields else None
+        self.summary_index = summary_index
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, doc_id: int) -> dict | None:
+        return self._docs.get(doc_id)
+
+    def insert(self, doc: dict) -> None:
+        doc_id = doc["_id"]
+        if doc_id in self._docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} dup key: {{ _id: {doc_id} }}",
+                DUPLICATE_KEY_CODE
+            )
+        self._docs[doc_id] = doc
+        self._index(doc)
+
+    def delete(self, doc_id: int) -> dict | None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is not None:
+            self._unindex(doc)
+        return doc
+
+    def set_fields(self, doc_id: int, fields: dict) -> bool:
+        """Set top level fields of document keeping indexes up to date, return False if no document"""
+        doc = self._docs.get(doc_id)
+        if doc is None:
+            return False
+        self._unindex(doc)
+        doc.update(fields)
+        self._index(doc)
+        return True
+
+    def update(self, doc_id: int, mutate: Callable[[dict], object]) -> object:
+        """Change document in place with mutate keeping indexes up to date, return what mutate returned"""
+        doc = self._docs[doc_id]
+        try:
+            self._unindex(doc)
+            return mutate(doc)
+        finally:
+            self._index(doc)
+
+    def _index(self, doc: dict) -> None:
+        for field, index in self._hash_indexes.items():
+            index.setdefault(doc.get(field), set()).add(doc["_id"])
+        for field, index in self._sorted_indexes.items():
+            if doc.get(field) is not None:
+                bisect.insort(index, (doc[field], doc["_id"]))
+        if self.text_index is not None:
+            self.text_index.add(doc)
+        if self.summary_index is not None:
+            self.summary_index.add(self.name, doc)
+
+    def _unindex(self, doc: dict) -> None:
+        for field, index in self._hash_indexes.items():
+            ids = index.get(doc.get(field))
+            if ids is not None:
+                ids.discard(doc["_id"])
+                if not ids:
+                    del index[doc.get(field)]
+        for field, index in self._sorted_indexes.items():
+            if doc.get(field) is not None:
+                position = bisect.bisect_left(index, (doc[field], doc["_id"]))
+                if position < len(index) and index[position] == (doc[field], doc["_id"]):
+                    del index[position]
+        if self.text_index is not None:
+            self.text_index.remove(doc)
+        if self.summary_index is not None:
+            self.summary_index.remove(self.name, doc)
+
+    def _candidate_ids(self, condition: dict) -> Iterable[int]:
+        """Pick the narrowest index for condition, fall back to the full scan"""
+        ids = equality_values(condition, "_id")
+        if ids is not None:
+            return set(ids)
+        for field, index in self._hash_indexes.items():
+            values = equality_values(condition, field)
+            if values is not None:
+                return set().union(*(index.get(value, ()) for value in values))
+        for field, index in self._sorted_indexes.items():
+            bounds = range_bounds(condition, field)
+            if bounds is not None:
+                return [doc_id for _, doc_id in self._range(index, *bounds)]
+        return self._docs.keys()
+
+    @staticmethod
+    def _range(index: list[tuple[object, int]], lower: object, upper: object) -> list[tuple[object, int]]:
+        start = 0 if lower is None else bisect.bisect_left(index, (lower,))
+        # (upper, inf) sorts after every pair with value == upper
+        end = len(index) if upper is None else bisect.bisect_right(index, (upper, float("inf")))
+        return index[start:end]
+
+    def find(self, condition: dict, limit: int | None = None, start_after: int | None = None) -> list[dict]:
+        """Up to limit documents matching condition with _id > start_after, ordered by _id"""
+        ids = sorted(self._candidate_ids(condition))
+        if start_after is not None:
+            ids = ids[bisect.bisect_right(ids, start_after):]
+        result = list()
+        for doc_id in ids:
+            doc = self._docs.get(doc_id)
+            if doc is not None and matches(doc, condition):
+                result.append(doc)
+                if len(result) == limit:
+                    break
+        return result
+
+    def scan_sorted(self, field: str, lower: object = None, upper: object = None) -> list[dict]:
+        """Documents with field in [lower, upper] ordered by (field, _id) from sorted index"""
+        return [self._docs[doc_id] for _, doc_id in self._range(self._sorted_indexes[field], lower, upper)]
+
+    def ids(self) -> Iterable[int]:
+        return self._docs.keys()
+
+    def ids_by(self, field: str, value: object) -> set[int]:
+        """Ids of documents with field == value from hash index"""
+        return self._hash_indexes[field].get(value, set())
+
+
+class MemoryDbApi(DbApi):
+    """In-process DbApi for tests, benchmarks and local development.
+    Behaves like MongoDbApi: the same errors, ordering and 100 documents cap of get_all_* methods.
+    Documents are stored as dicts and copied on read and write like they would be by a driver"""
+    _collections: dict[str, MemoryCollection]
+
+    def __init__(
+            self,
+            users: list[UserModel] = (),
+            themes: list[ThemeModel] = (),
+            notes: list[NoteModel] = (),
+            notions: list[NotionModel] = (),
+            strict_reads: bool = False
+    ):
+        self._strict_reads = strict_reads
+        self._summaries = SummaryIndex(lambda user_id: self._collections["users"].get(user_id) is not None)
+        self._collections = {
+            name: MemoryCollection(
+                name, HASH_INDEXES.get(name, []), SORTED_INDEXES.get(name, []), SEARCH_FIELDS.get(name),
+                self._summaries if name in USER_OWNED_COLLECTIONS else None
+            )
+            for name in ("users", "themes", "notions", "notes")
+        }
+        self._counters: dict[str, int] = dict()
+        for collection, objs in (("users", users), ("themes", themes), ("notes", notes), ("notions", notions)):
+            for obj in objs:
+                self._collections[collection].insert(obj.dict(by_alias=True))
+
+    def _hydrate(self, model: type[BaseModel], doc: dict, fields: list[str] | None = None) -> BaseModel:
+        fields_projection = None if self._strict_reads else projection(model, fields)
+        if fields_projection is not None:
+            doc = {key: value for key, value in doc.items() if key == "_id" or key in fields_projection}
+        return hydrate(model, _clone(doc), self._strict_reads)
+
+    def _get(self, collection: str, model: type[BaseModel], obj_id: int, entity: str) -> BaseModel:
+        doc = self._collections[collection].get(obj_id)
+        if doc is None:
+            logger.error("No %s found with id: %s", entity, obj_id)
+            raise DBNotFound(f"No {entity} found with id: {obj_id}")
+        return self._hydrate(model, doc)
+
+    def _get_by_ids(self, collection: str, model: type[BaseModel], ids: list[int]) -> list:
+        docs = (self._collections[collection].get(obj_id) for obj_id in dict.fromkeys(ids))
+        return [self._hydrate(model, doc) for doc in docs if doc is not None]
+
+    def _write(self, collection: str, obj: BaseModel, entity: str) -> int:
+        try:
+            self._collections[collection].insert(obj.dict(by_alias=True))
+            logger.info("Success write %s with id: %s to db", entity, obj.id)
+        except DuplicateKeyError as err:
+            logger.error("Can't write %s with id: %s, DuplicateKey: %s", entity, obj.id, err)
+            raise err
+        return obj.id
+
+    def _delete(self, collection: str, obj_id: int, entity: str) -> int:
+        if self._collections[collection].delete(obj_id) is None:
+            logger.error("Not found %s with id: %s", entity, obj_id)
+            raise DBNotFound(f"Not found {entity} with id: {obj_id}")
+        return obj_id
+
+    def _get_all(self, collection: str, model: type[BaseModel], condition: dict,
+                 fields: list[str] | None, list_length: int, entity: str) -> list:
+        docs = self._collections[collection].find(condition, limit=list_length)
+        if not docs:
+            logger.error("No %s found setting conditions: %s", entity, condition)
+            raise DBNotFound(f"No {entity} found setting conditions: {condition}")
+        return [self._hydrate(model, doc, fields) for doc in docs]
+
+    async def _iter_by_condition(self, collection: str, model: type[BaseModel], condition: dict,
+                                 batch_size: int, start_after: int | None,
+                                 fields: list[str] | None) -> AsyncIterator[list]:
+        if batch_size <= 0:
+            raise ValueError(f"batch_size must be positive, got: {batch_size}")
+        while True:
+            docs = self._collections[collection].find(condition, limit=batch_size, start_after=start_after)
+            if not docs:
+                return
+            yield [self._hydrate(model, doc, fields) for doc in docs]
+            if len(docs) < batch_size:
+                return
+            start_after = docs[-1]["_id"]
+
+    def _write_many(self, collection: str, objs: list[BaseModel]) -> BulkWriteResult:
+        result = BulkWriteResult()
+        for obj in objs:
+            try:
+                self._collections[collection].insert(obj.dict(by_alias=True))
+                result.inserted_ids.append(obj.id)
+            except DuplicateKeyError:
+                result.duplicate_ids.append(obj.id)
+        if result.duplicate_ids:
+            logger.error("Can't write %s with ids: %s, DuplicateKey", collection, result.duplicate_ids)
+        return result
+
+    def _delete_many(self, collection: str, ids: list[int]) -> BulkDeleteResult:
+        result = BulkDeleteResult(requested_count=len(ids))
+        for obj_id in ids:
+            if self._collections[collection].delete(obj_id) is not None:
+                result.deleted_count += 1
+        return result
+
+    def _update(self, collection: str, obj_id: int, entity: str, condition: dict,
+                expected: dict | None, mutate: Callable[[dict], object]) -> object:
+        """Same checks as MongoDbApi._update_one, then change document with mutate"""
+        doc = self._collections[collection].get(obj_id)
+        if doc is None:
+            logger.error("Not found %s with id: %s", entity, obj_id)
+            raise DBNotFound(f"Not found {entity} with id: {obj_id}")
+        if not matches(doc, {"$and": [condition, expected or dict()]}):
+            logger.warning("Conflict on update of %s with id: %s", entity, obj_id)
+            raise DBConflict(f"{entity.capitalize()} with id: {obj_id} doesn't match expected state")
+        return self._collections[collection].update(obj_id, mutate)
+
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        if entity not in self._collections:
+            raise ValueError(f"Unknown entity: {entity}")
+        if size <= 0:
+            raise ValueError(f"size must be positive, got: {size}")
+        if entity not in self._counters:
+            self._counters[entity] = max(self._collections[entity].ids(), default=0)
+        self._counters[entity] += size
+        return self._counters[entity] - size + 1
+
+    def _search(self, collection: str, user_id: int, query: str, limit: int, offset: int) -> SearchPage:
+        check_page_args(limit, offset)
+        docs = self._collections[collection]
+        hits = docs.text_index.search(user_id, query, offset + limit + 1)[offset:]
+        return search_page([(score, docs.get(doc_id)) for score, doc_id in hits], docs.text_index.fields,
+                           query, limit, offset)
+
+    # ----- Users ----- #
+    async def get_user(self, user_id: int) -> UserModel:
+        return self._get("users", UserModel, user_id, "user")
+
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        return self._get_by_ids("users", UserModel, user_ids)
+
+    async def write_new_user(self, user: UserModel) -> int:
+        self._write("users", user, "user")
+        self._rebuild_summaries([user.id])
+        return user.id
+
+    async def delete_user(self, user_id: int) -> int:
+        self._delete("users", user_id, "user")
+        self._summaries.clear(user_id)
+        return user_id
+
+    async def iter_users_by_condition(self, condition: dict, batch_size: int = 100,
+                                      start_after: int | None = None,
+                                      fields: list[str] | None = None) -> AsyncIterator[list[UserModel]]:
+        async for batch in self._iter_by_condition(
+                "users", UserModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def write_many_users(self, users: list[UserModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        result = self._write_many("users", users)
+        self._rebuild_summaries(result.inserted_ids)
+        return result
+
+    async def delete_many_users(self, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        result = self._delete_many("users", user_ids)
+        for user_id in user_ids:
+            self._summaries.clear(user_id)
+        return result
+
+    async def purge_user(self, user_id: int, use_transaction: bool | None = None,
+                         on_progress: Callable[[str, int], None] | None = None) -> PurgeResult:
+        """Same as MongoDbApi.purge_user, owned documents are found by user_id index.
+        Purge is atomic here, like in a transaction"""
+        result = PurgeResult(user_id=user_id, used_transaction=bool(use_transaction))
+        for collection in USER_OWNED_COLLECTIONS:
+            docs = self._collections[collection]
+            doc_ids = list(docs.ids_by("user_id", user_id))
+            for doc_id in doc_ids:
+                docs.delete(doc_id)
+            result.deleted_counts[collection] = len(doc_ids)
+            if on_progress is not None:
+                on_progress(collection, len(doc_ids))
+        result.deleted_counts["users"] = int(self._collections["users"].delete(user_id) is not None)
+        self._summaries.clear(user_id)
+        if on_progress is not None:
+            on_progress("users", result.deleted_counts["users"])
+        return result
+
+    async def get_user_summary(self, user_id: int) -> UserSummary:
+        """Same as MongoDbApi.get_user_summary, summaries are kept by collection index hooks"""
+        if self._collections["users"].get(user_id) is None:
+            logger.error("No summary found for user with id: %s", user_id)
+            raise DBNotFound(f"No summary found for user with id: {user_id}")
+        return self._hydrate(UserSummary, self._summaries.get(user_id))
+
+    def _rebuild_summaries(self, user_ids: Iterable[int]) -> None:
+        """Count documents of users from scratch, e.g. ones written before their user"""
+        for user_id in user_ids:
+            self._summaries.clear(user_id)
+            for collection in USER_OWNED_COLLECTIONS:
+                docs = self._collections[collection]
+                for doc_id in docs.ids_by("user_id", user_id):
+                    self._summaries.add(collection, docs.get(doc_id))
+
+    async def rebuild_user_summaries(self, user_ids: list[int] | None = None) -> int:
+        """Recount summaries of user_ids (None - all users) from their documents"""
+        users = self._collections["users"]
+        if user_ids is None:
+            user_ids = list(users.ids())
+        self._rebuild_summaries(user_ids)
+        return sum(1 for user_id in set(user_ids) if users.get(user_id) is not None)
+
+    # ----- Themes ----- #
+    async def get_theme(self, theme_id: int) -> ThemeModel:
+        return self._get("themes", ThemeModel, theme_id, "theme")
+
+    async def get_themes_by_ids(self, theme_ids: list[int]) -> list[ThemeModel]:
+        return self._get_by_ids("themes", ThemeModel, theme_ids)
+
+    async def write_new_theme(self, theme: ThemeModel) -> int:
+        return self._write("themes", theme, "theme")
+
+    async def get_all_themes_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[ThemeModel]:
+        return self._get_all("themes", ThemeModel, condition, fields, list_length, "themes")
+
+    async def iter_themes_by_condition(self, condition: dict, batch_size: int = 100,
+                                       start_after: int | None = None,
+                                       fields: list[str] | None = None) -> AsyncIterator[list[ThemeModel]]:
+        async for batch in self._iter_by_condition(
+                "themes", ThemeModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def get_theme_tree(self, user_id: int | None = None, root_theme_id: int | None = None,
+                             max_depth: int | None = None) -> list[ThemeTreeNode]:
+        """Same as MongoDbApi.get_theme_tree, walks parent_id index breadth first"""
+        if (user_id is None) == (root_theme_id is None):
+            raise ValueError("Exactly one of user_id and root_theme_id must be set")
+        if max_depth is not None and max_depth < 0:
+            raise ValueError(f"max_depth must not be negative, got: {max_depth}")
+
+        themes = self._collections["themes"]
+        if root_theme_id is not None:
+            root = themes.get(root_theme_id)
+            roots = [root] if root is not None else []
+        else:
+            roots = themes.find({"user_id": user_id, "is_sub_theme": False})
+        if not roots:
+            condition = {"_id": root_theme_id} if root_theme_id is not None else {"user_id": user_id}
+            logger.error("No root themes found setting condition: %s", condition)
+            raise DBNotFound(f"No root themes found setting condition: {condition}")
+
+        descendants = list()
+        seen = {root["_id"] for root in roots}
+        queue = deque((root["_id"], 0) for root in roots)
+        while queue:
+            parent_id, depth = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for child_id in sorted(themes.ids_by("parent_id", parent_id)):
+                child = themes.get(child_id)
+                if child_id in seen or user_id is not None and child["user_id"] != user_id:
+                    continue
+                seen.add(child_id)
+                descendants.append(child)
+                queue.append((child_id, depth + 1))
+        return build_theme_tree(
+            [self._hydrate(ThemeModel, root) for root in roots],
+            [self._hydrate(ThemeModel, theme) for theme in descendants]
+        )
+
+    async def search_themes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        """Same as MongoDbApi.search_themes, ranked with BM25"""
+        return self._search("themes", user_id, query, limit, offset)
+
+    async def write_many_themes(self, themes: list[ThemeModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return self._write_many("themes", themes)
+
+    async def delete_many_themes(self, theme_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return self._delete_many("themes", theme_ids)
+
+    async def delete_theme(self, theme_id: int) -> int:
+        return self._delete("themes", theme_id, "theme")
+
+    # ----- Notions ----- #
+    async def get_notion(self, notion_id: int) -> NotionModel:
+        return self._get("notions", NotionModel, notion_id, "notion")
+
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        return self._get_by_ids("notions", NotionModel, notion_ids)
+
+    async def write_new_notion(self, notion: NotionModel) -> int:
+        return self._write("notions", notion, "notion")
+
+    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[NotionModel]:
+        return self._get_all("notions", NotionModel, condition, fields, list_length, "notions")
+
+    async def iter_notions_by_condition(self, condition: dict, batch_size: int = 100,
+                                        start_after: int | None = None,
+                                        fields: list[str] | None = None) -> AsyncIterator[list[NotionModel]]:
+        async for batch in self._iter_by_condition(
+                "notions", NotionModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        docs = self._collections["notions"].scan_sorted("next_notion_time", upper=until)[:limit]
+        return [self._hydrate(NotionModel, doc) for doc in docs]
+
+    async def get_notions_in_window(self, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                                    limit: int = 100, cursor: str | None = None) -> NotionPage:
+        """Same as MongoDbApi.get_notions_in_window, user notions are found by user_id index and sorted"""
+        check_window_args(start, end, limit)
+        docs = sorted(
+            self._collections["notions"].find(window_condition(user_id, start, end, cursor)),
+            key=lambda doc: (doc["next_notion_time"], doc["_id"])
+        )
+        return notion_page([self._hydrate(NotionModel, doc) for doc in docs[:limit + 1]], limit)
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        notions = self._collections["notions"]
+        modified_count = 0
+        expected_times = expected_times or dict()
+        for notion_id, next_time in schedule.items():
+            doc = notions.get(notion_id)
+            if doc is None or (notion_id in expected_times and doc["next_notion_time"] != expected_times[notion_id]):
+                continue
+            if doc["next_notion_time"] != next_time:
+                notions.set_fields(notion_id, {"next_notion_time": next_time})
+                modified_count += 1
+        return modified_count
+
+    async def reschedule_notion(self, notion_id: int, next_time: datetime.datetime | None,
+                                expected: dict | None = None) -> int:
+        self._update(
+            "notions", notion_id, "notion", dict(), expected,
+            lambda doc: doc.update(next_notion_time=next_time)
+        )
+        return notion_id
+
+    async def write_many_notions(self, notions: list[NotionModel],
+                                 chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return self._write_many("notions", notions)
+
+    async def delete_many_notions(self, notion_ids: list[int],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return self._delete_many("notions", notion_ids)
+
+    async def delete_notion(self, notion_id: int) -> int:
+        return self._delete("notions", notion_id, "notion")
+
+    # ----- Notes ----- #
+    async def write_new_note(self, note: NoteModel) -> int:
+        return self._write("notes", note, "note")
+
+    async def get_note(self, note_id: int) -> NoteModel:
+        return self._get("notes", NoteModel, note_id, "note")
+
+    async def get_notes_by_ids(self, note_ids: list[int]) -> list[NoteModel]:
+        return self._get_by_ids("notes", NoteModel, note_ids)
+
+    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100,
+                                         fields: list[str] | None = None) -> list[NoteModel]:
+        return self._get_all("notes", NoteModel, condition, fields, list_length, "notes")
+
+    async def iter_notes_by_condition(self, condition: dict, batch_size: int = 100,
+                                      start_after: int | None = None,
+                                      fields: list[str] | None = None) -> AsyncIterator[list[NoteModel]]:
+        async for batch in self._iter_by_condition(
+                "notes", NoteModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def write_many_notes(self, notes: list[NoteModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return self._write_many("notes", notes)
+
+    async def delete_many_notes(self, note_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return self._delete_many("notes", note_ids)
+
+    async def delete_note(self, note_id: int) -> int:
+        return self._delete("notes", note_id, "note")
+
+    async def update_note_fields(self, note_id: int, fields: dict, expected: dict | None = None) -> int:
+        values = _clone(validate_note_fields(fields))
+        self._update("notes", note_id, "note", dict(), expected, lambda doc: doc.update(values))
+        return note_id
+
+    async def append_check_point(self, note_id: int, check_point: CheckPointModel,
+                                 expected: dict | None = None) -> int:
+        self._update(
+            "notes", note_id, "note",
+            {"check_points.creation_time": {"$ne": check_point.creation_time}}, expected,
+            lambda doc: doc["check_points"].append(check_point.dict())
+        )
+        return note_id
+
+    async def remove_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> int:
+        def remove(doc: dict) -> None:
+            if index is not None:
+                del doc["check_points"][index]
+            else:
+                doc["check_points"] = [cp for cp in doc["check_points"] if cp["creation_time"] != key]
+
+        self._update("notes", note_id, "note", check_point_selector(index, key), expected, remove)
+        return note_id
+
+    async def toggle_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> bool:
+        def toggle(doc: dict) -> bool:
+            check_points = doc["check_points"]
+            if index is not None:
+                targets = [index]
+            else:
+                targets = [i for i, cp in enumerate(check_points) if cp["creation_time"] == key]
+            for i in targets:
+                check_points[i]["is_finish"] = not check_points[i]["is_finish"]
+            return check_points[targets[0]]["is_finish"]
+
+        return self._update("notes", note_id, "note", check_point_selector(index, key), expected, toggle)
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        """Same as MongoDbApi.search_notes, ranked with BM25"""
+        return self._search("notes", user_id, query, limit, offset)
@@ -1,16 +1,34 @@
 import asyncio
 import datetime
 import logging
+import time
+from typing import AsyncIterator, Callable
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import DuplicateKeyError
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 
-from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel
-from main.utils.config import MONGO_TEST_DB_CONNECTION_PATH
-from main.utils.exceptons import DBNotFound
+from main.models.db_models import BulkWriteResult, BulkDeleteResult, IndexUsage, NotionPage, PurgeResult, \
+    SearchPage, ThemeTreeNode, UserSummary
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel, CheckPointModel
+from main.utils.DbApi.hydration import hydrate, projection
+from main.utils.DbApi.indexes import INDEXES, NEXT_NOTION_TIME_FILTER, SEARCH_FIELDS
+from main.utils.DbApi.search import check_page_args, search_page
+from main.utils.DbApi.summaries import SUMMARY_COUNTERS, SUMMARY_FIELDS, summary_delta, check_point_delta, \
+    next_notion_key, earlier_key, is_postponed
+from main.utils.DbApi.tree import build_theme_tree
+from main.utils.DbApi.updates import validate_note_fields, check_point_selector
+from main.utils.DbApi.window import check_window_args, notion_page, window_condition
+from main.utils.exceptons import DBNotFound, DBConflict
 
 logger = logging.getLogger("app.db")
 
+BULK_CHUNK_SIZE = 1000
+DUPLICATE_KEY_CODE = 11000
+# Collections with documents owned by user through user_id field
+USER_OWNED_COLLECTIONS = ("themes", "notes", "notions")
+
 
 class DbApi:
 
@@ -29,6 +47,19 @@ class DbApi:
     async def get_notion(self, notion_id: int) -> NotionModel:
         raise NotImplementedError
 
+    #
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        raise NotImplementedError
+
+    async def get_themes_by_ids(self, theme_ids: list[int]) -> list[ThemeModel]:
+        raise NotImplementedError
+
+    async def get_notes_by_ids(self, note_ids: list[int]) -> list[NoteModel]:
+        raise NotImplementedError
+
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        raise NotImplementedError
+
     #
     async def write_new_user(self, user: UserModel):
         raise NotImplementedError
@@ -48,6 +79,10 @@ class DbApi:
     async def delete_user(self, user_id: int) -> int:
         raise NotImplementedError
 
+    async def purge_user(self, user_id: int, use_transaction: bool | None = None,
+                         on_progress: Callable[[str, int], None] | None = None) -> PurgeResult:
+        raise NotImplementedError
+
     async def delete_theme(self, theme_id: int) -> int:
         raise NotImplementedError
 
@@ -57,26 +92,142 @@ class DbApi:
     async def delete_note(self, note_id: int) -> int:
         raise NotImplementedError
 
-    async def get_all_themes_by_condition(self, condition: dict) -> list[ThemeModel]:
+    async def get_all_themes_by_condition(self, condition: dict,
+                                          fields: list[str] | None = None) -> list[ThemeModel]:
         raise NotImplementedError
     
-    async def get_all_notes_by_condition(self, condition: dict) -> list[NoteModel]:
+    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100,
+                                         fields: list[str] | None = None) -> list[NoteModel]:
         raise NotImplementedError
     
-    async def get_all_notion_by_condition(self, condition: dict) -> list[NotionModel]:
+    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[NotionModel]:
+        raise NotImplementedError
+
+    def iter_users_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[UserModel]]:
+        raise NotImplementedError
+
+    def iter_themes_by_condition(self, condition: dict, batch_size: int = 100,
+                                 start_after: int | None = None,
+                                 fields: list[str] | None = None) -> AsyncIterator[list[ThemeModel]]:
+        raise NotImplementedError
+
+    def iter_notes_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[NoteModel]]:
+        raise NotImplementedError
+
+    def iter_notions_by_condition(self, condition: dict, batch_size: int = 100,
+                                  start_after: int | None = None,
+                                  fields: list[str] | None = None) -> AsyncIterator[list[NotionModel]]:
+        raise NotImplementedError
+
+    async def write_many_users(self, users: list[UserModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        raise NotImplementedError
+
+    async def write_many_themes(self, themes: list[ThemeModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        raise NotImplementedError
+
+    async def write_many_notes(self, notes: list[NoteModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        raise NotImplementedError
+
+    async def write_many_notions(self, notions: list[NotionModel],
+                                 chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        raise NotImplementedError
+
+    async def delete_many_users(self, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        raise NotImplementedError
+
+    async def delete_many_themes(self, theme_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        raise NotImplementedError
+
+    async def delete_many_notes(self, note_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        raise NotImplementedError
+
+    async def delete_many_notions(self, notion_ids: list[int],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        raise NotImplementedError
+
+    async def get_theme_tree(self, user_id: int | None = None, root_theme_id: int | None = None,
+                             max_depth: int | None = None) -> list[ThemeTreeNode]:
+        raise NotImplementedError
+
+    async def search_themes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        raise NotImplementedError
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        raise NotImplementedError
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        raise NotImplementedError
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        raise NotImplementedError
+
+    async def get_notions_in_window(self, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                                    limit: int = 100, cursor: str | None = None) -> NotionPage:
+        raise NotImplementedError
+
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        raise NotImplementedError
+
+    async def get_user_summary(self, user_id: int) -> UserSummary:
+        raise NotImplementedError
+
+    async def rebuild_user_summaries(self, user_ids: list[int] | None = None) -> int:
+        raise NotImplementedError
+
+    async def reschedule_notion(self, notion_id: int, next_time: datetime.datetime | None,
+                                expected: dict | None = None) -> int:
+        raise NotImplementedError
+
+    async def update_note_fields(self, note_id: int, fields: dict, expected: dict | None = None) -> int:
+        raise NotImplementedError
+
+    async def append_check_point(self, note_id: int, check_point: CheckPointModel,
+                                 expected: dict | None = None) -> int:
+        raise NotImplementedError
+
+    async def remove_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> int:
+        raise NotImplementedError
+
+    async def toggle_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> bool:
         raise NotImplementedError
 
 
 class MongoDbApi(DbApi):
+    """DbApi over MongoDB.
+    Documents read from db were written through validated models, so by default they are
+    hydrated without validation; strict_reads=True validates every read (debug mode).
+    List reads accept fields to fetch and build only these model fields,
+    strict mode ignores fields as partial documents can't pass validation"""
     _client: AsyncIOMotorClient
     _collections: dict
 
-    def __init__(self, connection_string, is_test: bool = False):
-        self.connect_to_db(connection_string, is_test)
+    def __init__(self, connection_string: str | None = None, is_test: bool = False, strict_reads: bool = False,
+                 client: AsyncIOMotorClient | None = None, **client_options):
+        self._strict_reads = strict_reads
+        self.connect_to_db(connection_string, is_test, client, **client_options)
+
+    def _hydrate(self, model: type[BaseModel], doc: dict) -> BaseModel:
+        return hydrate(model, doc, self._strict_reads)
+
+    def _projection(self, model: type[BaseModel], fields: list[str] | None) -> dict | None:
+        return None if self._strict_reads else projection(model, fields)
 
-    def connect_to_db(self, connection_string: str, is_test: bool = False) -> None:
+    def connect_to_db(self, connection_string: str | None, is_test: bool = False,
+                      client: AsyncIOMotorClient | None = None, **client_options) -> None:
+        """Use shared client if given, else create own one.
+        client_options are passed to AsyncIOMotorClient as is, e.g. event_listeners or maxPoolSize"""
         # Connect client
-        self._client = AsyncIOMotorClient(connection_string)
+        if client is None:
+            client = AsyncIOMotorClient(connection_string, **client_options)
+        self._client = client
 
         # Connect db
         self._db = self._client.Test if is_test else self._client.Prod
@@ -88,25 +239,347 @@ class MongoDbApi(DbApi):
             "notions": self._db.Notions,
             "notes": self._db.Notes
         }
+        self._counters = self._db.Counters
+        self._summaries = self._db.Summaries
+        self._seeded_counters = set()
+        self._supports_transactions = None
+
+    async def warmup(self, connections: int) -> None:
+        """Open up to connections pool connections with concurrent pings,
+        so the first requests don't pay for TCP and auth handshakes"""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._client.admin.command("ping") for _ in range(connections)))
+        logger.info("Warmed up %s connections in %.3fs", connections, time.perf_counter() - started)
+
+    def close(self) -> None:
+        """Close all pool connections of client"""
+        self._client.close()
+        logger.info("Mongo client closed")
+
+    async def ensure_indexes(self) -> None:
+        """Create indexes from INDEXES spec for all collections.
+        Idempotent, existing indexes with the same spec are left as is, so it is safe to call on every startup"""
+        await asyncio.gather(*(
+            self._collections[collection].create_indexes(indexes)
+            for collection, indexes in INDEXES.items()
+        ))
+        logger.info("Indexes ensured for collections: %s", list(INDEXES))
+
+    async def _seed_id_counter(self, entity: str) -> None:
+        """Raise counter of entity to the current max _id, so ids written before the counter existed
+        are never handed out. $max never moves the counter back, so it is safe to run from every worker"""
+        docs = await self._collections[entity].find({}, {"_id": 1}).sort("_id", DESCENDING).limit(1).to_list(1)
+        await self._counters.update_one(
+            {"_id": entity}, {"$max": {"value": docs[0]["_id"] if docs else 0}}, upsert=True
+        )
+        self._seeded_counters.add(entity)
+
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        """Reserve size consecutive ids of entity (collection name) with one atomic $inc of its counter
+        in Counters collection, return the first one. Blocks never overlap across processes.
+        Counter is seeded from the max _id once per process"""
+        if entity not in self._collections:
+            raise ValueError(f"Unknown entity: {entity}")
+        if size <= 0:
+            raise ValueError(f"size must be positive, got: {size}")
+        if entity not in self._seeded_counters:
+            await self._seed_id_counter(entity)
+        counter = await self._counters.find_one_and_update(
+            {"_id": entity}, {"$inc": {"value": size}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        logger.debug("Reserved %s ids of %s up to %s", size, entity, counter["value"])
+        return counter["value"] - size + 1
+
+    async def get_index_usage(self) -> list[IndexUsage]:
+        """Get access counters of every index with $indexStats, indexes with zero accesses are likely unused"""
+        result = list()
+        for collection_name, collection in self._collections.items():
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                result.append(IndexUsage(
+                    collection=collection_name,
+                    name=stats["name"],
+                    accesses=stats["accesses"]["ops"],
+                    since=stats["accesses"]["since"]
+                ))
+        return result
+
+    async def explain_condition(self, collection: str, condition: dict) -> list[str]:
+        """Get stages of the winning plan for find(condition) on collection,
+        "COLLSCAN" among them means the condition is not covered by any index"""
+        explain = await self._collections[collection].find(condition).explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        # Servers with slot based engine wrap classic plan into "queryPlan"
+        plans = [winning_plan.get("queryPlan", winning_plan)]
+        stages = list()
+        while plans:
+            plan = plans.pop()
+            stages.append(plan["stage"])
+            plans.extend(plan.get("inputStages", []))
+            if "inputStage" in plan:
+                plans.append(plan["inputStage"])
+        return stages
+
+    async def _iter_by_condition(self, collection: str, model: type[BaseModel], condition: dict,
+                                 batch_size: int, start_after: int | None,
+                                 fields: list[str] | None = None) -> AsyncIterator[list]:
+        """Yield batches of parsed models matching condition, ordered by _id.
+        Pages are fetched by _id keyset (not skip), so every page costs the same.
+        The id of the last model in a batch is a continuation token: pass it as
+        start_after to resume iteration right after that batch"""
+        if batch_size <= 0:
+            raise ValueError(f"batch_size must be positive, got: {batch_size}")
+        while True:
+            page_condition = condition
+            if start_after is not None:
+                page_condition = {"$and": [condition, {"_id": {"$gt": start_after}}]}
+            cursor = self._collections[collection].find(
+                page_condition, self._projection(model, fields)
+            ).sort("_id", ASCENDING).limit(batch_size)
+            batch = [self._hydrate(model, doc) for doc in await cursor.to_list(length=batch_size)]
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            start_after = batch[-1].id
+
+    async def _get_by_ids(self, collection: str, model: type[BaseModel], ids: list[int]) -> list:
+        """Get all existing documents with _id in ids by one query, order is not guaranteed"""
+        if not ids:
+            return []
+        docs = self._collections[collection].find({"_id": {"$in": ids}})
+        return [self._hydrate(model, doc) for doc in await docs.to_list(length=None)]
+
+    async def _write_many(self, collection: str, objs: list[BaseModel], chunk_size: int) -> BulkWriteResult:
+        """Write objs with one unordered insert_many per chunk.
+        Duplicate keys are collected in result, any other write error is re-raised"""
+        result = BulkWriteResult()
+        for start in range(0, len(objs), chunk_size):
+            chunk = objs[start:start + chunk_size]
+            docs = [obj.dict(by_alias=True) for obj in chunk]
+            try:
+                await self._collections[collection].insert_many(docs, ordered=False)
+                failed_indexes = set()
+            except BulkWriteError as err:
+                write_errors = err.details.get("writeErrors", [])
+                if any(error["code"] != DUPLICATE_KEY_CODE for error in write_errors):
+                    logger.error("Can't write %s chunk from position %s: %s", collection, start, err.details)
+                    raise err
+                failed_indexes = {error["index"] for error in write_errors}
+            await self._on_written(collection, [doc for index, doc in enumerate(docs) if index not in failed_indexes])
+            for index, obj in enumerate(chunk):
+                if index in failed_indexes:
+                    result.duplicate_ids.append(obj.id)
+                else:
+                    result.inserted_ids.append(obj.id)
+        if result.duplicate_ids:
+            logger.error("Can't write %s with ids: %s, DuplicateKey", collection, result.duplicate_ids)
+        logger.info("Success write %s %s to db", len(result.inserted_ids), collection)
+        return result
+
+    async def _delete_many(self, collection: str, ids: list[int], chunk_size: int) -> BulkDeleteResult:
+        """Delete documents by ids with one delete_many per chunk.
+        Summary fields of documents are read before, if some of them were deleted concurrently
+        meanwhile, summaries of their users are rebuilt instead of applying deltas twice"""
+        result = BulkDeleteResult(requested_count=len(ids))
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            if collection == "users":
+                docs = [{"_id": user_id} for user_id in chunk]
+            else:
+                docs = await self._collections[collection].find(
+                    {"_id": {"$in": chunk}}, self._summary_projection(collection)
+                ).to_list(length=None)
+            delete_obj = await self._collections[collection].delete_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}}
+            )
+            result.deleted_count += delete_obj.deleted_count
+            if collection == "users" or delete_obj.deleted_count == len(docs):
+                await self._on_deleted(collection, docs)
+            else:
+                await self.rebuild_user_summaries(list({doc["user_id"] for doc in docs}))
+        logger.info("Success delete %s of %s %s from db", result.deleted_count, result.requested_count, collection)
+        return result
+
+    async def _search(self, collection: str, user_id: int, query: str, limit: int, offset: int) -> SearchPage:
+        """$text search within user documents by text index, ordered by text score.
+        Only searchable fields are fetched, to build snippets"""
+        check_page_args(limit, offset)
+        fields = SEARCH_FIELDS[collection]
+        docs = self._collections[collection].find(
+            {"user_id": user_id, "$text": {"$search": query}},
+            {"score": {"$meta": "textScore"}, **{field: 1 for field in fields}}
+        ).sort([("score", {"$meta": "textScore"}), ("_id", ASCENDING)]).skip(offset).limit(limit + 1)
+        hits = [(doc["score"], doc) for doc in await docs.to_list(limit + 1)]
+        return search_page(hits, fields, query, limit, offset)
+
+    async def _update_one(self, collection: str, obj_id: int, entity: str, condition: dict,
+                          update: dict | list, expected: dict | None) -> None:
+        """Apply update to object if it matches condition and expected values.
+        raise DBNotFound if there is no object, DBConflict if it doesn't match"""
+        result = await self._collections[collection].update_one(
+            {"$and": [{"_id": obj_id}, condition, expected or dict()]}, update
+        )
+        if not result.matched_count:
+            await self._raise_update_failed(collection, obj_id, entity)
+
+    async def _raise_update_failed(self, collection: str, obj_id: int, entity: str) -> None:
+        if await self._collections[collection].find_one({"_id": obj_id}, {"_id": 1}) is None:
+            logger.error("Not found %s with id: %s", entity, obj_id)
+            raise DBNotFound(f"Not found {entity} with id: {obj_id}")
+        logger.warning("Conflict on update of %s with id: %s", entity, obj_id)
+        raise DBConflict(f"{entity.capitalize()} with id: {obj_id} doesn't match expected state")
+
+    async def _find_one_and_update(self, collection: str, obj_id: int, entity: str, condition: dict,
+                                   update: dict | list, expected: dict | None, fields: dict) -> dict:
+        """Same as _update_one, return fields of object as they were before the update"""
+        doc = await self._collections[collection].find_one_and_update(
+            {"$and": [{"_id": obj_id}, condition, expected or dict()]},
+            update,
+            projection=fields,
+            return_document=ReturnDocument.BEFORE
+        )
+        if doc is None:
+            await self._raise_update_failed(collection, obj_id, entity)
+        return doc
+
+    # ----- Summaries ----- #
+    @staticmethod
+    def _summary_projection(collection: str) -> dict:
+        return {field: 1 for field in SUMMARY_FIELDS[collection]}
+
+    async def _create_summaries(self, user_ids: list[int], session=None) -> None:
+        """Summaries of new users. Documents written before their user are not counted by deltas,
+        so if there are any, summaries are rebuilt from documents, else zero ones are written"""
+        if not user_ids:
+            return
+        owned = await asyncio.gather(*(
+            self._collections[collection].find_one({"user_id": {"$in": user_ids}}, {"_id": 1}, session=session)
+            for collection in USER_OWNED_COLLECTIONS
+        ))
+        if any(doc is not None for doc in owned):
+            await self.rebuild_user_summaries(user_ids)
+            return
+        await self._summaries.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$setOnInsert": dict.fromkeys(SUMMARY_COUNTERS, 0)}, upsert=True)
+             for user_id in user_ids],
+            ordered=False, session=session
+        )
+
+    async def _summarize(self, collection: str, docs: list[dict], sign: int = 1) -> None:
+        """Apply deltas of added (sign 1) or removed (sign -1) docs to summaries of their users
+        with one $inc per user, added scheduled notions are $min-ed into next_notion.
+        Summaries are created with users only, docs of users without one are not counted
+        until the user is written, then its summary is rebuilt.
+        Removed notions may be the next ones of their users, such next_notion are recomputed"""
+        updates: dict[int, dict] = dict()
+        for doc in docs:
+            update = updates.setdefault(doc["user_id"], {"$inc": dict()})
+            for field, change in summary_delta(collection, doc, sign).items():
+                update["$inc"][field] = update["$inc"].get(field, 0) + change
+            key = next_notion_key(doc) if collection == "notions" and sign > 0 else None
+            if key is not None:
+                update["$min"] = {"next_notion": earlier_key(update.get("$min", dict()).get("next_notion"), key)}
+        if updates:
+            await self._summaries.bulk_write(
+                [UpdateOne({"_id": user_id}, update) for user_id, update in updates.items()],
+                ordered=False
+            )
+        if collection == "notions" and sign < 0:
+            await self._refresh_next_notions([doc for doc in docs if next_notion_key(doc) is not None])
+
+    async def _on_written(self, collection: str, docs: list[dict]) -> None:
+        if collection == "users":
+            await self._create_summaries([doc["_id"] for doc in docs])
+        else:
+            await self._summarize(collection, docs)
+
+    async def _on_deleted(self, collection: str, docs: list[dict]) -> None:
+        if collection == "users":
+            await self._summaries.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        else:
+            await self._summarize(collection, docs, -1)
+
+    async def _inc_summary(self, user_id: int, delta: dict[str, int]) -> None:
+        await self._summaries.update_one({"_id": user_id}, {"$inc": delta})
+
+    async def _reschedule_summaries(self, notions: list[dict],
+                                    schedule: dict[int, datetime.datetime | None]) -> None:
+        """Update next_notion of users of notions (as they were before schedule was applied).
+        Notions scheduled earlier are $min-ed in, postponed ones may have been the next, see _refresh_next_notions"""
+        advanced: dict[int, dict] = dict()
+        postponed = list()
+        for doc in notions:
+            next_time = schedule[doc["_id"]]
+            if is_postponed(doc.get("next_notion_time"), next_time):
+                postponed.append(doc)
+            elif next_time is not None:
+                key = {"time": next_time, "id": doc["_id"]}
+                advanced[doc["user_id"]] = earlier_key(advanced.get(doc["user_id"]), key)
+        if advanced:
+            await self._summaries.bulk_write(
+                [UpdateOne({"_id": user_id}, {"$min": {"next_notion": key}}) for user_id, key in advanced.items()],
+                ordered=False
+            )
+        await self._refresh_next_notions(postponed)
+
+    async def _refresh_next_notions(self, notions: list[dict]) -> None:
+        """Recompute next_notion of users whose summary points to one of notions, which were removed
+        or postponed. Summaries pointing elsewhere stay valid, for the rest the earliest notions are found
+        by one aggregation over user_id_next_notion_time index"""
+        if not notions:
+            return
+        stale = await self._summaries.find(
+            {"_id": {"$in": list({doc["user_id"] for doc in notions})},
+             "next_notion.id": {"$in": [doc["_id"] for doc in notions]}},
+            {"_id": 1}
+        ).to_list(length=None)
+        user_ids = [doc["_id"] for doc in stale]
+        if not user_ids:
+            return
+        next_notions = {
+            doc["_id"]: doc["next_notion"]
+            async for doc in self._collections["notions"].aggregate([
+                {"$match": {"$and": [NEXT_NOTION_TIME_FILTER, {"user_id": {"$in": user_ids}}]}},
+                {"$sort": {"user_id": ASCENDING, "next_notion_time": ASCENDING, "_id": ASCENDING}},
+                {"$group": {
+                    "_id": "$user_id",
+                    "next_notion": {"$first": {"time": "$next_notion_time", "id": "$_id"}}
+                }},
+            ])
+        }
+        await self._summaries.bulk_write([
+            UpdateOne(
+                {"_id": user_id},
+                {"$set": {"next_notion": next_notions[user_id]}} if user_id in next_notions
+                else {"$unset": {"next_notion": ""}}
+            )
+            for user_id in user_ids
+        ], ordered=False)
 
     # ----- Users ----- #
     async def get_user(self, user_id: int) -> UserModel:
         user = await self._collections["users"].find_one({"_id": user_id})
         if user is None:
-            logger.error(f"No user found with id: {user_id}")
+            logger.error("No user found with id: %s", user_id)
             raise DBNotFound(f"No user found with id: {user_id}")
-        user = UserModel.parse_obj(user)
+        user = self._hydrate(UserModel, user)
         return user
 
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        """Get existing users with id in user_ids, missing ids are skipped"""
+        return await self._get_by_ids("users", UserModel, user_ids)
+
     async def write_new_user(self, user: UserModel) -> int:
         """Write new user obj by UserModel in User collection"""
         try:
             inserted_obj = await self._collections["users"].insert_one(user.dict(by_alias=True))
-            logger.info(f"Success write user with id: {user.id} to db")
+            logger.info("Success write user with id: %s to db", user.id)
         except DuplicateKeyError as err:
-            logger.error(f"Can't write user with id: {user.id}, DuplicateKey: {err}")
+            logger.error("Can't write user with id: %s, DuplicateKey: %s", user.id, err)
             raise err
         else:
+            await self._create_summaries([user.id])
             return inserted_obj.inserted_id
 
     async def delete_user(self, user_id: int) -> int:
@@ -115,130 +588,538 @@ class MongoDbApi(DbApi):
         delete_obj = await self._collections["users"].delete_one({"_id": user_id})
 
         if not delete_obj.deleted_count:
-            logger.error(f"Not found user with id: {user_id}")
+            logger.error("Not found user with id: %s", user_id)
             raise DBNotFound(f"Not found user with id: {user_id}")
         else:
+            await self._summaries.delete_one({"_id": user_id})
             return user_id
 
+    async def iter_users_by_condition(self, condition: dict, batch_size: int = 100,
+                                      start_after: int | None = None,
+                                      fields: list[str] | None = None) -> AsyncIterator[list[UserModel]]:
+        """Iterate over all users matching condition in batches of batch_size, see _iter_by_condition"""
+        async for batch in self._iter_by_condition(
+                "users", UserModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def write_many_users(self, users: list[UserModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        """Write users in chunks, duplicate ids are reported in result instead of raising"""
+        return await self._write_many("users", users, chunk_size)
+
+    async def delete_many_users(self, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        """Delete users by ids in chunks, missing ids are not an error"""
+        return await self._delete_many("users", user_ids, chunk_size)
+
+    async def supports_transactions(self) -> bool:
+        """Transactions need a replica set or sharded cluster, standalone server doesn't support them"""
+        if self._supports_transactions is None:
+            hello = await self._client.admin.command("hello")
+            self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._supports_transactions
+
+    async def purge_user(self, user_id: int, use_transaction: bool | None = None,
+                         on_progress: Callable[[str, int], None] | None = None) -> PurgeResult:
+        """Delete user and all its themes, notes and notions with one delete_many per collection.
+        Without transaction owned collections are purged concurrently and the user last,
+        so a failed purge leaves the user to run it again. With transaction (default: if deployment
+        supports it) deletes run one after another in it, as a session can't run operations concurrently.
+        on_progress(collection, deleted_count) is called as every collection is done.
+        Missing user is not an error, purge is idempotent"""
+        if use_transaction is None:
+            use_transaction = await self.supports_transactions()
+        result = PurgeResult(user_id=user_id, used_transaction=use_transaction)
+
+        async def purge(collection: str, condition: dict, session=None) -> None:
+            deleted = await self._collections[collection].delete_many(condition, session=session)
+            result.deleted_counts[collection] = deleted.deleted_count
+            if on_progress is not None:
+                on_progress(collection, deleted.deleted_count)
+
+        if use_transaction:
+            async with await self._client.start_session() as session:
+                async with session.start_transaction():
+                    for collection in USER_OWNED_COLLECTIONS:
+                        await purge(collection, {"user_id": user_id}, session)
+                    await purge("users", {"_id": user_id}, session)
+                    await self._summaries.delete_one({"_id": user_id}, session=session)
+        else:
+            await asyncio.gather(*(
+                purge(collection, {"user_id": user_id}) for collection in USER_OWNED_COLLECTIONS
+            ))
+            await purge("users", {"_id": user_id})
+            await self._summaries.delete_one({"_id": user_id})
+        logger.info("Success purge user with id: %s, deleted: %s", user_id, result.deleted_counts)
+        return result
+
+    async def get_user_summary(self, user_id: int) -> UserSummary:
+        """Get counters of user documents and the next notion by one find_one.
+        raise DBNotFound exception if user has no summary"""
+        summary = await self._summaries.find_one({"_id": user_id})
+        if summary is None:
+            logger.error("No summary found for user with id: %s", user_id)
+            raise DBNotFound(f"No summary found for user with id: {user_id}")
+        return self._hydrate(UserSummary, summary)
+
+    async def rebuild_user_summaries(self, user_ids: list[int] | None = None) -> int:
+        """Recount summaries of user_ids (None - all users) from their documents, to create summaries
+        of users written before summaries existed or repair them. Zero summaries of users are written first,
+        then counters of every collection are $group-ed by user_id and $merge-d into them.
+        Writes of these users while rebuilding may be lost. Return number of rebuilt summaries"""
+        user_filter = dict() if user_ids is None else {"_id": {"$in": user_ids}}
+        owned_filter = dict() if user_ids is None else {"user_id": {"$in": user_ids}}
+        into = self._summaries.name
+
+        await self._summaries.delete_many(user_filter)
+        await self._collections["users"].aggregate([
+            {"$match": user_filter},
+            {"$project": {"_id": 1, **{counter: {"$literal": 0} for counter in SUMMARY_COUNTERS}}},
+            {"$merge": {"into": into, "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]).to_list(length=None)
+
+        merge = {"$merge": {"into": into, "whenMatched": "merge", "whenNotMatched": "discard"}}
+        pipelines = {
+            "themes": [
+                {"$group": {"_id": "$user_id", "themes": {"$sum": 1}}},
+            ],
+            "notes": [
+                {"$group": {
+                    "_id": "$user_id",
+                    "notes": {"$sum": 1},
+                    "check_points": {"$sum": {"$size": "$check_points"}},
+                    "finished_check_points": {"$sum": {"$size": {
+                        "$filter": {"input": "$check_points", "cond": "$$this.is_finish"}
+                    }}},
+                }},
+                {"$project": {
+                    "notes": 1,
+                    "finished_check_points": 1,
+                    "open_check_points": {"$subtract": ["$check_points", "$finished_check_points"]},
+                }},
+            ],
+            "notions": [
+                {"$group": {
+                    "_id": "$user_id",
+                    "notions": {"$sum": 1},
+                    # $min skips missing values, so unscheduled notions are not taken
+                    "next_notion": {"$min": {"$cond": [
+                        {"$eq": [{"$type": "$next_notion_time"}, "date"]},
+                        {"time": "$next_notion_time", "id": "$_id"},
+                        "$$REMOVE"
+                    ]}},
+                }},
+                {"$project": {"notions": 1, "next_notion": {"$ifNull": ["$next_notion", "$$REMOVE"]}}},
+            ],
+        }
+        await asyncio.gather(*(
+            self._collections[collection].aggregate([{"$match": owned_filter}, *pipeline, merge]).to_list(length=None)
+            for collection, pipeline in pipelines.items()
+        ))
+        rebuilt_count = await self._summaries.count_documents(user_filter)
+        logger.info("Success rebuild %s user summaries", rebuilt_count)
+        return rebuilt_count
+
     # ----- Themes ----- #
     async def get_theme(self, theme_id: int) -> ThemeModel:
         theme = await self._collections["themes"].find_one({"_id": theme_id})
         if theme is None:
-            logger.error(f"No theme found with id: {theme_id}")
+            logger.error("No theme found with id: %s", theme_id)
             raise DBNotFound(f"No theme found with id: {theme_id}")
-        theme = ThemeModel.parse_obj(theme)
+        theme = self._hydrate(ThemeModel, theme)
         return theme
 
+    async def get_themes_by_ids(self, theme_ids: list[int]) -> list[ThemeModel]:
+        """Get existing themes with id in theme_ids, missing ids are skipped"""
+        return await self._get_by_ids("themes", ThemeModel, theme_ids)
+
     async def write_new_theme(self, theme: ThemeModel) -> int:
         """Write new theme obj by ThemeModel in Theme collection"""
         try:
-            inserted_obj = await self._collections["themes"].insert_one(theme.dict(by_alias=True))
-            logger.info(f"Success write theme with id: {theme.id} to db")
+            doc = theme.dict(by_alias=True)
+            inserted_obj = await self._collections["themes"].insert_one(doc)
+            logger.info("Success write theme with id: %s to db", theme.id)
         except DuplicateKeyError as err:
-            logger.error(f"Can't write theme with id: {theme.id}, DuplicateKey: {err}")
+            logger.error("Can't write theme with id: %s, DuplicateKey: %s", theme.id, err)
             raise err
         else:
+            await self._on_written("themes", [doc])
             return inserted_obj.inserted_id
 
-    async def get_all_themes_by_condition(self, condition: dict) -> list[ThemeModel]:
-        themes = self._collections["themes"].find(condition)
+    async def get_all_themes_by_condition(self, condition: dict,
+                                          fields: list[str] | None = None) -> list[ThemeModel]:
+        themes = self._collections["themes"].find(condition, self._projection(ThemeModel, fields))
         result = list()
         for theme in await themes.to_list(length=100):
-            result.append(ThemeModel.parse_obj(theme))
+            result.append(self._hydrate(ThemeModel, theme))
         if not len(result):
-            logger.error(f"No themes found settings condition: {condition}")
+            logger.error("No themes found settings condition: %s", condition)
             raise DBNotFound(f"No themes found settings condition: {condition}")
         return result
 
+    async def iter_themes_by_condition(self, condition: dict, batch_size: int = 100,
+                                       start_after: int | None = None,
+                                       fields: list[str] | None = None) -> AsyncIterator[list[ThemeModel]]:
+        """Iterate over all themes matching condition in batches of batch_size, see _iter_by_condition"""
+        async for batch in self._iter_by_condition(
+                "themes", ThemeModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def get_theme_tree(self, user_id: int | None = None, root_theme_id: int | None = None,
+                             max_depth: int | None = None) -> list[ThemeTreeNode]:
+        """Get theme trees by one $graphLookup aggregation.
+        Roots are all top level themes (is_sub_theme False) of user_id or the single root_theme_id,
+        max_depth limits levels below roots (0 - roots only, None - whole subtree).
+        Subtree of one root must fit into a single 16MB document.
+        raise DBNotFound exception if no root theme found"""
+        if (user_id is None) == (root_theme_id is None):
+            raise ValueError("Exactly one of user_id and root_theme_id must be set")
+        if max_depth is not None and max_depth < 0:
+            raise ValueError(f"max_depth must not be negative, got: {max_depth}")
+
+        if root_theme_id is not None:
+            pipeline = [{"$match": {"_id": root_theme_id}}]
+        else:
+            pipeline = [{"$match": {"user_id": user_id, "is_sub_theme": False}}, {"$sort": {"_id": ASCENDING}}]
+        if max_depth != 0:
+            graph_lookup = {
+                "from": self._collections["themes"].name,
+                "startWith": "$_id",
+                "connectFromField": "_id",
+                "connectToField": "parent_id",
+                "as": "descendants",
+            }
+            if max_depth is not None:
+                graph_lookup["maxDepth"] = max_depth - 1
+            if user_id is not None:
+                graph_lookup["restrictSearchWithMatch"] = {"user_id": user_id}
+            pipeline.append({"$graphLookup": graph_lookup})
+
+        roots, descendants = list(), list()
+        async for doc in self._collections["themes"].aggregate(pipeline):
+            descendants.extend(self._hydrate(ThemeModel, descendant) for descendant in doc.pop("descendants", []))
+            roots.append(self._hydrate(ThemeModel, doc))
+        if not roots:
+            condition = {"_id": root_theme_id} if root_theme_id is not None else {"user_id": user_id}
+            logger.error("No root themes found setting condition: %s", condition)
+            raise DBNotFound(f"No root themes found setting condition: {condition}")
+        return build_theme_tree(roots, descendants)
+
+    async def search_themes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        """Search user themes by name and description, weighted by SEARCH_FIELDS.
+        Query is Mongo $text search string: terms are OR-ed, "quoted phrases" and -negations are supported"""
+        return await self._search("themes", user_id, query, limit, offset)
+
+    async def write_many_themes(self, themes: list[ThemeModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        """Write themes in chunks, duplicate ids are reported in result instead of raising"""
+        return await self._write_many("themes", themes, chunk_size)
+
+    async def delete_many_themes(self, theme_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        """Delete themes by ids in chunks, missing ids are not an error"""
+        return await self._delete_many("themes", theme_ids, chunk_size)
+
     async def delete_theme(self, theme_id: int) -> int:
         """Delete theme from Theme collection by id
         raise DBNotFound exception if no theme with this id in collection"""
-        delete_obj = await self._collections["themes"].delete_one({"_id": theme_id})
+        deleted = await self._collections["themes"].find_one_and_delete(
+            {"_id": theme_id}, self._summary_projection("themes")
+        )
 
-        if not delete_obj.deleted_count:
-            logger.error(f"Not found theme with id: {theme_id}")
+        if deleted is None:
+            logger.error("Not found theme with id: %s", theme_id)
             raise DBNotFound
         else:
+            await self._on_deleted("themes", [deleted])
             return theme_id
 
     # ----- Notions ----- #
     async def get_notion(self, notion_id: int) -> NotionModel:
         notion = await self._collections["notions"].find_one({"_id": notion_id})
         if notion is None:
-            logger.error(f"Not found notion with id: {notion_id}")
+            logger.error("Not found notion with id: %s", notion_id)
             raise DBNotFound(f"Not found notion with id: {notion_id}")
-        notion = NotionModel.parse_obj(notion)
+        notion = self._hydrate(NotionModel, notion)
         return notion
 
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        """Get existing notions with id in notion_ids, missing ids are skipped"""
+        return await self._get_by_ids("notions", NotionModel, notion_ids)
+
     async def write_new_notion(self, notion: NotionModel) -> int:
         """Write new notion obj by NotionModel in Notion collection"""
         try:
-            inserted_obj = await self._collections["notions"].insert_one(notion.dict(by_alias=True))
-            logger.info(f"Success write notion with id: {notion.id} to db")
+            doc = notion.dict(by_alias=True)
+            inserted_obj = await self._collections["notions"].insert_one(doc)
+            logger.info("Success write notion with id: %s to db", notion.id)
         except DuplicateKeyError as err:
-            logger.error(f"Can't write notion with id: {notion.id}, DuplicateKey: {err}")
+            logger.error("Can't write notion with id: %s, DuplicateKey: %s", notion.id, err)
             raise err
         else:
+            await self._on_written("notions", [doc])
             return inserted_obj.inserted_id
 
-    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100) -> list[NotionModel]:
-        notions = self._collections["notions"].find(condition)
+    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[NotionModel]:
+        notions = self._collections["notions"].find(condition, self._projection(NotionModel, fields))
         result = list()
         for notion in await notions.to_list(length=list_length):
-            result.append(NotionModel.parse_obj(notion))
+            result.append(self._hydrate(NotionModel, notion))
         if not len(result):
-            logger.error(f"No notions found setting conditions: {condition}")
+            logger.error("No notions found setting conditions: %s", condition)
             raise DBNotFound(f"No notions found setting conditions: {condition}")
         return result
     
+    async def iter_notions_by_condition(self, condition: dict, batch_size: int = 100,
+                                        start_after: int | None = None,
+                                        fields: list[str] | None = None) -> AsyncIterator[list[NotionModel]]:
+        """Iterate over all notions matching condition in batches of batch_size, see _iter_by_condition"""
+        async for batch in self._iter_by_condition(
+                "notions", NotionModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def write_many_notions(self, notions: list[NotionModel],
+                                 chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        """Write notions in chunks, duplicate ids are reported in result instead of raising"""
+        return await self._write_many("notions", notions, chunk_size)
+
+    async def delete_many_notions(self, notion_ids: list[int],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        """Delete notions by ids in chunks, missing ids are not an error"""
+        return await self._delete_many("notions", notion_ids, chunk_size)
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        """Get up to limit notions with next_notion_time <= until, earliest first.
+        Notions without next_notion_time are never due"""
+        notions = self._collections["notions"].find(
+            {"$and": [NEXT_NOTION_TIME_FILTER, {"next_notion_time": {"$lte": until}}]}
+        ).sort([("next_notion_time", ASCENDING), ("_id", ASCENDING)]).limit(limit)
+        return [self._hydrate(NotionModel, notion) for notion in await notions.to_list(length=limit)]
+
+    async def get_notions_in_window(self, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                                    limit: int = 100, cursor: str | None = None) -> NotionPage:
+        """Get page of user notions scheduled in [start, end), ordered by (next_notion_time, _id).
+        Pass next_cursor of a page as cursor to get the next one, pages are ranges of
+        user_id_next_notion_time index starting right after cursor, so every page costs the same.
+        raise ValueError on malformed cursor"""
+        check_window_args(start, end, limit)
+        docs = self._collections["notions"].find(window_condition(user_id, start, end, cursor)).sort(
+            [("next_notion_time", ASCENDING), ("_id", ASCENDING)]
+        ).limit(limit + 1)
+        return notion_page([self._hydrate(NotionModel, doc) for doc in await docs.to_list(length=limit + 1)], limit)
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        """Set next_notion_time for many notions with one unordered bulk write,
+        schedule maps notion id to its new time (None - notion will not fire anymore).
+        Notions with expected_times are updated only if their next_notion_time is still the expected one,
+        e.g. the time they fired at, so a reschedule made meanwhile is not overwritten.
+        Return number of modified notions"""
+        if not schedule:
+            return 0
+        expected_times = expected_times or dict()
+        filters = {
+            notion_id: {"_id": notion_id, **(
+                {"next_notion_time": expected_times[notion_id]} if notion_id in expected_times else dict()
+            )}
+            for notion_id in schedule
+        }
+        notions = await self._collections["notions"].find(
+            {"$or": list(filters.values())}, self._summary_projection("notions")
+        ).to_list(length=None)
+        result = await self._collections["notions"].bulk_write(
+            [UpdateOne(filters[notion_id], {"$set": {"next_notion_time": next_time}})
+             for notion_id, next_time in schedule.items()],
+            ordered=False
+        )
+        await self._reschedule_summaries(notions, schedule)
+        logger.info("Success reschedule %s notions", result.modified_count)
+        return result.modified_count
+
+    async def reschedule_notion(self, notion_id: int, next_time: datetime.datetime | None,
+                                expected: dict | None = None) -> int:
+        """Set next_notion_time of one notion, if it still has expected field values
+        (e.g. {"next_notion_time": old_time}). raise DBNotFound or DBConflict"""
+        notion = await self._find_one_and_update(
+            "notions", notion_id, "notion", dict(), {"$set": {"next_notion_time": next_time}}, expected,
+            self._summary_projection("notions")
+        )
+        await self._reschedule_summaries([notion], {notion_id: next_time})
+        return notion_id
+
     async def delete_notion(self, notion_id: int) -> int:
         """Delete notion from Notions collection by id
         raise DBNotFound exception if not notion with this id in collection"""
-        delete_obj = await self._collections["notions"].delete_one({"_id": notion_id})
+        deleted = await self._collections["notions"].find_one_and_delete(
+            {"_id": notion_id}, self._summary_projection("notions")
+        )
 
-        if not delete_obj.deleted_count:
-            logger.error(f"Not found notion with id: {notion_id}")
+        if deleted is None:
+            logger.error("Not found notion with id: %s", notion_id)
             raise DBNotFound(f"Not found notion with id: {notion_id}")
         else:
+            await self._on_deleted("notions", [deleted])
             return notion_id
 
     # ----- Notes ----- #
     async def write_new_note(self, note: NoteModel) -> int:
         """Write new note obj by NoteModel in Note collection"""
         try:
-            inserted_obj = await self._collections["notes"].insert_one(note.dict(by_alias=True))
-            logger.info(f"Success write note with id: {note.id} to db")
+            doc = note.dict(by_alias=True)
+            inserted_obj = await self._collections["notes"].insert_one(doc)
+            logger.info("Success write note with id: %s to db", note.id)
         except DuplicateKeyError as err:
-            logger.error(f"Can't write note with id: {note.id}, DuplicateKey: {err}")
+            logger.error("Can't write note with id: %s, DuplicateKey: %s", note.id, err)
             raise err
         else:
+            await self._on_written("notes", [doc])
             return inserted_obj.inserted_id
 
     async def get_note(self, note_id: int) -> NoteModel:
         note = await self._collections["notes"].find_one({"_id": note_id})
         if note is None:
-            logger.error(f"Not found note with id: {note_id}")
+            logger.error("Not found note with id: %s", note_id)
             raise DBNotFound(f"Not found note with id: {note_id}")
-        note = NoteModel.parse_obj(note)
+        note = self._hydrate(NoteModel, note)
         return note
 
-    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100) -> list[NoteModel]:
-        notes = self._collections["notes"].find(condition)
+    async def get_notes_by_ids(self, note_ids: list[int]) -> list[NoteModel]:
+        """Get existing notes with id in note_ids, missing ids are skipped"""
+        return await self._get_by_ids("notes", NoteModel, note_ids)
+
+    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100,
+                                         fields: list[str] | None = None) -> list[NoteModel]:
+        notes = self._collections["notes"].find(condition, self._projection(NoteModel, fields))
         result = list()
         for note in await notes.to_list(list_length):
-            result.append(NoteModel.parse_obj(note))
+            result.append(self._hydrate(NoteModel, note))
         if not len(result):
-            logger.error(f"No notes found setting conditions: {condition}")
+            logger.error("No notes found setting conditions: %s", condition)
             raise DBNotFound(f"No notes found setting conditions: {condition}")
         return result
 
+    async def iter_notes_by_condition(self, condition: dict, batch_size: int = 100,
+                                      start_after: int | None = None,
+                                      fields: list[str] | None = None) -> AsyncIterator[list[NoteModel]]:
+        """Iterate over all notes matching condition in batches of batch_size, see _iter_by_condition"""
+        async for batch in self._iter_by_condition(
+                "notes", NoteModel, condition, batch_size, start_after, fields
+        ):
+            yield batch
+
+    async def write_many_notes(self, notes: list[NoteModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        """Write notes in chunks, duplicate ids are reported in result instead of raising"""
+        return await self._write_many("notes", notes, chunk_size)
+
+    async def delete_many_notes(self, note_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        """Delete notes by ids in chunks, missing ids are not an error"""
+        return await self._delete_many("notes", note_ids, chunk_size)
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        """Search user notes by name, description and check point texts, see search_themes"""
+        return await self._search("notes", user_id, query, limit, offset)
+
+    async def update_note_fields(self, note_id: int, fields: dict, expected: dict | None = None) -> int:
+        """$set only given note fields, if note still has expected field values.
+        raise DBNotFound if there is no note, DBConflict if it doesn't match expected"""
+        values = validate_note_fields(fields)
+        if "user_id" not in values:
+            await self._update_one("notes", note_id, "note", dict(), {"$set": values}, expected)
+            return note_id
+        # Note moved to another user takes its counters with it
+        note = await self._find_one_and_update(
+            "notes", note_id, "note", dict(), {"$set": values}, expected, self._summary_projection("notes")
+        )
+        if note["user_id"] != values["user_id"]:
+            await self._summarize("notes", [note], -1)
+            await self._summarize("notes", [dict(note, user_id=values["user_id"])])
+        return note_id
+
+    async def append_check_point(self, note_id: int, check_point: CheckPointModel,
+                                 expected: dict | None = None) -> int:
+        """$push check point to the end of note check points.
+        Check point creation_time is its key, so a note can't have two check points with the same one"""
+        note = await self._find_one_and_update(
+            "notes", note_id, "note",
+            {"check_points.creation_time": {"$ne": check_point.creation_time}},
+            {"$push": {"check_points": check_point.dict()}},
+            expected,
+            {"user_id": 1}
+        )
+        await self._inc_summary(note["user_id"], check_point_delta(check_point.is_finish))
+        return note_id
+
+    async def remove_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> int:
+        """Remove check point by index and/or key, see updates module.
+        By key it is a $pull, by index a pipeline update cutting the element out on the server"""
+        if index is None:
+            update = {"$pull": {"check_points": {"creation_time": key}}}
+            removed_projection = {"user_id": 1, "check_points": {"$elemMatch": {"creation_time": key}}}
+        else:
+            removed_projection = {"user_id": 1, "check_points": {"$slice": [index, 1]}}
+            update = [{"$set": {"check_points": {"$map": {
+                "input": {"$filter": {
+                    "input": {"$range": [0, {"$size": "$check_points"}]},
+                    "cond": {"$ne": ["$$this", index]}
+                }},
+                "in": {"$arrayElemAt": ["$check_points", "$$this"]}
+            }}}}]
+        note = await self._find_one_and_update(
+            "notes", note_id, "note", check_point_selector(index, key), update, expected, removed_projection
+        )
+        await self._inc_summary(note["user_id"], check_point_delta(note["check_points"][0]["is_finish"], -1))
+        return note_id
+
+    async def toggle_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> bool:
+        """Flip is_finish of check point by index and/or key in one pipeline update,
+        so concurrent toggles are never lost. Return new is_finish"""
+        selector = check_point_selector(index, key)
+        if index is not None:
+            is_target = {"$eq": ["$$i", index]}
+            result_projection = {
+                "_id": 0, "user_id": 1, "is_finish": {"$arrayElemAt": ["$check_points.is_finish", index]}
+            }
+        else:
+            is_target = {"$eq": ["$$check_point.creation_time", key]}
+            result_projection = {"_id": 0, "user_id": 1, "check_points": {"$elemMatch": {"creation_time": key}}}
+        update = [{"$set": {"check_points": {"$map": {
+            "input": {"$range": [0, {"$size": "$check_points"}]},
+            "as": "i",
+            "in": {"$let": {
+                "vars": {"check_point": {"$arrayElemAt": ["$check_points", "$$i"]}},
+                "in": {"$cond": [
+                    is_target,
+                    {"$mergeObjects": ["$$check_point", {"is_finish": {"$not": ["$$check_point.is_finish"]}}]},
+                    "$$check_point"
+                ]}
+            }}
+        }}}}]
+        result = await self._collections["notes"].find_one_and_update(
+            {"$and": [{"_id": note_id}, selector, expected or dict()]},
+            update,
+            projection=result_projection,
+            return_document=ReturnDocument.AFTER
+        )
+        if result is None:
+            await self._raise_update_failed("notes", note_id, "note")
+        is_finish = result["is_finish"] if index is not None else result["check_points"][0]["is_finish"]
+        await self._inc_summary(
+            result["user_id"], {**check_point_delta(is_finish), **check_point_delta(not is_finish, -1)}
+        )
+        return is_finish
+
     async def delete_note(self, note_id: int) -> int:
         """Delete note from Notes collection by id
         raise DBNotFound exception if not note with this id in collection"""
-        delete_obj = await self._collections["notes"].delete_one({"_id": note_id})
+        deleted = await self._collections["notes"].find_one_and_delete(
+            {"_id": note_id}, self._summary_projection("notes")
+        )
 
-        if not delete_obj.deleted_count:
-            logger.error(f"Not found note with id: {note_id}")
+        if deleted is None:
+            logger.error("Not found note with id: %s", note_id)
             raise DBNotFound(f"Not found note with id: {note_id}")
         else:
+            await self._on_deleted("notes", [deleted])
             return note_id
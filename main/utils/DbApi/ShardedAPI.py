@@ -0,0 +1,729 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import chain, islice
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+from pydantic import BaseModel
+
+from main.models.db_models import BulkWriteResult, BulkDeleteResult, NotionPage, PurgeResult, SearchPage, \
+    ThemeTreeNode, UserMoveResult, UserSummary
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel, CheckPointModel
+from main.utils.DbApi.MongoAPI import DbApi, BULK_CHUNK_SIZE, USER_OWNED_COLLECTIONS
+from main.utils.DbApi.query import equality_values, matches
+from main.utils.DbApi.ring import DEFAULT_VNODES, HashRing
+from main.utils.DbApi.updates import validate_note_fields
+from main.utils.exceptons import DBNotFound, DBConflict
+
+logger = logging.getLogger("app.db.sharded")
+
+T = TypeVar("T")
+
+# Entity of user owned collection objects, as in single object getters and errors
+ENTITY_NAMES = {"themes": "theme", "notes": "note", "notions": "notion"}
+DEFAULT_OWNERS_CACHE_SIZE = 100_000
+DEFAULT_MOVE_BATCH_SIZE = 1000
+# Cap of get_all_*_by_condition results of every backend
+LIST_LENGTH = 100
+
+
+def _unique(objs: Iterable[T]) -> Iterator[T]:
+    """Skip objects with the same id as the previous one. While a user is moved its documents
+    are on two shards, merged results have them next to each other"""
+    last_id = None
+    for obj in objs:
+        if obj.id != last_id:
+            last_id = obj.id
+            yield obj
+
+
+async def _next_batch(batches: AsyncIterator[list]) -> list:
+    try:
+        return await batches.__anext__()
+    except StopAsyncIteration:
+        return []
+
+
+async def _merge_batches(streams: list[AsyncIterator[list]], batch_size: int) -> AsyncIterator[list]:
+    """Merge streams of batches ordered by id into batches of batch_size ordered by id.
+    First batches are read from all streams at once, then a stream is read on when its batch runs out"""
+    streams = [stream.__aiter__() for stream in streams]
+    try:
+        batches = list(await asyncio.gather(*(_next_batch(stream) for stream in streams)))
+        heap = [(batch[0].id, index, 0) for index, batch in enumerate(batches) if batch]
+        heapq.heapify(heap)
+        merged = list()
+        last_id = None
+        while heap:
+            obj_id, index, position = heapq.heappop(heap)
+            if obj_id != last_id:
+                last_id = obj_id
+                merged.append(batches[index][position])
+                if len(merged) == batch_size:
+                    yield merged
+                    merged = list()
+            position += 1
+            if position == len(batches[index]):
+                batches[index] = await _next_batch(streams[index])
+                position = 0
+            if batches[index]:
+                heapq.heappush(heap, (batches[index][position].id, index, position))
+        if merged:
+            yield merged
+    finally:
+        for stream in streams:
+            await stream.aclose()
+
+
+class _OwnerCache:
+    """LRU of owner user ids of objects of user owned collections, filled by routed reads and writes.
+    Object ids are never reused and only update_note_fields changes an owner, so an entry goes stale
+    only when its object is deleted, then the shard of the owner answers DBNotFound"""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._data: OrderedDict[tuple[str, int], int] = OrderedDict()
+
+    def get(self, collection: str, obj_id: int) -> int | None:
+        owner = self._data.get((collection, obj_id))
+        if owner is not None:
+            self._data.move_to_end((collection, obj_id))
+        return owner
+
+    def put(self, collection: str, obj_id: int, owner: int) -> None:
+        self._data[(collection, obj_id)] = owner
+        self._data.move_to_end((collection, obj_id))
+        if len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    def put_objs(self, collection: str, objs: Iterable[BaseModel]) -> None:
+        if collection == "users":
+            return
+        for obj in objs:
+            # Partial objects read without user_id don't have it set
+            owner = obj.__dict__.get("user_id")
+            if owner is not None:
+                self.put(collection, obj.id, owner)
+
+    def pop(self, collection: str, obj_id: int) -> None:
+        self._data.pop((collection, obj_id), None)
+
+
+class _WriteGate:
+    """Writes in progress by user. Writes of any users run concurrently,
+    a move of user waits for its writes in progress and holds new ones until it is done.
+    Counters are changed without awaiting in between, so no lock is needed"""
+
+    def __init__(self):
+        self._writing: dict[int, int] = dict()
+        self._idle: dict[int, asyncio.Event] = dict()
+        self._moving: dict[int, asyncio.Event] = dict()
+
+    @asynccontextmanager
+    async def writing(self, user_ids: Iterable[int]) -> AsyncIterator[None]:
+        user_ids = set(user_ids)
+        moves = [self._moving[user_id] for user_id in user_ids if user_id in self._moving]
+        while moves:
+            await asyncio.gather(*(move.wait() for move in moves))
+            moves = [self._moving[user_id] for user_id in user_ids if user_id in self._moving]
+        for user_id in user_ids:
+            self._writing[user_id] = self._writing.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            for user_id in user_ids:
+                self._writing[user_id] -= 1
+                if not self._writing[user_id]:
+                    del self._writing[user_id]
+                    idle = self._idle.pop(user_id, None)
+                    if idle is not None:
+                        idle.set()
+
+    def writing_users(self) -> set[int]:
+        return set(self._writing)
+
+    async def settled(self, user_ids: Iterable[int]) -> None:
+        """Wait until writes of users in progress now are done"""
+        await asyncio.gather(*(
+            self._idle.setdefault(user_id, asyncio.Event()).wait() for user_id in user_ids if user_id in self._writing
+        ))
+
+    @asynccontextmanager
+    async def moving(self, user_id: int) -> AsyncIterator[None]:
+        while user_id in self._moving:
+            await self._moving[user_id].wait()
+        done = self._moving[user_id] = asyncio.Event()
+        try:
+            await self.settled([user_id])
+            yield
+        finally:
+            del self._moving[user_id]
+            done.set()
+
+
+class ShardedDbApi(DbApi):
+    """DbApi routing users to several backing DbApi (shards), e.g. MongoDbApi of different replica sets.
+    A user with all its documents lives on one shard, so writes scale with the number of shards.
+
+    User goes to its consistent hash ring shard unless placements put it elsewhere, owned objects go
+    to the shard of their user_id. Calls by object id find the shard by the object owner: owners of
+    objects seen before are cached in process, unknown ones are looked up on all shards at once.
+    Condition reads not pinned to users by user_id (_id for users) fan out to all shards in parallel
+    and are merged, id ordered reads stay id ordered, due notions stay time ordered.
+    Ids are reserved on the id shard (the first one by default), it must be the one holding documents
+    written before sharding, as counters are seeded from its max ids.
+
+    move_user and reshard move users between shards online: reads are served by the old shard until
+    the copy is done, writes of a moving user made through this router wait for the move.
+    Placements are kept in process: moves should be made by the process serving the users, other
+    processes need the same placements (shard_placements setting) or the same ring after reshard"""
+
+    def __init__(
+            self,
+            shards: dict[str, DbApi],
+            vnodes: int = DEFAULT_VNODES,
+            placements: dict[int, str] | None = None,
+            id_shard: str | None = None,
+            owners_cache_size: int = DEFAULT_OWNERS_CACHE_SIZE
+    ):
+        self._shards = dict(shards)
+        self._ring = HashRing(list(shards), vnodes)
+        self._id_shard = self._check_shard(id_shard if id_shard is not None else next(iter(shards)))
+        self._placements = {user_id: self._check_shard(name) for user_id, name in (placements or {}).items()}
+        self._owners = _OwnerCache(owners_cache_size)
+        self._gate = _WriteGate()
+        # Set while resharding: users routed meanwhile are pinned where they are, to be moved after
+        self._next_ring: HashRing | None = None
+        self._pending_moves: set[int] = set()
+
+    def _check_shard(self, name: str) -> str:
+        if name not in self._shards:
+            raise ValueError(f"Unknown shard: {name}")
+        return name
+
+    # ----- Routing ----- #
+    @property
+    def shard_names(self) -> tuple[str, ...]:
+        return self._ring.names
+
+    @property
+    def placements(self) -> dict[int, str]:
+        """Users placed off their ring shard, to be passed to other processes after moves"""
+        return dict(self._placements)
+
+    def shard_name_of(self, user_id: int) -> str:
+        name = self._placements.get(user_id)
+        if name is not None:
+            return name
+        name = self._ring.shard_for(user_id)
+        if self._next_ring is not None and self._next_ring.shard_for(user_id) != name:
+            self._placements[user_id] = name
+            self._pending_moves.add(user_id)
+        return name
+
+    def _shard(self, user_id: int) -> DbApi:
+        return self._shards[self.shard_name_of(user_id)]
+
+    def _place(self, user_id: int, name: str) -> None:
+        if self._ring.shard_for(user_id) == name:
+            self._placements.pop(user_id, None)
+        else:
+            self._placements[user_id] = name
+
+    def _by_shard(self, items: Iterable[T], user_id_of: Callable[[T], int]) -> dict[str, list[T]]:
+        groups: dict[str, list[T]] = dict()
+        for item in items:
+            groups.setdefault(self.shard_name_of(user_id_of(item)), list()).append(item)
+        return groups
+
+    def _condition_shards(self, collection: str, condition: dict) -> list[str]:
+        """Shards of users condition pins by equality, all shards if it doesn't"""
+        user_ids = equality_values(condition, "_id" if collection == "users" else "user_id")
+        if user_ids is None or not all(isinstance(user_id, int) for user_id in user_ids):
+            return list(self._shards)
+        return list(dict.fromkeys(self.shard_name_of(user_id) for user_id in user_ids))
+
+    async def _fan_out(self, call: Callable[[DbApi], Awaitable[T]], names: Iterable[str] | None = None) -> list[T]:
+        """Run call on shards (default: all) in parallel, results in shards order"""
+        names = self._shards if names is None else names
+        return list(await asyncio.gather(*(call(self._shards[name]) for name in names)))
+
+    # ----- Objects by id ----- #
+    async def _find(self, collection: str, obj_ids: list[int]) -> list:
+        """Objects with ids looked up on all shards, their owners are cached"""
+        method = f"get_{collection}_by_ids"
+        found = await self._fan_out(lambda db: getattr(db, method)(obj_ids))
+        objs = list(_unique(sorted(chain.from_iterable(found), key=lambda obj: obj.id)))
+        self._owners.put_objs(collection, objs)
+        return objs
+
+    async def _find_one(self, collection: str, obj_id: int) -> BaseModel:
+        objs = await self._find(collection, [obj_id])
+        if not objs:
+            logger.error("Not found %s with id: %s", ENTITY_NAMES[collection], obj_id)
+            raise DBNotFound(f"Not found {ENTITY_NAMES[collection]} with id: {obj_id}")
+        return objs[0]
+
+    async def _get_one(self, collection: str, obj_id: int) -> BaseModel:
+        owner = self._owners.get(collection, obj_id)
+        if owner is not None:
+            try:
+                return await getattr(self._shard(owner), f"get_{ENTITY_NAMES[collection]}")(obj_id)
+            except DBNotFound:
+                self._owners.pop(collection, obj_id)
+        return await self._find_one(collection, obj_id)
+
+    async def _get_by_ids(self, collection: str, obj_ids: list[int]) -> list:
+        """Objects of cached owners are read from their shards, the rest from all shards.
+        Objects not found on the shard of their cached owner are looked up on all shards"""
+        method = f"get_{collection}_by_ids"
+        known: dict[str, list[int]] = dict()
+        unknown = list()
+        for obj_id in dict.fromkeys(obj_ids):
+            owner = self._owners.get(collection, obj_id)
+            if owner is None:
+                unknown.append(obj_id)
+            else:
+                known.setdefault(self.shard_name_of(owner), list()).append(obj_id)
+        calls = [getattr(self._shards[name], method)(ids) for name, ids in known.items()]
+        if unknown:
+            calls.append(self._find(collection, unknown))
+        objs = list(chain.from_iterable(await asyncio.gather(*calls)))
+        found = {obj.id for obj in objs}
+        missed = [obj_id for ids in known.values() for obj_id in ids if obj_id not in found]
+        if missed:
+            for obj_id in missed:
+                self._owners.pop(collection, obj_id)
+            objs.extend(await self._find(collection, missed))
+        return objs
+
+    async def _owners_of(self, collection: str, obj_ids: Iterable[int]) -> dict[int, int]:
+        """Owner user id by object id, missing objects are skipped"""
+        owners = dict()
+        unknown = list()
+        for obj_id in dict.fromkeys(obj_ids):
+            owner = self._owners.get(collection, obj_id)
+            if owner is None:
+                unknown.append(obj_id)
+            else:
+                owners[obj_id] = owner
+        if unknown:
+            owners.update((obj.id, obj.user_id) for obj in await self._find(collection, unknown))
+        return owners
+
+    async def _on_owner(self, collection: str, obj_id: int, call: Callable[[DbApi], Awaitable[T]],
+                        is_write: bool = True) -> T:
+        """Run call on the shard of object owner, writes wait while the owner is moved.
+        Cached owner is checked by the call itself: if its shard doesn't have the object, it is looked up"""
+        owner = self._owners.get(collection, obj_id)
+        if owner is not None:
+            try:
+                return await self._on_user(owner, call, is_write)
+            except DBNotFound:
+                self._owners.pop(collection, obj_id)
+        owner = (await self._find_one(collection, obj_id)).user_id
+        return await self._on_user(owner, call, is_write)
+
+    async def _on_user(self, user_id: int, call: Callable[[DbApi], Awaitable[T]], is_write: bool = True) -> T:
+        if not is_write:
+            return await call(self._shard(user_id))
+        async with self._gate.writing([user_id]):
+            return await call(self._shard(user_id))
+
+    # ----- Condition reads ----- #
+    async def _get_all(self, collection: str, query: Callable[[DbApi], Awaitable[list]], condition: dict,
+                       list_length: int = LIST_LENGTH) -> list:
+        """Objects of the only shard condition pins, else merged from all shards by id"""
+        names = self._condition_shards(collection, condition)
+        if len(names) == 1:
+            objs = await query(self._shards[names[0]])
+            self._owners.put_objs(collection, objs)
+            return objs
+
+        async def get(db: DbApi) -> list:
+            try:
+                return await query(db)
+            except DBNotFound:
+                return []
+
+        found = await self._fan_out(get, names)
+        objs = list(islice(_unique(sorted(chain.from_iterable(found), key=lambda obj: obj.id)), list_length))
+        if not objs:
+            logger.error("No %s found setting conditions: %s", collection, condition)
+            raise DBNotFound(f"No {collection} found setting conditions: {condition}")
+        self._owners.put_objs(collection, objs)
+        return objs
+
+    async def _iter_by_condition(self, collection: str, condition: dict, batch_size: int,
+                                 start_after: int | None, fields: list[str] | None) -> AsyncIterator[list]:
+        """Batches ordered by _id like of a single db, so the last id of a batch is a continuation token
+        for every shard too"""
+        method = f"iter_{collection}_by_condition"
+        streams = [
+            getattr(self._shards[name], method)(condition, batch_size, start_after, fields)
+            for name in self._condition_shards(collection, condition)
+        ]
+        batches = streams[0] if len(streams) == 1 else _merge_batches(streams, batch_size)
+        async for batch in batches:
+            self._owners.put_objs(collection, batch)
+            yield batch
+
+    # ----- Writes ----- #
+    async def _write_new(self, collection: str, obj: BaseModel, user_id: int) -> int:
+        async with self._gate.writing([user_id]):
+            obj_id = await getattr(self._shard(user_id), f"write_new_{ENTITY_NAMES.get(collection, 'user')}")(obj)
+        self._owners.put_objs(collection, [obj])
+        return obj_id
+
+    async def _write_many(self, collection: str, objs: list[BaseModel], chunk_size: int) -> BulkWriteResult:
+        """Write objs grouped by shard in parallel, result ids are in objs order"""
+        user_id_of = (lambda obj: obj.id) if collection == "users" else (lambda obj: obj.user_id)
+        async with self._gate.writing(user_id_of(obj) for obj in objs):
+            results = await asyncio.gather(*(
+                getattr(self._shards[name], f"write_many_{collection}")(group, chunk_size)
+                for name, group in self._by_shard(objs, user_id_of).items()
+            ))
+        positions = dict()
+        for position, obj in enumerate(objs):
+            positions.setdefault(obj.id, position)
+        result = BulkWriteResult(
+            inserted_ids=sorted(chain.from_iterable(r.inserted_ids for r in results), key=positions.get),
+            duplicate_ids=sorted(chain.from_iterable(r.duplicate_ids for r in results), key=positions.get)
+        )
+        inserted = set(result.inserted_ids)
+        self._owners.put_objs(collection, (obj for obj in objs if obj.id in inserted))
+        return result
+
+    async def _delete_many(self, collection: str, obj_ids: list[int], chunk_size: int) -> BulkDeleteResult:
+        """Delete objects grouped by shard of their owners in parallel, missing ids are skipped"""
+        if collection == "users":
+            owners = {user_id: user_id for user_id in obj_ids}
+        else:
+            owners = await self._owners_of(collection, obj_ids)
+        async with self._gate.writing(owners.values()):
+            results = await asyncio.gather(*(
+                getattr(self._shards[name], f"delete_many_{collection}")(ids, chunk_size)
+                for name, ids in self._by_shard(owners, owners.get).items()
+            ))
+        for obj_id in owners:
+            self._owners.pop(collection, obj_id)
+        return BulkDeleteResult(
+            requested_count=len(obj_ids), deleted_count=sum(result.deleted_count for result in results)
+        )
+
+    async def _delete_one(self, collection: str, obj_id: int) -> int:
+        method = f"delete_{ENTITY_NAMES[collection]}"
+        deleted_id = await self._on_owner(collection, obj_id, lambda db: getattr(db, method)(obj_id))
+        self._owners.pop(collection, obj_id)
+        return deleted_id
+
+    # ----- Moves ----- #
+    async def move_user(self, user_id: int, shard: str,
+                        batch_size: int = DEFAULT_MOVE_BATCH_SIZE) -> UserMoveResult:
+        """Move user with all its documents to shard: copy them by batches, switch the user to shard,
+        purge it on the old one. Documents left on shard by an interrupted move are purged first.
+        raise ValueError on unknown shard"""
+        self._check_shard(shard)
+        async with self._gate.moving(user_id):
+            source_name = self.shard_name_of(user_id)
+            result = UserMoveResult(user_id=user_id, source=source_name, target=shard)
+            if source_name == shard:
+                self._place(user_id, shard)
+                return result
+            source, target = self._shards[source_name], self._shards[shard]
+            await target.purge_user(user_id)
+            users = await source.get_users_by_ids([user_id])
+            if users:
+                await target.write_many_users(users)
+            result.copied_counts["users"] = len(users)
+            for collection in USER_OWNED_COLLECTIONS:
+                result.copied_counts[collection] = 0
+                batches = getattr(source, f"iter_{collection}_by_condition")({"user_id": user_id}, batch_size)
+                async for batch in batches:
+                    written = await getattr(target, f"write_many_{collection}")(batch)
+                    result.copied_counts[collection] += len(written.inserted_ids)
+            self._place(user_id, shard)
+            await source.purge_user(user_id)
+        logger.info("Success move user with id: %s from %s to %s, copied: %s",
+                    user_id, source_name, shard, result.copied_counts)
+        return result
+
+    async def reshard(self, shards: dict[str, DbApi], concurrency: int = 1,
+                      batch_size: int = DEFAULT_MOVE_BATCH_SIZE) -> list[UserMoveResult]:
+        """Switch to the ring of shards (e.g. with a shard added or removed) and move every user
+        whose shard changes, up to concurrency users at once. Removed shards are read until their users
+        are moved out, then closed and dropped. Before the switch users of all shards are listed and routed:
+        while resharding, a user routed to a shard it is about to leave is pinned there, new users too,
+        so no user is looked for on its new shard before it is moved. Users placed explicitly stay,
+        unless placed on a removed shard"""
+        if self._next_ring is not None:
+            raise ValueError("Resharding is already in progress")
+        ring = HashRing(list(shards), self._ring.vnodes)
+        self._shards.update(shards)
+        self._next_ring = ring
+        try:
+            # Users written before are routed already and could be missed by the listing
+            await self._gate.settled(self._gate.writing_users())
+            for name in self._ring.names:
+                async for users in self._shards[name].iter_users_by_condition({}, batch_size, fields=["id"]):
+                    for user in users:
+                        self.shard_name_of(user.id)
+            self._pending_moves.update(user_id for user_id, name in self._placements.items() if name not in shards)
+            self._ring = ring
+        finally:
+            self._next_ring = None
+        pending, self._pending_moves = self._pending_moves, set()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def move(user_id: int) -> UserMoveResult:
+            async with semaphore:
+                return await self.move_user(user_id, ring.shard_for(user_id), batch_size)
+
+        results = await asyncio.gather(*(move(user_id) for user_id in sorted(pending)))
+        placed = set(self._placements.values())
+        for name in [name for name in self._shards if name not in shards and name not in placed]:
+            self._close_shard(self._shards.pop(name))
+        logger.info("Success reshard to %s, moved %s users", list(shards), len(results))
+        return list(results)
+
+    @staticmethod
+    def _close_shard(db: DbApi) -> None:
+        """Close client of dropped shard, backends without clients have nothing to close"""
+        close = getattr(db, "close", None)
+        if close is not None:
+            close()
+
+    # ----- Users ----- #
+    async def get_user(self, user_id: int) -> UserModel:
+        return await self._shard(user_id).get_user(user_id)
+
+    async def get_users_by_ids(self, user_ids: list[int]) -> list[UserModel]:
+        found = await asyncio.gather(*(
+            self._shards[name].get_users_by_ids(ids)
+            for name, ids in self._by_shard(dict.fromkeys(user_ids), lambda user_id: user_id).items()
+        ))
+        return list(chain.from_iterable(found))
+
+    def iter_users_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[UserModel]]:
+        return self._iter_by_condition("users", condition, batch_size, start_after, fields)
+
+    async def write_new_user(self, user: UserModel) -> int:
+        return await self._write_new("users", user, user.id)
+
+    async def write_many_users(self, users: list[UserModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return await self._write_many("users", users, chunk_size)
+
+    async def delete_user(self, user_id: int) -> int:
+        return await self._on_user(user_id, lambda db: db.delete_user(user_id))
+
+    async def delete_many_users(self, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return await self._delete_many("users", user_ids, chunk_size)
+
+    async def purge_user(self, user_id: int, use_transaction: bool | None = None,
+                         on_progress: Callable[[str, int], None] | None = None) -> PurgeResult:
+        return await self._on_user(user_id, lambda db: db.purge_user(user_id, use_transaction, on_progress))
+
+    async def get_user_summary(self, user_id: int) -> UserSummary:
+        return await self._shard(user_id).get_user_summary(user_id)
+
+    async def rebuild_user_summaries(self, user_ids: list[int] | None = None) -> int:
+        if user_ids is None:
+            return sum(await self._fan_out(lambda db: db.rebuild_user_summaries(None)))
+        async with self._gate.writing(user_ids):
+            counts = await asyncio.gather(*(
+                self._shards[name].rebuild_user_summaries(ids)
+                for name, ids in self._by_shard(dict.fromkeys(user_ids), lambda user_id: user_id).items()
+            ))
+        return sum(counts)
+
+    async def reserve_id_block(self, entity: str, size: int) -> int:
+        return await self._shards[self._id_shard].reserve_id_block(entity, size)
+
+    # ----- Themes ----- #
+    async def get_theme(self, theme_id: int) -> ThemeModel:
+        return await self._get_one("themes", theme_id)
+
+    async def get_themes_by_ids(self, theme_ids: list[int]) -> list[ThemeModel]:
+        return await self._get_by_ids("themes", theme_ids)
+
+    async def write_new_theme(self, theme: ThemeModel) -> int:
+        return await self._write_new("themes", theme, theme.user_id)
+
+    async def get_all_themes_by_condition(self, condition: dict,
+                                          fields: list[str] | None = None) -> list[ThemeModel]:
+        return await self._get_all(
+            "themes", lambda db: db.get_all_themes_by_condition(condition, fields=fields), condition
+        )
+
+    def iter_themes_by_condition(self, condition: dict, batch_size: int = 100,
+                                 start_after: int | None = None,
+                                 fields: list[str] | None = None) -> AsyncIterator[list[ThemeModel]]:
+        return self._iter_by_condition("themes", condition, batch_size, start_after, fields)
+
+    async def get_theme_tree(self, user_id: int | None = None, root_theme_id: int | None = None,
+                             max_depth: int | None = None) -> list[ThemeTreeNode]:
+        """Theme tree is built by the shard of its user, the user of root theme is looked up by its id"""
+        if (user_id is None) == (root_theme_id is None):
+            raise ValueError("Exactly one of user_id and root_theme_id must be set")
+        if user_id is not None:
+            return await self._shard(user_id).get_theme_tree(user_id, None, max_depth)
+        return await self._on_owner(
+            "themes", root_theme_id, lambda db: db.get_theme_tree(None, root_theme_id, max_depth), is_write=False
+        )
+
+    async def search_themes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        return await self._shard(user_id).search_themes(user_id, query, limit, offset)
+
+    async def write_many_themes(self, themes: list[ThemeModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return await self._write_many("themes", themes, chunk_size)
+
+    async def delete_many_themes(self, theme_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return await self._delete_many("themes", theme_ids, chunk_size)
+
+    async def delete_theme(self, theme_id: int) -> int:
+        return await self._delete_one("themes", theme_id)
+
+    # ----- Notions ----- #
+    async def get_notion(self, notion_id: int) -> NotionModel:
+        return await self._get_one("notions", notion_id)
+
+    async def get_notions_by_ids(self, notion_ids: list[int]) -> list[NotionModel]:
+        return await self._get_by_ids("notions", notion_ids)
+
+    async def write_new_notion(self, notion: NotionModel) -> int:
+        return await self._write_new("notions", notion, notion.user_id)
+
+    async def get_all_notion_by_condition(self, condition: dict, list_length: int = 100,
+                                          fields: list[str] | None = None) -> list[NotionModel]:
+        return await self._get_all(
+            "notions", lambda db: db.get_all_notion_by_condition(condition, list_length, fields), condition, list_length
+        )
+
+    def iter_notions_by_condition(self, condition: dict, batch_size: int = 100,
+                                  start_after: int | None = None,
+                                  fields: list[str] | None = None) -> AsyncIterator[list[NotionModel]]:
+        return self._iter_by_condition("notions", condition, batch_size, start_after, fields)
+
+    async def write_many_notions(self, notions: list[NotionModel],
+                                 chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return await self._write_many("notions", notions, chunk_size)
+
+    async def delete_many_notions(self, notion_ids: list[int],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return await self._delete_many("notions", notion_ids, chunk_size)
+
+    async def get_notions_due_before(self, until: datetime.datetime, limit: int = 1000) -> list[NotionModel]:
+        """Up to limit due notions of every shard merged by (next_notion_time, _id)"""
+        found = await self._fan_out(lambda db: db.get_notions_due_before(until, limit))
+        notions = list(islice(
+            _unique(heapq.merge(*found, key=lambda notion: (notion.next_notion_time, notion.id))), limit
+        ))
+        self._owners.put_objs("notions", notions)
+        return notions
+
+    async def get_notions_in_window(self, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                                    limit: int = 100, cursor: str | None = None) -> NotionPage:
+        return await self._shard(user_id).get_notions_in_window(user_id, start, end, limit, cursor)
+
+    async def set_notions_next_time(self, schedule: dict[int, datetime.datetime | None],
+                                    expected_times: dict[int, datetime.datetime | None] | None = None) -> int:
+        """Schedule is split by shards of notion owners and applied in parallel"""
+        owners = await self._owners_of("notions", schedule)
+        async with self._gate.writing(owners.values()):
+            counts = await asyncio.gather(*(
+                self._shards[name].set_notions_next_time(
+                    {notion_id: schedule[notion_id] for notion_id in ids},
+                    {notion_id: expected_times[notion_id] for notion_id in ids if notion_id in expected_times}
+                    if expected_times is not None else None
+                )
+                for name, ids in self._by_shard(owners, owners.get).items()
+            ))
+        return sum(counts)
+
+    async def reschedule_notion(self, notion_id: int, next_time: datetime.datetime | None,
+                                expected: dict | None = None) -> int:
+        return await self._on_owner(
+            "notions", notion_id, lambda db: db.reschedule_notion(notion_id, next_time, expected)
+        )
+
+    async def delete_notion(self, notion_id: int) -> int:
+        return await self._delete_one("notions", notion_id)
+
+    # ----- Notes ----- #
+    async def write_new_note(self, note: NoteModel) -> int:
+        return await self._write_new("notes", note, note.user_id)
+
+    async def get_note(self, note_id: int) -> NoteModel:
+        return await self._get_one("notes", note_id)
+
+    async def get_notes_by_ids(self, note_ids: list[int]) -> list[NoteModel]:
+        return await self._get_by_ids("notes", note_ids)
+
+    async def get_all_notes_by_condition(self, condition: dict, list_length: int = 100,
+                                         fields: list[str] | None = None) -> list[NoteModel]:
+        return await self._get_all(
+            "notes", lambda db: db.get_all_notes_by_condition(condition, list_length, fields), condition, list_length
+        )
+
+    def iter_notes_by_condition(self, condition: dict, batch_size: int = 100,
+                                start_after: int | None = None,
+                                fields: list[str] | None = None) -> AsyncIterator[list[NoteModel]]:
+        return self._iter_by_condition("notes", condition, batch_size, start_after, fields)
+
+    async def write_many_notes(self, notes: list[NoteModel], chunk_size: int = BULK_CHUNK_SIZE) -> BulkWriteResult:
+        return await self._write_many("notes", notes, chunk_size)
+
+    async def delete_many_notes(self, note_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE) -> BulkDeleteResult:
+        return await self._delete_many("notes", note_ids, chunk_size)
+
+    async def delete_note(self, note_id: int) -> int:
+        return await self._delete_one("notes", note_id)
+
+    async def search_notes(self, user_id: int, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        return await self._shard(user_id).search_notes(user_id, query, limit, offset)
+
+    async def update_note_fields(self, note_id: int, fields: dict, expected: dict | None = None) -> int:
+        """Note given to a user of another shard is moved there: the updated note is written to the new shard
+        first, then deleted from the old one, so a failed write leaves the note as it was"""
+        values = validate_note_fields(fields)
+        if "user_id" not in values:
+            return await self._on_owner(
+                "notes", note_id, lambda db: db.update_note_fields(note_id, fields, expected)
+            )
+        owner = (await self._find_one("notes", note_id)).user_id
+        async with self._gate.writing([owner, values["user_id"]]):
+            source, target = self._shard(owner), self._shard(values["user_id"])
+            if target is source:
+                await source.update_note_fields(note_id, fields, expected)
+            else:
+                doc = (await source.get_note(note_id)).dict(by_alias=True)
+                if not matches(doc, expected or dict()):
+                    logger.warning("Conflict on update of note with id: %s", note_id)
+                    raise DBConflict(f"Note with id: {note_id} doesn't match expected state")
+                await target.write_new_note(NoteModel.parse_obj({**doc, **values}))
+                await source.delete_note(note_id)
+        self._owners.put("notes", note_id, values["user_id"])
+        return note_id
+
+    async def append_check_point(self, note_id: int, check_point: CheckPointModel,
+                                 expected: dict | None = None) -> int:
+        return await self._on_owner(
+            "notes", note_id, lambda db: db.append_check_point(note_id, check_point, expected)
+        )
+
+    async def remove_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> int:
+        return await self._on_owner(
+            "notes", note_id, lambda db: db.remove_check_point(note_id, index, key, expected)
+        )
+
+    async def toggle_check_point(self, note_id: int, index: int | None = None,
+                                 key: datetime.datetime | None = None, expected: dict | None = None) -> bool:
+        return await self._on_owner(
+            "notes", note_id, lambda db: db.toggle_check_point(note_id, index, key, expected)
+        )
@@ -0,0 +1,74 @@
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from fastapi import FastAPI, Request
+
+from main.utils.DbApi.InstrumentedAPI import InstrumentedDbApi
+from main.utils.DbApi.MemoryAPI import MemoryDbApi
+from main.utils.DbApi.MongoAPI import DbApi, MongoDbApi
+from main.utils.DbApi.ShardedAPI import ShardedDbApi
+from main.utils.DbApi.ids import IdAllocator
+from main.utils.metrics import CommandMetricsListener, PoolMetricsListener
+from main.utils.settings import MongoSettings
+
+logger = logging.getLogger("app.db")
+
+
+@asynccontextmanager
+async def open_db(settings: MongoSettings) -> AsyncIterator[DbApi]:
+    """Create db with one pooled client, warm the pool up and ensure indexes before yielding it.
+    Client is closed on exit. With shards set, one db is opened per shard and routed by ShardedDbApi"""
+    if settings.shards:
+        async with AsyncExitStack() as stack:
+            shards = dict()
+            for name, connection_string in settings.shards.items():
+                shard_settings = settings.copy(update={"connection_string": connection_string, "shards": {}})
+                shards[name] = await stack.enter_async_context(open_db(shard_settings))
+            logger.info("Using %s shards: %s", len(shards), list(shards))
+            yield ShardedDbApi(shards, settings.shard_vnodes, settings.shard_placements)
+        return
+
+    if settings.backend == "memory":
+        logger.info("Using in-memory db")
+        yield MemoryDbApi(strict_reads=settings.strict_reads)
+        return
+
+    db = MongoDbApi(
+        settings.connection_string,
+        is_test=settings.is_test,
+        strict_reads=settings.strict_reads,
+        event_listeners=[PoolMetricsListener(), CommandMetricsListener()],
+        **settings.client_options()
+    )
+    try:
+        await db.warmup(settings.warmup_connections)
+        if settings.ensure_indexes:
+            await db.ensure_indexes()
+        yield db
+    finally:
+        db.close()
+
+
+def db_lifespan(settings: MongoSettings | None = None) -> Callable[[FastAPI], AsyncIterator[None]]:
+    """FastAPI lifespan owning the db of the worker process: every uvicorn worker runs it once,
+    so each worker has exactly one client, opened before the worker accepts requests"""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        async with open_db(settings or MongoSettings()) as db:
+            app.state.db = InstrumentedDbApi(db)
+            app.state.ids = IdAllocator(app.state.db)
+            yield
+
+    return lifespan
+
+
+def get_db(request: Request) -> DbApi:
+    """Dependency for routes: db of the app, created by db_lifespan"""
+    return request.app.state.db
+
+
+def get_id_allocator(request: Request) -> IdAllocator:
+    """Dependency for routes: id allocator of the app, created by db_lifespan"""
+    return request.app.state.ids
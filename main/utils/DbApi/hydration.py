@@ -0,0 +1,71 @@
+from typing import Callable
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST
+
+Decoder = Callable[[dict], BaseModel]
+
+_decoders: dict[type[BaseModel], Decoder] = dict()
+
+
+def _compile_decoder(model: type[BaseModel]) -> Decoder:
+    """Build decoder creating model from trusted document without validation.
+    Nested models (single or list) are decoded recursively, unknown keys are dropped,
+    absent optional fields get their defaults and absent required ones stay unset"""
+    specs = list()
+    for name, field in model.__fields__.items():
+        nested = None
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            nested = get_decoder(field.type_)
+        specs.append((name, field.alias, field, nested, field.shape == SHAPE_LIST))
+
+    def decode(doc: dict) -> BaseModel:
+        values = dict()
+        fields_set = set()
+        for name, alias, field, nested, is_list in specs:
+            if alias in doc:
+                value = doc[alias]
+            elif name in doc:
+                value = doc[name]
+            else:
+                if not field.required:
+                    values[name] = field.get_default()
+                continue
+            if nested is not None and value is not None:
+                value = [nested(item) for item in value] if is_list else nested(value)
+            values[name] = value
+            fields_set.add(name)
+        # Same as model.construct(), without its second pass over fields
+        obj = model.__new__(model)
+        object.__setattr__(obj, "__dict__", values)
+        object.__setattr__(obj, "__fields_set__", fields_set)
+        obj._init_private_attributes()
+        return obj
+
+    return decode
+
+
+def get_decoder(model: type[BaseModel]) -> Decoder:
+    decoder = _decoders.get(model)
+    if decoder is None:
+        decoder = _decoders[model] = _compile_decoder(model)
+    return decoder
+
+
+def hydrate(model: type[BaseModel], doc: dict, strict: bool = False) -> BaseModel:
+    """Create model from db document.
+    Documents written through validated models are trusted and built without validation,
+    strict mode runs full parse_obj validation and is meant for debugging"""
+    if strict:
+        return model.parse_obj(doc)
+    return get_decoder(model)(doc)
+
+
+def projection(model: type[BaseModel], fields: list[str] | None) -> dict | None:
+    """Mongo projection for model field names, None means whole document"""
+    if fields is None:
+        return None
+    unknown = set(fields) - model.__fields__.keys()
+    if unknown:
+        raise ValueError(f"Unknown {model.__name__} fields: {sorted(unknown)}")
+    return {model.__fields__[field].alias: 1 for field in fields}
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+from main.utils.DbApi.MongoAPI import DbApi
+
+logger = logging.getLogger("app.db.ids")
+
+DEFAULT_BLOCK_SIZE = 100
+
+
+class _IdBlock:
+    __slots__ = ("next", "end", "lock")
+
+    def __init__(self):
+        self.next = 0
+        self.end = 0
+        self.lock = asyncio.Lock()
+
+
+class IdAllocator:
+    """Hand out new _id values of entities from blocks reserved in db.
+    An id is taken from the current block without I/O, a new block is reserved with one db call
+    when it runs out, concurrent callers wait for the same reservation instead of making their own.
+    Blocks are unique across processes, so ids never clash and writes don't need collision retries.
+    Ids left in the block when the process stops are skipped, ids are unique, but not gapless"""
+
+    def __init__(self, db: DbApi, block_size: int = DEFAULT_BLOCK_SIZE):
+        if block_size <= 0:
+            raise ValueError(f"block_size must be positive, got: {block_size}")
+        self._db = db
+        self._block_size = block_size
+        self._blocks: dict[str, _IdBlock] = dict()
+
+    async def next_id(self, entity: str) -> int:
+        """Get new id for entity: users, themes, notes or notions"""
+        block = self._blocks.get(entity)
+        if block is None:
+            block = self._blocks.setdefault(entity, _IdBlock())
+        while block.next >= block.end:
+            async with block.lock:
+                # Block could be refilled while waiting for the lock
+                if block.next >= block.end:
+                    block.next = await self._db.reserve_id_block(entity, self._block_size)
+                    block.end = block.next + self._block_size
+        block.next += 1
+        return block.next - 1
+
+    async def next_ids(self, entity: str, count: int) -> list[int]:
+        """Get count new ids for entity, e.g. for write_many_*. Big counts are reserved as one block"""
+        if count >= self._block_size:
+            first = await self._db.reserve_id_block(entity, count)
+            return list(range(first, first + count))
+        return [await self.next_id(entity) for _ in range(count)]
@@ -0,0 +1,55 @@
+from pymongo import ASCENDING, TEXT, IndexModel
+
+# Notions without next_notion_time are never due, so they are kept out of the time index.
+# Queries must repeat this filter ({"$type": "date"}) for the planner to pick the index
+NEXT_NOTION_TIME_FILTER = {"next_notion_time": {"$type": "date"}}
+
+# Searchable text fields and their weights. Text indexes are prefixed with user_id, so searches
+# are scoped to one user without scanning others. No language: names are in any language, so
+# terms are not stemmed and stop words are kept, the same as in the in-memory search index
+SEARCH_FIELDS: dict[str, dict[str, int]] = {
+    "themes": {"name": 10, "description": 3},
+    "notes": {"name": 10, "description": 3, "check_points.text": 1},
+}
+
+
+def _text_index(collection: str) -> IndexModel:
+    return IndexModel(
+        [("user_id", ASCENDING)] + [(field, TEXT) for field in SEARCH_FIELDS[collection]],
+        name="user_id_text",
+        weights=SEARCH_FIELDS[collection],
+        default_language="none"
+    )
+
+
+INDEXES: dict[str, list[IndexModel]] = {
+    "users": [
+        IndexModel([("tg_id", ASCENDING)], name="tg_id"),
+    ],
+    "themes": [
+        IndexModel([("user_id", ASCENDING), ("parent_id", ASCENDING)], name="user_id_parent_id"),
+        IndexModel([("parent_id", ASCENDING)], name="parent_id"),
+        _text_index("themes"),
+    ],
+    "notions": [
+        IndexModel([("user_id", ASCENDING), ("creation_time", ASCENDING)], name="user_id_creation_time"),
+        IndexModel([("parent_id", ASCENDING)], name="parent_id"),
+        IndexModel(
+            [("next_notion_time", ASCENDING), ("_id", ASCENDING)],
+            name="next_notion_time",
+            partialFilterExpression=NEXT_NOTION_TIME_FILTER
+        ),
+        # The earliest scheduled notion of user, for summary next_notion
+        IndexModel(
+            [("user_id", ASCENDING), ("next_notion_time", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_next_notion_time",
+            partialFilterExpression=NEXT_NOTION_TIME_FILTER
+        ),
+    ],
+    "notes": [
+        IndexModel([("user_id", ASCENDING), ("creation_time", ASCENDING)], name="user_id_creation_time"),
+        IndexModel([("notion_id", ASCENDING)], name="notion_id"),
+        IndexModel([("check_points.notion_id", ASCENDING)], name="check_points_notion_id", sparse=True),
+        _text_index("notes"),
+    ],
+}
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.exceptons import DBNotFound
+
+logger = logging.getLogger("app.db.loader")
+
+BatchGetter = Callable[[list[int]], Awaitable[list[BaseModel]]]
+
+
+class BatchLoader:
+    """Coalesce by-id loads of one entity made in the same event loop tick
+    into a single batch query, like DataLoader does.
+
+    Every caller gets its own obj or DBNotFound for its own missing id,
+    concurrent loads of the same id share one slot in the batch"""
+
+    def __init__(self, entity: str, batch_getter: BatchGetter, max_batch_size: int = 1000):
+        self._entity = entity
+        self._batch_getter = batch_getter
+        self._max_batch_size = max_batch_size
+        self._pending: dict[int, asyncio.Future] = dict()
+
+    async def load(self, obj_id: int) -> BaseModel:
+        future = self._pending.get(obj_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                # Runs after all callbacks already scheduled for this tick, so they join the batch
+                loop.call_soon(self._dispatch)
+            future = loop.create_future()
+            self._pending[obj_id] = future
+        # Shield shared future from cancellation of a single caller
+        return await asyncio.shield(future)
+
+    async def load_many(self, obj_ids: list[int]) -> list[BaseModel]:
+        """Load objs in ids order, raise DBNotFound if any of them is missing"""
+        return list(await asyncio.gather(*(self.load(obj_id) for obj_id in obj_ids)))
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, dict()
+        obj_ids = list(pending)
+        for start in range(0, len(obj_ids), self._max_batch_size):
+            batch = {obj_id: pending[obj_id] for obj_id in obj_ids[start:start + self._max_batch_size]}
+            asyncio.ensure_future(self._load_batch(batch))
+
+    async def _load_batch(self, batch: dict[int, asyncio.Future]) -> None:
+        try:
+            objs = await self._batch_getter(list(batch))
+        except Exception as err:
+            logger.error("Can't load %s batch of %s ids: %r", self._entity, len(batch), err)
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(err)
+            return
+
+        found = {obj.id: obj for obj in objs}
+        for obj_id, future in batch.items():
+            if future.done():
+                continue
+            if obj_id in found:
+                future.set_result(found[obj_id])
+            else:
+                future.set_exception(DBNotFound(f"No {self._entity} found with id: {obj_id}"))
+
+
+class DbLoader:
+    """Batch loaders for every entity of one DbApi, create one per request or handler
+    to coalesce by-id lookups made concurrently, e.g. notions of all note checkpoints"""
+
+    def __init__(self, db: DbApi, max_batch_size: int = 1000):
+        self._users = BatchLoader("user", db.get_users_by_ids, max_batch_size)
+        self._themes = BatchLoader("theme", db.get_themes_by_ids, max_batch_size)
+        self._notes = BatchLoader("note", db.get_notes_by_ids, max_batch_size)
+        self._notions = BatchLoader("notion", db.get_notions_by_ids, max_batch_size)
+
+    async def get_user(self, user_id: int) -> UserModel:
+        return await self._users.load(user_id)
+
+    async def get_theme(self, theme_id: int) -> ThemeModel:
+        return await self._themes.load(theme_id)
+
+    async def get_note(self, note_id: int) -> NoteModel:
+        return await self._notes.load(note_id)
+
+    async def get_notion(self, notion_id: int) -> NotionModel:
+        return await self._notions.load(notion_id)
+
+    async def get_users(self, user_ids: list[int]) -> list[UserModel]:
+        return await self._users.load_many(user_ids)
+
+    async def get_themes(self, theme_ids: list[int]) -> list[ThemeModel]:
+        return await self._themes.load_many(theme_ids)
+
+    async def get_notes(self, note_ids: list[int]) -> list[NoteModel]:
+        return await self._notes.load_many(note_ids)
+
+    async def get_notions(self, notion_ids: list[int]) -> list[NotionModel]:
+        return await self._notions.load_many(notion_ids)
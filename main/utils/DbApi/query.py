@@ -0,0 +1,208 @@
+"""Evaluation of Mongo query conditions on plain python documents.
+
+Supports the subset of the query language the app uses: implicit and $eq equality,
+$ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $type, $regex, $elemMatch, $not
+and logical $and, $or, $nor. Dotted paths go through embedded documents and arrays,
+a condition on an array field matches if the array itself or any element matches,
+comparisons only match values of the same type bracket, like in Mongo
+"""
+import datetime
+import re
+from numbers import Number
+from typing import Any
+
+_MISSING = object()
+
+_TYPE_ALIASES = {
+    "double": float,
+    "string": str,
+    "object": dict,
+    "array": list,
+    "bool": bool,
+    "date": datetime.datetime,
+    "int": int,
+    "long": int,
+}
+
+
+class QueryError(ValueError):
+    ...
+
+
+def _type_bracket(value: Any) -> type | None:
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, Number):
+        return Number
+    for bracket in (str, datetime.datetime, dict, list):
+        if isinstance(value, bracket):
+            return bracket
+    return None
+
+
+def _compare(left: Any, right: Any, operator: str) -> bool:
+    if left is None or right is None or _type_bracket(left) is not _type_bracket(right):
+        return False
+    if operator == "$gt":
+        return left > right
+    if operator == "$gte":
+        return left >= right
+    if operator == "$lt":
+        return left < right
+    return left <= right
+
+
+def _is_type(value: Any, type_name: str) -> bool:
+    if type_name == "null":
+        return value is None
+    if type_name in ("int", "long"):
+        return isinstance(value, int) and not isinstance(value, bool)
+    if type_name == "number":
+        return isinstance(value, Number) and not isinstance(value, bool)
+    if type_name not in _TYPE_ALIASES:
+        raise QueryError(f"Unsupported $type: {type_name}")
+    return isinstance(value, _TYPE_ALIASES[type_name])
+
+
+def resolve_path(doc: Any, path: str) -> list:
+    """Get all values at dotted path, arrays on the way are expanded.
+    Numeric path parts index arrays. Empty list means the path is missing"""
+    values = [doc]
+    for part in path.split("."):
+        next_values = list()
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        next_values.append(value[int(part)])
+                else:
+                    next_values.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = next_values
+    return values
+
+
+def _candidates(values: list) -> list:
+    """Values to test: every value and every element of array values"""
+    result = list()
+    for value in values:
+        result.append(value)
+        if isinstance(value, list):
+            result.extend(value)
+    return result
+
+
+def _match_operator(values: list, operator: str, argument: Any) -> bool:
+    if operator == "$exists":
+        return bool(values) == bool(argument)
+    if operator == "$eq":
+        if argument is None and not values:
+            return True
+        return any(value == argument for value in _candidates(values))
+    if operator == "$ne":
+        return not _match_operator(values, "$eq", argument)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(value, argument, operator) for value in _candidates(values))
+    if operator == "$in":
+        return any(_match_operator(values, "$eq", item) for item in argument)
+    if operator == "$nin":
+        return not _match_operator(values, "$in", argument)
+    if operator == "$type":
+        return any(_is_type(value, argument) for value in values)
+    if operator == "$regex":
+        pattern = argument if isinstance(argument, re.Pattern) else re.compile(argument)
+        return any(isinstance(value, str) and pattern.search(value) for value in _candidates(values))
+    if operator == "$elemMatch":
+        for value in values:
+            for item in value if isinstance(value, list) else []:
+                if isinstance(item, dict) and not _is_operator_dict(argument):
+                    if matches(item, argument):
+                        return True
+                elif _match_value([item], argument):
+                    return True
+        return False
+    if operator == "$not":
+        return not _match_value(values, argument)
+    raise QueryError(f"Unsupported query operator: {operator}")
+
+
+def _is_operator_dict(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+
+def _match_value(values: list, expected: Any) -> bool:
+    if _is_operator_dict(expected):
+        options = expected.get("$options", "")
+        for operator, argument in expected.items():
+            if operator == "$options":
+                continue
+            if operator == "$regex" and options:
+                argument = re.compile(argument, _regex_flags(options))
+            if not _match_operator(values, operator, argument):
+                return False
+        return True
+    if isinstance(expected, re.Pattern):
+        return _match_operator(values, "$regex", expected)
+    return _match_operator(values, "$eq", expected)
+
+
+def _regex_flags(options: str) -> int:
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return flags
+
+
+def matches(doc: dict, condition: dict) -> bool:
+    """Check if doc matches Mongo query condition"""
+    for key, expected in condition.items():
+        if key == "$and":
+            if not all(matches(doc, sub_condition) for sub_condition in expected):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub_condition) for sub_condition in expected):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub_condition) for sub_condition in expected):
+                return False
+        elif key.startswith("$"):
+            raise QueryError(f"Unsupported top level operator: {key}")
+        elif not _match_value(resolve_path(doc, key), expected):
+            return False
+    return True
+
+
+def equality_values(condition: dict, field: str) -> list | None:
+    """Values field must be equal to for condition to match, None if condition doesn't pin field.
+    Used to pick candidates from hash indexes"""
+    expected = condition.get(field, _MISSING)
+    if expected is not _MISSING:
+        if not isinstance(expected, dict):
+            return [expected]
+        if "$eq" in expected:
+            return [expected["$eq"]]
+        if "$in" in expected:
+            return list(expected["$in"])
+    for sub_condition in condition.get("$and", []):
+        values = equality_values(sub_condition, field)
+        if values is not None:
+            return values
+    return None
+
+
+def range_bounds(condition: dict, field: str) -> tuple[Any, Any] | None:
+    """Lower and upper bound (inclusive, None if open) of field in condition,
+    None if condition doesn't restrict field by range. Used to scan sorted indexes"""
+    expected = condition.get(field, _MISSING)
+    if isinstance(expected, dict) and any(op in expected for op in ("$gt", "$gte", "$lt", "$lte")):
+        lower = expected.get("$gte", expected.get("$gt"))
+        upper = expected.get("$lte", expected.get("$lt"))
+        return lower, upper
+    for sub_condition in condition.get("$and", []):
+        bounds = range_bounds(sub_condition, field)
+        if bounds is not None:
+            return bounds
+    return None
@@ -0,0 +1,34 @@
+"""Consistent hashing of users to shards.
+
+Every shard owns vnodes points on a 64-bit hash ring and a user belongs to the first point
+at or after the hash of its id. Adding or removing a shard moves only the users of the points
+it takes or gives back, about 1/N of them, and virtual nodes keep shard loads even
+"""
+import bisect
+import hashlib
+
+DEFAULT_VNODES = 128
+
+
+def ring_hash(key: str) -> int:
+    """Hash stable across processes and Python versions, unlike hash() of str"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Immutable ring of shard names, a new shard set is a new ring"""
+
+    def __init__(self, names: list[str], vnodes: int = DEFAULT_VNODES):
+        if not names:
+            raise ValueError("Ring needs at least one shard")
+        if vnodes <= 0:
+            raise ValueError(f"vnodes must be positive, got: {vnodes}")
+        points = sorted((ring_hash(f"{name}#{vnode}"), name) for name in names for vnode in range(vnodes))
+        self.names = tuple(names)
+        self.vnodes = vnodes
+        self._hashes = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def shard_for(self, user_id: int) -> str:
+        position = bisect.bisect_left(self._hashes, ring_hash(str(user_id)))
+        return self._owners[position % len(self._owners)]
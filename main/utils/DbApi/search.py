@@ -0,0 +1,225 @@
+"""Full-text search shared by DbApi backends.
+
+Terms are lowercase word characters runs, without stemming, like in Mongo text index with
+language "none". SearchIndex is an in-process inverted index ranked with BM25 over weighted
+fields (a field occurrence counts as its weight), partitioned by user_id, so a search only
+touches postings of one user and idf is computed within that user's documents
+"""
+import heapq
+import math
+import re
+
+from main.models.db_models import SearchHit, SearchPage
+from main.utils.DbApi.query import resolve_path
+
+TOKEN_RE = re.compile(r"\w+")
+SNIPPET_WIDTH = 120
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Share of average document length change after which all postings are renormalized
+LENGTH_DRIFT = 0.25
+
+
+def tokenize(text: str | None) -> list[str]:
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def field_texts(doc: dict, fields: dict[str, int]) -> list[tuple[str, int]]:
+    """(text, weight) of every string value of searchable fields in doc, in fields order"""
+    return [
+        (value, weight)
+        for field, weight in fields.items()
+        for value in resolve_path(doc, field)
+        if isinstance(value, str)
+    ]
+
+
+def make_snippet(texts: list[str], terms: set[str], width: int = SNIPPET_WIDTH) -> str:
+    """Fragment of the first text with a query term around its first occurrence"""
+    for text in texts:
+        for match in TOKEN_RE.finditer(text):
+            if match.group().lower() in terms:
+                start = max(0, match.start() - width // 3)
+                return _cut(text, start, width)
+    return _cut(texts[0], 0, width) if texts else ""
+
+
+def _cut(text: str, start: int, width: int) -> str:
+    end = min(len(text), start + width)
+    return ("..." if start > 0 else "") + text[start:end].strip() + ("..." if end < len(text) else "")
+
+
+def search_page(hits: list[tuple[float, dict]], fields: dict[str, int], query: str,
+                limit: int, offset: int) -> SearchPage:
+    """Page from up to limit + 1 (score, doc) pairs, the extra one only tells there is a next page"""
+    terms = set(tokenize(query))
+    page = SearchPage(hits=[
+        SearchHit(
+            id=doc["_id"],
+            score=score,
+            snippet=make_snippet([text for text, _ in field_texts(doc, fields)], terms)
+        )
+        for score, doc in hits[:limit]
+    ])
+    if len(hits) > limit:
+        page.next_offset = offset + limit
+    return page
+
+
+def check_page_args(limit: int, offset: int) -> None:
+    if limit <= 0:
+        raise ValueError(f"limit must be positive, got: {limit}")
+    if offset < 0:
+        raise ValueError(f"offset must not be negative, got: {offset}")
+
+
+class _Postings:
+    """Postings of one term: impacts by doc id for lookups and (-impact, doc id) list ordered best first
+    for top-k. Changes are applied to the list lazily on the next search: additions are sorted in
+    at once and entries of removed documents are skipped as stale until they are half of the list"""
+    __slots__ = ("impacts", "_ranked", "_added", "_stale_count")
+
+    def __init__(self):
+        self.impacts: dict[int, float] = dict()
+        self._ranked: list[tuple[float, int]] = list()
+        self._added: list[tuple[float, int]] = list()
+        self._stale_count = 0
+
+    def add(self, doc_id: int, impact: float) -> None:
+        self.impacts[doc_id] = impact
+        self._added.append((-impact, doc_id))
+
+    def remove(self, doc_id: int) -> None:
+        del self.impacts[doc_id]
+        self._stale_count += 1
+
+    def is_current(self, negative_impact: float, doc_id: int) -> bool:
+        return self.impacts.get(doc_id) == -negative_impact
+
+    def ranked(self) -> list[tuple[float, int]]:
+        if self._stale_count * 2 > len(self._ranked):
+            self._ranked = [entry for entry in self._ranked + self._added if self.is_current(*entry)]
+            self._ranked.sort()
+            self._added = list()
+            self._stale_count = 0
+        elif self._added:
+            self._ranked.extend(self._added)
+            self._ranked.sort()
+            self._added = list()
+        return self._ranked
+
+
+class _UserIndex:
+    """Postings of one user documents. A posting keeps BM25 term frequency part of the score,
+    normalized with average document length at the time. All postings are renormalized only when
+    the average drifts by more than LENGTH_DRIFT, so documents are added and removed one by one cheaply"""
+    __slots__ = ("postings", "documents", "total_length", "average_length")
+
+    def __init__(self):
+        self.postings: dict[str, _Postings] = dict()
+        self.documents: dict[int, tuple[dict[str, float], float]] = dict()
+        self.total_length = 0.0
+        self.average_length = 0.0
+
+    def _impact(self, frequency: float, length: float) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.average_length)
+        return frequency * (BM25_K1 + 1) / (frequency + norm)
+
+    def _post(self, doc_id: int, frequencies: dict[str, float], length: float) -> None:
+        for term, frequency in frequencies.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.add(doc_id, self._impact(frequency, length))
+
+    def add(self, doc_id: int, frequencies: dict[str, float], length: float) -> None:
+        self.documents[doc_id] = (frequencies, length)
+        self.total_length += length
+        average_length = self.total_length / len(self.documents)
+        if abs(average_length - self.average_length) <= LENGTH_DRIFT * self.average_length:
+            self._post(doc_id, frequencies, length)
+            return
+        self.average_length = average_length
+        self.postings = dict()
+        for doc_id, (frequencies, length) in self.documents.items():
+            self._post(doc_id, frequencies, length)
+
+    def remove(self, doc_id: int) -> None:
+        frequencies, length = self.documents.pop(doc_id)
+        for term in frequencies:
+            postings = self.postings[term]
+            postings.remove(doc_id)
+            if not postings.impacts:
+                del self.postings[term]
+        self.total_length -= length
+
+    def top(self, terms: set[str], limit: int) -> list[tuple[float, int]]:
+        """Best limit documents by the threshold algorithm: walk ranked postings of all terms
+        in parallel, score every new document fully with lookups, stop when the limit-th best score
+        is not below the best score a document not seen yet could have"""
+        documents_count = len(self.documents)
+        lists = list()
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                count = len(postings.impacts)
+                idf = math.log(1 + (documents_count - count + 0.5) / (count + 0.5))
+                lists.append((idf, postings.ranked(), postings))
+
+        best: list[tuple[float, int]] = list()  # min heap of (score, -doc id), the worst hit on top
+        seen = set()
+        depth = 0
+        while True:
+            threshold = 0.0
+            exhausted = True
+            for idf, ranked, postings in lists:
+                if depth >= len(ranked):
+                    continue
+                exhausted = False
+                negative_impact, doc_id = ranked[depth]
+                # Stale entry impact is still an upper bound of the entries below it
+                threshold -= idf * negative_impact
+                if doc_id in seen or not postings.is_current(negative_impact, doc_id):
+                    continue
+                seen.add(doc_id)
+                score = sum(idf * postings.impacts.get(doc_id, 0.0) for idf, _, postings in lists)
+                if len(best) < limit:
+                    heapq.heappush(best, (score, -doc_id))
+                elif (score, -doc_id) > best[0]:
+                    heapq.heapreplace(best, (score, -doc_id))
+            if exhausted or len(best) == limit and best[0][0] >= threshold:
+                break
+            depth += 1
+        return sorted(((score, -negative_id) for score, negative_id in best), key=lambda hit: (-hit[0], hit[1]))
+
+
+class SearchIndex:
+    """Inverted index of one collection, kept up to date by the collection on every change"""
+
+    def __init__(self, fields: dict[str, int]):
+        self.fields = fields
+        self._users: dict[int, _UserIndex] = dict()
+
+    def add(self, doc: dict) -> None:
+        frequencies: dict[str, float] = dict()
+        for text, weight in field_texts(doc, self.fields):
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        if frequencies:
+            self._users.setdefault(doc["user_id"], _UserIndex()).add(
+                doc["_id"], frequencies, sum(frequencies.values())
+            )
+
+    def remove(self, doc: dict) -> None:
+        user_index = self._users.get(doc["user_id"])
+        if user_index is not None and doc["_id"] in user_index.documents:
+            user_index.remove(doc["_id"])
+            if not user_index.documents:
+                del self._users[doc["user_id"]]
+
+    def search(self, user_id: int, query: str, limit: int) -> list[tuple[float, int]]:
+        """Up to limit (score, doc id) of user documents with any query term, best first"""
+        user_index = self._users.get(user_id)
+        if user_index is None:
+            return []
+        return user_index.top(set(tokenize(query)), limit)
@@ -0,0 +1,113 @@
+"""Per-user summaries shared by DbApi backends.
+
+A summary counts themes, notes, notions and open and finished check points of one user and
+points to the earliest scheduled notion. Every write changes counters by the delta of documents
+it adds or removes, so summaries are read with one lookup by user id instead of counting documents
+"""
+import bisect
+import datetime
+from typing import Callable
+
+# Counter fields of summary, a new user summary has all of them at zero
+SUMMARY_COUNTERS = ("themes", "notes", "notions", "open_check_points", "finished_check_points")
+
+# Document fields summary depends on per collection, the only ones to fetch for a delta
+SUMMARY_FIELDS = {
+    "themes": ("user_id",),
+    "notes": ("user_id", "check_points.is_finish"),
+    "notions": ("user_id", "next_notion_time"),
+}
+
+
+def summary_delta(collection: str, doc: dict, sign: int = 1) -> dict[str, int]:
+    """Change of user counters when doc is added (sign 1) or removed (sign -1)"""
+    delta = {collection: sign}
+    if collection == "notes":
+        finished = sum(1 for check_point in doc["check_points"] if check_point["is_finish"])
+        delta["finished_check_points"] = sign * finished
+        delta["open_check_points"] = sign * (len(doc["check_points"]) - finished)
+    return delta
+
+
+def check_point_delta(is_finish: bool, sign: int = 1) -> dict[str, int]:
+    """Change of user counters when a check point is added (sign 1) or removed (sign -1)"""
+    return {"finished_check_points" if is_finish else "open_check_points": sign}
+
+
+def next_notion_key(doc: dict) -> dict | None:
+    """next_notion value of notion doc, None if it is not scheduled.
+    Time goes first, so embedded documents compare by (time, id) in Mongo $min"""
+    if not isinstance(doc.get("next_notion_time"), datetime.datetime):
+        return None
+    return {"time": doc["next_notion_time"], "id": doc["_id"]}
+
+
+def earlier_key(current: dict | None, key: dict) -> dict:
+    """The earlier of two next_notion values, current may be unset"""
+    if current is None or (key["time"], key["id"]) < (current["time"], current["id"]):
+        return key
+    return current
+
+
+def is_postponed(old_time: datetime.datetime | None, new_time: datetime.datetime | None) -> bool:
+    """Notion scheduled at old_time moved to new_time may stop being the earliest one of its user"""
+    return old_time is not None and (new_time is None or new_time > old_time)
+
+
+class SummaryIndex:
+    """Summaries of MemoryDbApi users, kept up to date by collection index hooks like text index.
+    Scheduled notions of every user are kept as (time, id) pairs ordered by time, so the earliest one
+    is still known after it is removed or postponed. Like Mongo summaries, which are created with users,
+    docs of users for which has_user is false are not counted, and only counted docs are subtracted:
+    the summary is rebuilt when such a user is written"""
+
+    def __init__(self, has_user: Callable[[int], bool] = lambda user_id: True):
+        self._has_user = has_user
+        self._counters: dict[int, dict[str, int]] = dict()
+        self._schedules: dict[int, list[tuple[datetime.datetime, int]]] = dict()
+        self._counted: set[tuple[str, int]] = set()
+
+    def add(self, collection: str, doc: dict) -> None:
+        if self._has_user(doc["user_id"]):
+            self._counted.add((collection, doc["_id"]))
+            self._apply(collection, doc, 1)
+
+    def remove(self, collection: str, doc: dict) -> None:
+        if (collection, doc["_id"]) not in self._counted:
+            return
+        self._counted.discard((collection, doc["_id"]))
+        # Counters of deleted user are dropped with it
+        if self._has_user(doc["user_id"]):
+            self._apply(collection, doc, -1)
+
+    def _apply(self, collection: str, doc: dict, sign: int) -> None:
+        user_id = doc["user_id"]
+        counters = self._counters.setdefault(user_id, dict.fromkeys(SUMMARY_COUNTERS, 0))
+        for field, change in summary_delta(collection, doc, sign).items():
+            counters[field] += change
+        if not any(counters.values()):
+            del self._counters[user_id]
+        key = next_notion_key(doc) if collection == "notions" else None
+        if key is None:
+            return
+        schedule = self._schedules.setdefault(user_id, list())
+        if sign > 0:
+            bisect.insort(schedule, (key["time"], key["id"]))
+        else:
+            position = bisect.bisect_left(schedule, (key["time"], key["id"]))
+            if position < len(schedule) and schedule[position] == (key["time"], key["id"]):
+                del schedule[position]
+            if not schedule:
+                del self._schedules[user_id]
+
+    def clear(self, user_id: int) -> None:
+        self._counters.pop(user_id, None)
+        self._schedules.pop(user_id, None)
+
+    def get(self, user_id: int) -> dict:
+        """Summary document of user, all zero if user has no documents"""
+        summary = {"_id": user_id, **self._counters.get(user_id, dict.fromkeys(SUMMARY_COUNTERS, 0))}
+        schedule = self._schedules.get(user_id)
+        if schedule:
+            summary["next_notion"] = {"time": schedule[0][0], "id": schedule[0][1]}
+        return summary
@@ -0,0 +1,16 @@
+from itertools import chain
+
+from main.models.db_models import ThemeTreeNode
+from main.models.notion_models import ThemeModel
+
+
+def build_theme_tree(roots: list[ThemeModel], descendants: list[ThemeModel]) -> list[ThemeTreeNode]:
+    """Link descendants to their parents by parent_id in one pass and return root nodes.
+    Children keep the order of descendants, themes whose parent is not loaded are dropped"""
+    nodes = {theme.id: ThemeTreeNode.construct(theme=theme, children=[]) for theme in chain(roots, descendants)}
+    root_ids = {root.id for root in roots}
+    for theme in descendants:
+        parent = nodes.get(theme.parent_id)
+        if parent is not None and theme.id not in root_ids:
+            parent.children.append(nodes[theme.id])
+    return [nodes[root.id] for root in roots]
@@ -0,0 +1,42 @@
+"""Validation and addressing shared by partial update methods of DbApi backends.
+
+Check point of a note is addressed by its position (index) or by its creation_time (key),
+which is unique within a note. Both can be given: the check point at index must then still
+have this key, so a concurrent remove that shifted positions is detected as a conflict
+"""
+import datetime
+
+from pydantic import ValidationError
+
+from main.models.notion_models import NoteModel
+
+# check_points are changed with check point methods only, _id is immutable
+NOTE_UPDATABLE_FIELDS = frozenset(NoteModel.__fields__) - {"id", "check_points"}
+
+
+def validate_note_fields(fields: dict) -> dict:
+    """Validate values of note fields to set, return them as they are stored in db"""
+    if not fields:
+        raise ValueError("No note fields to update")
+    result = dict()
+    for name, value in fields.items():
+        if name not in NOTE_UPDATABLE_FIELDS:
+            raise ValueError(f"Note field can't be updated partially: {name}")
+        value, error = NoteModel.__fields__[name].validate(value, dict(), loc=name)
+        if error:
+            raise ValidationError([error], NoteModel)
+        result[name] = value
+    return result
+
+
+def check_point_selector(index: int | None, key: datetime.datetime | None) -> dict:
+    """Condition the note must match for its check point to exist at index and/or key"""
+    if index is None and key is None:
+        raise ValueError("Check point index or key must be set")
+    if index is not None and index < 0:
+        raise ValueError(f"Check point index must not be negative, got: {index}")
+    if index is None:
+        return {"check_points.creation_time": key}
+    if key is None:
+        return {f"check_points.{index}": {"$exists": True}}
+    return {f"check_points.{index}.creation_time": key}
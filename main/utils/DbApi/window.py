@@ -0,0 +1,57 @@
+"""Time window reads of notions shared by DbApi backends.
+
+Notions are ordered by (next_notion_time, _id), which is unique, so the pair of the last notion
+of a page is a keyset cursor: the next page starts right after it whatever was written meanwhile.
+Cursor is passed to clients as an opaque url safe token
+"""
+import base64
+import binascii
+import datetime
+
+from main.models.db_models import NotionPage
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.indexes import NEXT_NOTION_TIME_FILTER
+
+CURSOR_SEPARATOR = "|"
+
+
+def encode_cursor(time: datetime.datetime, notion_id: int) -> str:
+    raw = f"{time.isoformat()}{CURSOR_SEPARATOR}{notion_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """(time, id) of cursor, raise ValueError if it is not a cursor token"""
+    try:
+        time, notion_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(CURSOR_SEPARATOR)
+        return datetime.datetime.fromisoformat(time), int(notion_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError(f"Malformed cursor: {cursor}") from None
+
+
+def check_window_args(start: datetime.datetime, end: datetime.datetime, limit: int) -> None:
+    if start >= end:
+        raise ValueError(f"Window start must be before end, got: {start} - {end}")
+    if limit <= 0:
+        raise ValueError(f"limit must be positive, got: {limit}")
+
+
+def window_condition(user_id: int, start: datetime.datetime, end: datetime.datetime,
+                     cursor: str | None = None) -> dict:
+    """Notions of user scheduled in [start, end) after cursor, a range of user_id_next_notion_time index"""
+    condition = [NEXT_NOTION_TIME_FILTER, {"user_id": user_id, "next_notion_time": {"$gte": start, "$lt": end}}]
+    if cursor is not None:
+        time, notion_id = decode_cursor(cursor)
+        condition.append({"$or": [
+            {"next_notion_time": {"$gt": time}},
+            {"next_notion_time": time, "_id": {"$gt": notion_id}},
+        ]})
+    return {"$and": condition}
+
+
+def notion_page(notions: list[NotionModel], limit: int) -> NotionPage:
+    """Page from up to limit + 1 notions, the extra one only tells there is a next page"""
+    page = NotionPage(notions=notions[:limit])
+    if len(notions) > limit:
+        page.next_cursor = encode_cursor(notions[limit - 1].next_notion_time, notions[limit - 1].id)
+    return page
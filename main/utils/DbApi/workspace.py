@@ -0,0 +1,187 @@
+"""Streaming export and import of user workspace as NDJSON.
+
+Every line is one document: {"collection": "notes", "doc": {...}}, the user goes first,
+then its themes, notes and notions. Export reads collections batch by batch with keyset
+pagination and import writes batches with unordered bulk inserts, waiting for every write
+before reading on, so memory use doesn't depend on workspace size. Gzip is optional on both ends.
+
+Run from repository root, connection is configured with MONGO_* env variables, see MongoSettings:
+    python -m main.utils.DbApi.workspace export 1 --output user_1.ndjson.gz --gzip
+    python -m main.utils.DbApi.workspace import user_1.ndjson.gz
+"""
+import argparse
+import asyncio
+import logging
+import zlib
+from typing import AsyncIterable, AsyncIterator
+
+import orjson
+from pydantic import BaseModel
+
+from main.models.db_models import ImportResult
+from main.models.notion_models import UserModel, NoteModel, NotionModel, ThemeModel
+from main.utils.DbApi.MongoAPI import DbApi, USER_OWNED_COLLECTIONS
+
+logger = logging.getLogger("app.db.workspace")
+
+WORKSPACE_MODELS: dict[str, type[BaseModel]] = {
+    "users": UserModel,
+    "themes": ThemeModel,
+    "notes": NoteModel,
+    "notions": NotionModel,
+}
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+# Mongo document size limit, a longer line can't be a valid document
+MAX_LINE_SIZE = 16 * 1024 * 1024
+
+
+def _line(collection: str, obj: BaseModel) -> bytes:
+    return orjson.dumps({"collection": collection, "doc": obj.dict(by_alias=True)}) + b"\n"
+
+
+async def export_workspace(db: DbApi, user_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Yield NDJSON chunks of user workspace, one chunk per batch.
+    raise DBNotFound on first iteration if there is no user"""
+    user = await db.get_user(user_id)
+    yield _line("users", user)
+    for collection in USER_OWNED_COLLECTIONS:
+        batches = getattr(db, f"iter_{collection}_by_condition")({"user_id": user_id}, batch_size=batch_size)
+        async for batch in batches:
+            yield b"".join(_line(collection, obj) for obj in batch)
+
+
+async def gzip_chunks(chunks: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress stream of chunks to gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _plain_chunks(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Decompress gzip stream (detected by magic bytes) in bounded pieces, pass plain stream as is.
+    Stream may come in chunks of any size, so chunks are buffered until the magic can be checked"""
+    decompressor = None
+    head = b""
+    async for chunk in chunks:
+        if head is not None:
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            if head.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk, head = head, None
+        if decompressor is None:
+            yield chunk
+            continue
+        while chunk:
+            yield decompressor.decompress(chunk, READ_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    if head:
+        # Stream shorter than the magic can only be plain
+        yield head
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+async def ndjson_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split stream of chunks to non-empty lines, gzip stream is decompressed on the fly"""
+    pending = b""
+    async for chunk in _plain_chunks(chunks):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        if len(pending) > MAX_LINE_SIZE:
+            raise ValueError(f"Workspace line is longer than {MAX_LINE_SIZE} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+async def import_workspace(db: DbApi, chunks: AsyncIterable[bytes], user_id: int | None = None,
+                           batch_size: int = DEFAULT_BATCH_SIZE) -> ImportResult:
+    """Validate NDJSON workspace documents and write them with write_many_* in batches.
+    If user_id is set, every document must belong to this user.
+    Documents with ids that already exist are skipped and reported in result.
+    raise ValueError on malformed line, batches before it are already written"""
+    result = ImportResult()
+    batches: dict[str, list[BaseModel]] = {collection: list() for collection in WORKSPACE_MODELS}
+
+    async def flush(collection: str) -> None:
+        # Users go first, summaries of their documents are created with them
+        if collection != "users" and batches["users"]:
+            await flush("users")
+        written = await getattr(db, f"write_many_{collection}")(batches[collection])
+        result.inserted_counts[collection] = result.inserted_counts.get(collection, 0) + len(written.inserted_ids)
+        if written.duplicate_ids:
+            result.duplicate_ids.setdefault(collection, list()).extend(written.duplicate_ids)
+        batches[collection] = list()
+
+    line_number = 0
+    async for line in ndjson_lines(chunks):
+        line_number += 1
+        try:
+            entry = orjson.loads(line)
+            collection = entry["collection"]
+            obj = WORKSPACE_MODELS[collection].parse_obj(entry["doc"])
+            owner_id = obj.id if collection == "users" else obj.user_id
+            if user_id is not None and owner_id != user_id:
+                raise ValueError(f"Document of user {owner_id} in workspace of user {user_id}")
+        except (ValueError, KeyError, TypeError) as err:
+            logger.error("Can't import workspace line %s: %r", line_number, err)
+            raise ValueError(f"Malformed workspace line {line_number}: {err!r}") from err
+        batches[collection].append(obj)
+        if len(batches[collection]) >= batch_size:
+            await flush(collection)
+
+    for collection, batch in batches.items():
+        if batch:
+            await flush(collection)
+    logger.info("Success import workspace: %s", result.inserted_counts)
+    return result
+
+
+async def read_file_chunks(path: str, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+
+
+async def run(args: argparse.Namespace) -> None:
+    from main.utils.DbApi.connection import open_db
+    from main.utils.settings import MongoSettings
+
+    async with open_db(MongoSettings(warmup_connections=1)) as db:
+        if args.command == "export":
+            chunks = export_workspace(db, args.user_id, args.batch_size)
+            if args.gzip:
+                chunks = gzip_chunks(chunks)
+            with open(args.output, "wb") as f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+        else:
+            result = await import_workspace(db, read_file_chunks(args.input), batch_size=args.batch_size)
+            print(result.json(indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import user workspace as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export workspace of user to file")
+    export_parser.add_argument("user_id", type=int)
+    export_parser.add_argument("--output", required=True, help="Path of NDJSON file to write")
+    export_parser.add_argument("--gzip", action="store_true", help="Compress output with gzip")
+    import_parser = commands.add_parser("import", help="Import workspace from NDJSON file, gzip is detected")
+    import_parser.add_argument("input", help="Path of NDJSON file to read")
+    for command_parser in (export_parser, import_parser):
+        command_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,8 @@ class DBException(Exception):
 
 class DBNotFound(DBException):
     ...
+
+
+class DBConflict(DBException):
+    """Object exists, but doesn't match expected state anymore: it was changed concurrently"""
+    ...
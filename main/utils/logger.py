@@ -1,5 +1,17 @@
+import atexit
 import json
 import logging
+import logging.config
+import logging.handlers
+import queue
+import random
+
+import orjson
+
+# Attributes every LogRecord has, everything else on a record came from extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
 
 
 def get_logger_config(path: str) -> dict:
@@ -9,8 +21,119 @@ def get_logger_config(path: str) -> dict:
     return cfg
 
 
-def init_app_logger() -> logging.Logger:
-    """Init and return logger for app logic with name 'app'"""
+class JsonFormatter(logging.Formatter):
+    """Format record as one line JSON object, fields passed with extra= are added as is"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """Pass only rate share of records at level or below of logger name and its children
+    (all loggers by default), more severe records and records of other loggers always pass"""
+
+    def __init__(self, rate: float, level: int = logging.INFO, name: str = ""):
+        super().__init__(name)
+        if not 0 <= rate <= 1:
+            raise ValueError(f"Sampling rate must be in [0, 1], got: {rate}")
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not super().filter(record) or record.levelno > self.level or random.random() < self.rate
+
+
+def _reachable_handlers(logger: logging.Logger) -> list[logging.Handler]:
+    """Handlers records of logger reach: its own and of its ancestors up to the first one not propagating"""
+    handlers = list()
+    current = logger
+    while current is not None:
+        handlers.extend(current.handlers)
+        if not current.propagate:
+            break
+        current = current.parent
+    return handlers
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records together with handlers of the logger they reached, without formatting them:
+    message is built by these handlers in listener thread. So arguments of log calls must not be mutated after the call"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, handlers: list[logging.Handler]):
+        super().__init__(log_queue)
+        self.target_handlers = handlers
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait((self.target_handlers, record))
+
+
+class _RoutingQueueListener(logging.handlers.QueueListener):
+    """Pass every record to handlers it was enqueued with, as loggers have different handlers"""
+
+    def handle(self, item: tuple[list[logging.Handler], logging.LogRecord]) -> None:
+        handlers, record = item
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def init_app_logger(config: dict | None = None, sample_rates: dict[str, float] | None = None) -> logging.Logger:
+    """Init and return logger for app logic with name 'app'.
+    If config is given, it is applied and handlers of configured loggers are moved to one listener thread,
+    loggers only put records to a queue, so file and stream I/O doesn't block the event loop.
+    sample_rates maps logger name to share of its INFO and DEBUG records to keep, e.g. {"app.db": 0.1},
+    children records are sampled too (rates of nested names multiply). Filters are set on handlers these records
+    reach, as logger filters don't see records propagated from children"""
+    global _listener
+    if config is not None:
+        stop_app_logger()
+        logging.config.dictConfig(config)
+
+        log_queue = queue.SimpleQueue()
+        for name in config.get("loggers", dict()):
+            configured_logger = logging.getLogger(name)
+            handlers = configured_logger.handlers[:]
+            if not handlers:
+                continue
+            for handler in handlers:
+                configured_logger.removeHandler(handler)
+            configured_logger.addHandler(_DeferredQueueHandler(log_queue, handlers))
+
+        _listener = _RoutingQueueListener(log_queue)
+        _listener.start()
+
+    for name, rate in (sample_rates or dict()).items():
+        sampling = SamplingFilter(rate, name=name)
+        for handler in _reachable_handlers(logging.getLogger(name)):
+            handler.addFilter(sampling)
+
     logger = logging.getLogger("app")
     logger.info("Application logger was init")
     return logger
+
+
+def stop_app_logger() -> None:
+    """Flush queued records and stop listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_app_logger)
@@ -0,0 +1,67 @@
+"""JSON responses rendered by orjson straight from models and db documents.
+
+FastAPI renders a returned model with .dict() and jsonable_encoder, each a full copy of the data,
+then json.dumps. Here orjson walks models itself: a model is handed to it as its attribute dict
+(a shallow copy only for models with aliases, to rename id to _id), datetimes are rendered natively.
+Routes returning a response of these classes skip FastAPI serialization, response_model still documents them
+"""
+from typing import AsyncIterable, AsyncIterator, Callable, Mapping
+
+import orjson
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+_encoders: dict[type[BaseModel], Callable[[BaseModel], dict]] = dict()
+
+
+def _compile_encoder(model: type[BaseModel]) -> Callable[[BaseModel], dict]:
+    aliases = {name: field.alias for name, field in model.__fields__.items() if field.alias != name}
+    if not aliases:
+        return lambda obj: obj.__dict__
+    return lambda obj: {aliases.get(name, name): value for name, value in obj.__dict__.items()}
+
+
+def _default(obj: object) -> object:
+    """Called by orjson for types it doesn't know, nested models come here one by one"""
+    if isinstance(obj, BaseModel):
+        encoder = _encoders.get(type(obj))
+        if encoder is None:
+            encoder = _encoders[type(obj)] = _compile_encoder(type(obj))
+        return encoder(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: object) -> bytes:
+    """JSON bytes of models, db documents and their combinations, fields by alias like in the db"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class OrjsonResponse(JSONResponse):
+    """Default response class of the app"""
+
+    def render(self, content: object) -> bytes:
+        return dumps(content)
+
+
+async def json_array_chunks(batches: AsyncIterable[list]) -> AsyncIterator[bytes]:
+    """One JSON array of items of all batches, one chunk per batch.
+    Only the current batch is held in memory, so it fits iter_*_by_condition of DbApi"""
+    separator = b"["
+    async for batch in batches:
+        if batch:
+            yield separator + dumps(batch)[1:-1]
+            separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+class StreamingJsonArrayResponse(StreamingResponse):
+    """JSON array streamed from async iterator of batches.
+    The status is sent before the first batch is read, so errors must be checked before"""
+
+    def __init__(self, batches: AsyncIterable[list], status_code: int = 200,
+                 headers: Mapping[str, str] | None = None):
+        super().__init__(json_array_chunks(batches), status_code, headers, media_type="application/json")
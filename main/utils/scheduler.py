@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from typing import Awaitable, Callable
+
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+
+logger = logging.getLogger("app.scheduler")
+
+NotionSink = Callable[[NotionModel], Awaitable[None]]
+RepeatRule = Callable[[NotionModel, datetime.datetime], datetime.datetime | None]
+
+DEFAULT_REPEAT_INTERVAL = datetime.timedelta(days=1)
+
+
+def repeat_every(interval: datetime.timedelta) -> RepeatRule:
+    """Build repeat rule moving repeatable notion forward by interval.
+    Occurrences missed while the scheduler was down are skipped, not fired one by one"""
+    if interval <= datetime.timedelta(0):
+        raise ValueError(f"Repeat interval must be positive, got: {interval}")
+
+    def rule(notion: NotionModel, now: datetime.datetime) -> datetime.datetime | None:
+        if not notion.is_repeatable or notion.next_notion_time is None:
+            return None
+        missed = max((now - notion.next_notion_time) // interval, 0)
+        return notion.next_notion_time + interval * (missed + 1)
+
+    return rule
+
+
+class NotionScheduler:
+    """Fire due notions to sink and move them forward in db.
+
+    Only notions due inside the look-ahead window are kept in memory, in a min-heap
+    by next_notion_time. The window is refilled from db when it is passed or every
+    refresh_interval, so notions written by other processes are picked up too.
+    Fired notions are rescheduled by repeat_rule (None for non repeatable ones)
+    with a single bulk update per tick, unless they were rescheduled meanwhile"""
+
+    def __init__(
+            self,
+            db: DbApi,
+            sink: NotionSink,
+            repeat_rule: RepeatRule = repeat_every(DEFAULT_REPEAT_INTERVAL),
+            window: datetime.timedelta = datetime.timedelta(minutes=1),
+            refresh_interval: datetime.timedelta = datetime.timedelta(seconds=30),
+            batch_size: int = 1000,
+            poll_interval: float = 1.0,
+            clock: Callable[[], datetime.datetime] = datetime.datetime.utcnow
+    ):
+        self._db = db
+        self._sink = sink
+        self._repeat_rule = repeat_rule
+        self._window = window
+        self._refresh_interval = refresh_interval
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._clock = clock
+
+        self._heap: list[tuple[datetime.datetime, int, NotionModel]] = []
+        self._queued: set[int] = set()
+        self._loaded_until: datetime.datetime | None = None
+        self._refreshed_at: datetime.datetime | None = None
+        self._stop_event = asyncio.Event()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, notion: NotionModel) -> None:
+        """Push freshly written notion to the heap if it is due inside the loaded window,
+        later notions will be loaded by refill"""
+        if notion.next_notion_time is None or notion.id in self._queued:
+            return
+        if self._loaded_until is None or notion.next_notion_time > self._loaded_until:
+            return
+        heapq.heappush(self._heap, (notion.next_notion_time, notion.id, notion))
+        self._queued.add(notion.id)
+
+    def _needs_refill(self, now: datetime.datetime) -> bool:
+        if self._loaded_until is None or now >= self._loaded_until:
+            return True
+        return now - self._refreshed_at >= self._refresh_interval
+
+    async def _refill(self, now: datetime.datetime) -> None:
+        """Load notions due before the end of the next window, earliest first.
+        If the batch is full the window is cut at the last loaded notion time"""
+        until = now + self._window
+        notions = await self._db.get_notions_due_before(until, self._batch_size)
+        self._loaded_until = until
+        if len(notions) == self._batch_size:
+            self._loaded_until = notions[-1].next_notion_time
+        self._refreshed_at = now
+        for notion in notions:
+            self.schedule(notion)
+        logger.debug("Scheduler window refilled until %s, pending: %s", self._loaded_until, len(self._heap))
+
+    async def _fire(self, notion: NotionModel) -> bool:
+        try:
+            await self._sink(notion)
+        except Exception as err:
+            logger.error("Sink failed for notion with id: %s: %r", notion.id, err)
+            return False
+        return True
+
+    async def tick(self) -> int:
+        """Fire all due notions and reschedule them, return number of fired notions.
+        Notions whose sink call failed are left untouched in db and retried on next refill"""
+        now = self._clock()
+        if self._needs_refill(now):
+            await self._refill(now)
+
+        due = list()
+        while self._heap and self._heap[0][0] <= now:
+            _, notion_id, notion = heapq.heappop(self._heap)
+            self._queued.discard(notion_id)
+            due.append(notion)
+        if not due:
+            return 0
+
+        results = await asyncio.gather(*(self._fire(notion) for notion in due))
+        fired = [notion for notion, is_fired in zip(due, results) if is_fired]
+        schedule = {notion.id: self._repeat_rule(notion, now) for notion in fired}
+        modified_count = await self._db.set_notions_next_time(
+            schedule, {notion.id: notion.next_notion_time for notion in fired}
+        )
+
+        if modified_count == len(schedule):
+            for notion in fired:
+                if schedule[notion.id] is not None:
+                    self.schedule(notion.copy(update={"next_notion_time": schedule[notion.id]}))
+        elif fired:
+            # Some notions were rescheduled or deleted meanwhile, their db state wins
+            for notion in await self._db.get_notions_by_ids(list(schedule)):
+                self.schedule(notion)
+        logger.info("Scheduler fired %s of %s due notions", len(fired), len(due))
+        return len(fired)
+
+    def _sleep_time(self) -> float:
+        if not self._heap:
+            return self._poll_interval
+        until_next = (self._heap[0][0] - self._clock()).total_seconds()
+        return min(max(until_next, 0), self._poll_interval)
+
+    async def run(self) -> None:
+        """Tick until stop() is called"""
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            try:
+                await self.tick()
+            except Exception as err:
+                logger.error("Scheduler tick failed: %r", err)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self._sleep_time())
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,65 @@
+from typing import Literal
+
+from pydantic import BaseSettings, conint, validator
+
+from main.utils.DbApi.ring import DEFAULT_VNODES
+
+
+class MongoSettings(BaseSettings):
+    """Db connection settings, read from MONGO_* environment variables (e.g. MONGO_MAX_POOL_SIZE=50).
+    backend=memory runs the app on in-memory db, for local development without Mongo"""
+    backend: Literal["mongo", "memory"] = "mongo"
+    connection_string: str = "mongodb://localhost:27017"
+    is_test: bool = False
+    strict_reads: bool = False
+    ensure_indexes: bool = True
+
+    # Pool is per client, i.e. per uvicorn worker
+    max_pool_size: conint(ge=1) = 100
+    min_pool_size: conint(ge=0) = 10
+    max_idle_time_ms: conint(ge=0) | None = None
+    warmup_connections: conint(ge=0) = 10
+
+    connect_timeout_ms: conint(ge=0) = 5_000
+    server_selection_timeout_ms: conint(ge=0) = 5_000
+    socket_timeout_ms: conint(ge=0) | None = None
+    wait_queue_timeout_ms: conint(ge=0) | None = None
+
+    read_preference: Literal["primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"] = "primary"
+
+    # Users spread over shards by consistent hashing: shard name -> connection string,
+    # e.g. MONGO_SHARDS='{"a": "mongodb://a:27017", "b": "mongodb://b:27017"}'. The first shard reserves ids.
+    # Pool options apply per shard, placements pin users moved off their ring shard
+    shards: dict[str, str] = {}
+    shard_vnodes: conint(ge=1) = DEFAULT_VNODES
+    shard_placements: dict[int, str] = {}
+
+    @validator("min_pool_size")
+    def min_pool_size_not_above_max(cls, value: int, values: dict) -> int:
+        if "max_pool_size" in values and value > values["max_pool_size"]:
+            raise ValueError(f"min_pool_size {value} is above max_pool_size {values['max_pool_size']}")
+        return value
+
+    @validator("shard_placements")
+    def placements_on_known_shards(cls, value: dict[int, str], values: dict) -> dict[int, str]:
+        unknown = set(value.values()) - set(values.get("shards", {}))
+        if unknown:
+            raise ValueError(f"Users placed on unknown shards: {sorted(unknown)}")
+        return value
+
+    class Config:
+        env_prefix = "MONGO_"
+
+    def client_options(self) -> dict:
+        """Options for AsyncIOMotorClient, unset ones are left to driver defaults"""
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "readPreference": self.read_preference,
+        }
+        return {key: value for key, value in options.items() if value is not None}
@@ -0,0 +1,159 @@
+"""Upcoming occurrences of user notions in a time window, e.g. "what's coming up this week".
+
+Notions are read page by page in next_notion_time order, repeatable notions are expanded
+by the scheduler repeat rule into one occurrence per repeat inside the window. Occurrences are
+produced lazily by merging notion streams on a heap keyed by (time, notion id), so the heap holds
+one pending occurrence per notion read so far, never the whole expansion.
+
+A page cursor is the merge state after the page: the keyset position of the notion scan and
+the pending (time, notion id) of every notion read. The next page reloads pending notions by ids
+and goes on from there, so no page replays the pages before it. Cursor grows with pending notions,
+i.e. with repeatable notions scheduled before the page end
+"""
+import base64
+import binascii
+import datetime
+import heapq
+from collections import deque
+from typing import AsyncIterator, Iterator
+
+import orjson
+
+from main.models.db_models import Occurrence, OccurrencePage
+from main.models.notion_models import NotionModel
+from main.utils.DbApi.MongoAPI import DbApi
+from main.utils.DbApi.window import check_window_args, encode_cursor
+from main.utils.scheduler import DEFAULT_REPEAT_INTERVAL, RepeatRule, repeat_every
+
+DEFAULT_WINDOW = datetime.timedelta(days=7)
+
+
+def occurrence_times(notion: NotionModel, end: datetime.datetime, repeat_rule: RepeatRule,
+                     first: datetime.datetime | None = None) -> Iterator[datetime.datetime]:
+    """Times notion fires at before end: first (default: its next_notion_time) and,
+    for repeatable one, every repeat after it"""
+    time = first if first is not None else notion.next_notion_time
+    while time is not None and time < end:
+        yield time
+        if not notion.is_repeatable:
+            return
+        next_time = repeat_rule(notion.copy(update={"next_notion_time": time}), time)
+        # A rule not moving forward would repeat forever
+        if next_time is None or next_time <= time:
+            return
+        time = next_time
+
+
+def encode_expansion_cursor(scan_cursor: str | None, pending: list[tuple[datetime.datetime, int]]) -> str:
+    raw = orjson.dumps({"scan": scan_cursor, "pending": [[time, notion_id] for time, notion_id in pending]})
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_expansion_cursor(cursor: str) -> tuple[str | None, list[tuple[datetime.datetime, int]]]:
+    """Scan cursor and pending (time, notion id) of cursor, raise ValueError if it is not a cursor token"""
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        pending = [(datetime.datetime.fromisoformat(time), int(notion_id)) for time, notion_id in state["pending"]]
+        scan_cursor = state["scan"]
+        if scan_cursor is not None and not isinstance(scan_cursor, str):
+            raise ValueError(f"Malformed scan cursor: {scan_cursor}")
+        return scan_cursor, pending
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError(f"Malformed cursor: {cursor}") from None
+
+
+class _Expansion:
+    """Merge state of occurrences: notions are read by keyset pages after scan_cursor (position of the last
+    notion taken), pending holds the next occurrence of every notion taken"""
+
+    def __init__(self, db: DbApi, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                 repeat_rule: RepeatRule, batch_size: int, scan_cursor: str | None = None):
+        self._db = db
+        self._user_id = user_id
+        self._start = start
+        self._end = end
+        self._repeat_rule = repeat_rule
+        self._batch_size = batch_size
+        self.scan_cursor = scan_cursor
+        self._page_cursor = scan_cursor
+        self._scan_done = False
+        self._notions: deque[NotionModel] = deque()
+        self._pending: list[tuple[datetime.datetime, int, NotionModel, Iterator[datetime.datetime]]] = list()
+
+    def push(self, notion: NotionModel, first: datetime.datetime | None = None) -> None:
+        self._push(notion, occurrence_times(notion, self._end, self._repeat_rule, first))
+
+    def _push(self, notion: NotionModel, times: Iterator[datetime.datetime]) -> None:
+        time = next(times, None)
+        if time is not None:
+            heapq.heappush(self._pending, (time, notion.id, notion, times))
+
+    @property
+    def pending(self) -> list[tuple[datetime.datetime, int]]:
+        return [(time, notion_id) for time, notion_id, _, _ in self._pending]
+
+    async def _peek_notion(self) -> NotionModel | None:
+        if not self._notions and not self._scan_done:
+            page = await self._db.get_notions_in_window(
+                self._user_id, self._start, self._end, self._batch_size, self._page_cursor
+            )
+            self._notions.extend(page.notions)
+            self._page_cursor = page.next_cursor
+            self._scan_done = page.next_cursor is None
+        return self._notions[0] if self._notions else None
+
+    async def next(self) -> Occurrence | None:
+        """The earliest occurrence not produced yet. It is produced once no notion read later can have
+        an earlier one: notions come in next_notion_time order and every occurrence of a notion is at
+        or after its next_notion_time"""
+        while True:
+            notion = await self._peek_notion()
+            if notion is None or (self._pending and self._pending[0][:2] < (notion.next_notion_time, notion.id)):
+                break
+            self._notions.popleft()
+            self.scan_cursor = encode_cursor(notion.next_notion_time, notion.id)
+            self.push(notion)
+        if not self._pending:
+            return None
+        time, _, notion, times = heapq.heappop(self._pending)
+        self._push(notion, times)
+        return Occurrence.construct(time=time, notion=notion)
+
+    async def has_next(self) -> bool:
+        # Every notion scheduled in window has an occurrence in it
+        return bool(self._pending) or await self._peek_notion() is not None
+
+
+async def iter_occurrences(db: DbApi, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                           repeat_rule: RepeatRule = repeat_every(DEFAULT_REPEAT_INTERVAL),
+                           batch_size: int = 100) -> AsyncIterator[Occurrence]:
+    """Occurrences of user notions in [start, end) ordered by (time, notion id).
+    Notions due before start are not included, they are fired by the scheduler and moved forward"""
+    check_window_args(start, end, batch_size)
+    expansion = _Expansion(db, user_id, start, end, repeat_rule, batch_size)
+    while (occurrence := await expansion.next()) is not None:
+        yield occurrence
+
+
+async def get_upcoming(db: DbApi, user_id: int, start: datetime.datetime, end: datetime.datetime,
+                       limit: int = 100, cursor: str | None = None,
+                       repeat_rule: RepeatRule = repeat_every(DEFAULT_REPEAT_INTERVAL)) -> OccurrencePage:
+    """Page of iter_occurrences after cursor (next_cursor of the previous page).
+    The page resumes the merge state kept in cursor: pending notions are reloaded by ids, deleted ones
+    are skipped, changed ones go on with their current repeat settings.
+    raise ValueError on malformed cursor"""
+    check_window_args(start, end, limit)
+    scan_cursor, pending = decode_expansion_cursor(cursor) if cursor is not None else (None, [])
+    expansion = _Expansion(db, user_id, start, end, repeat_rule, min(limit + 1, 1000), scan_cursor)
+    if pending:
+        notions = {notion.id: notion for notion in await db.get_notions_by_ids([notion_id for _, notion_id in pending])}
+        for time, notion_id in pending:
+            if notion_id in notions and notions[notion_id].user_id == user_id:
+                expansion.push(notions[notion_id], time)
+
+    page = OccurrencePage()
+    while len(page.occurrences) < limit and (occurrence := await expansion.next()) is not None:
+        page.occurrences.append(occurrence)
+    if len(page.occurrences) == limit and await expansion.has_next():
+        page.next_cursor = encode_expansion_cursor(expansion.scan_cursor, expansion.pending)
+    return page